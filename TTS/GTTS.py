@@ -6,6 +6,7 @@ from utils import settings
 class GTTS:
     def __init__(self):
         self.max_chars = 5000
+        self.max_concurrency = 2  # requests sent at the same time
         self.voices = []
         self.tts_script = r"C:\Users\Home Server\Desktop\TTS\tts_handler.py"
 
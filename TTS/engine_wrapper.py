@@ -1,31 +1,46 @@
+import contextvars
 import os
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
-import numpy as np
 import translators
-from moviepy.audio.AudioClip import AudioClip
-from moviepy.audio.fx.volumex import volumex
-from moviepy.editor import AudioFileClip
-from rich.progress import track
 
-from utils import settings
+from utils import settings, tts_cache
+from utils.audio_duration import get_duration
 from utils.console import print_step, print_substep
-from utils.voice import sanitize_text
+from utils.narration import write_manifest
+from utils.progress import track
+from utils.voice import sanitize_text, wait_for_ratelimit
+from utils.workdir import temp_root
 
 DEFAULT_MAX_LENGTH: int = (
     70  # Video length variable, edit this on your own risk. It should work, but it's not supported
 )
 
 
+# Provider instances are shared between runs, so their concurrency limit is as well
+_provider_slots: Dict[type, threading.BoundedSemaphore] = {}
+_provider_slots_lock = threading.Lock()
+
+
+def provider_slots(tts_module, concurrency: int) -> threading.BoundedSemaphore:
+    """Returns the semaphore that limits the requests sent to the provider of tts_module at once."""
+    with _provider_slots_lock:
+        if type(tts_module) not in _provider_slots:
+            _provider_slots[type(tts_module)] = threading.BoundedSemaphore(concurrency)
+        return _provider_slots[type(tts_module)]
+
+
 class TTSEngine:
     """Calls the given TTS engine to reduce code duplication and allow multiple TTS engines.
 
     Args:
-        tts_module            : The TTS module. Your module should handle the TTS itself and saving to the given path under the run method.
+        tts_module            : The TTS module (class or instance). Your module should handle the TTS itself and saving to the given path under the run method.
         reddit_object         : The reddit object that contains the posts to read.
-        path (Optional)       : The unix style path to save the mp3 files to. This must not have leading or trailing slashes.
+        path (Optional)       : The unix style path to save the mp3 files to. This must have a trailing slash. Defaults to the temp folder of the run.
         max_length (Optional) : The maximum length of the mp3 files in total.
 
     Notes:
@@ -36,19 +51,25 @@ class TTSEngine:
         self,
         tts_module,
         reddit_object: dict,
-        path: str = "assets/temp/",
+        path: str = None,
         max_length: int = DEFAULT_MAX_LENGTH,
         last_clip_length: int = 0,
     ):
-        self.tts_module = tts_module()
+        # An instance can be passed in to reuse a provider that already loaded its models
+        self.tts_module = tts_module() if isinstance(tts_module, type) else tts_module
         self.reddit_object = reddit_object
 
         self.redditid = re.sub(r"[^\w\s-]", "", reddit_object["thread_id"])
-        self.path = path + self.redditid + "/mp3"
+        self.path = (path or f"{temp_root()}/") + self.redditid + "/mp3"
         self.max_length = max_length
         self.length = 0
         self.last_clip_length = last_clip_length
 
+        # Clips are synthesized in parallel, up to the limit of the provider
+        concurrency = int(settings.config["settings"]["tts"].get("max_concurrency", 0) or 0)
+        self.concurrency = max(1, concurrency or getattr(self.tts_module, "max_concurrency", 1))
+        self.slots = provider_slots(self.tts_module, self.concurrency)
+
     def add_periods(
         self,
     ):  # adds periods to the end of paragraphs (where people often forget to put them) so tts doesn't blend sentences
@@ -71,41 +92,93 @@ class TTSEngine:
         print_step("Saving Text to MP3 files...")
 
         self.add_periods()
-        self.call_tts("title", process_text(self.reddit_object["thread_title"]))
+        self.add_durations([self.call_tts("title", process_text(self.reddit_object["thread_title"]))])
         # processed_text = ##self.reddit_object["thread_post"] != ""
         idx = 0
 
         if settings.config["settings"]["storymode"]:
             if settings.config["settings"]["storymodemethod"] == 0:
                 if len(self.reddit_object["thread_post"]) > self.tts_module.max_chars:
-                    self.split_post(self.reddit_object["thread_post"], "postaudio")
+                    self.add_durations(self.split_post(self.reddit_object["thread_post"], "postaudio"))
                 else:
-                    self.call_tts("postaudio", process_text(self.reddit_object["thread_post"]))
+                    self.add_durations(
+                        [self.call_tts("postaudio", process_text(self.reddit_object["thread_post"]))]
+                    )
             elif settings.config["settings"]["storymodemethod"] == 1:
-                for idx, text in track(enumerate(self.reddit_object["thread_post"])):
-                    self.call_tts(f"postaudio-{idx}", process_text(text))
+                clips = [
+                    (f"postaudio-{idx}", process_text(text))
+                    for idx, text in enumerate(self.reddit_object["thread_post"])
+                ]
+                for durations in track(self.map_tts(clips), "Saving..."):
+                    self.add_durations(durations)
+                idx = max(len(clips) - 1, 0)
 
         else:
-            for idx, comment in track(enumerate(self.reddit_object["comments"]), "Saving..."):
+            idx = self.save_comments()
+
+        print_substep("Saved Text to MP3 files successfully.", style="bold green")
+        return self.length, idx
+
+    def save_comments(self) -> int:
+        """Synthesizes the comments in parallel until the max length is reached.
+
+        The cutoff is decided on the finished clips in comment order, exactly like reading
+        them one by one would. New comments are only scheduled while the length so far is
+        below the max length, so at most concurrency - 1 clips are synthesized for nothing.
+
+        Returns:
+            int: The index of the comment the length check stopped at
+        """
+        comments = self.reddit_object["comments"]
+        pending = {}
+        scheduled = 0
+        idx = 0
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            for idx in track(range(len(comments)), "Saving..."):
                 # ! Stop creating mp3 files if the length is greater than max length.
                 if self.length > self.max_length and idx > 1:
                     self.length -= self.last_clip_length
                     idx -= 1
                     break
-                if (
-                    len(comment["comment_body"]) > self.tts_module.max_chars
-                ):  # Split the comment if it is too long
-                    self.split_post(comment["comment_body"], idx)  # Split the comment
-                else:  # If the comment is not too long, just call the tts engine
-                    self.call_tts(f"{idx}", process_text(comment["comment_body"]))
+                while scheduled < len(comments) and scheduled < idx + self.concurrency:
+                    pending[scheduled] = pool.submit(
+                        contextvars.copy_context().run,
+                        self.save_comment,
+                        scheduled,
+                        comments[scheduled]["comment_body"],
+                    )
+                    scheduled += 1
+                self.add_durations(pending.pop(idx).result())
+            for future in pending.values():
+                future.cancel()
+        return idx
 
-        print_substep("Saved Text to MP3 files successfully.", style="bold green")
-        return self.length, idx
+    def save_comment(self, idx: int, text: str) -> List[Optional[float]]:
+        if len(text) > self.tts_module.max_chars:  # Split the comment if it is too long
+            return self.split_post(text, idx)
+        # If the comment is not too long, just call the tts engine
+        return [self.call_tts(f"{idx}", process_text(text))]
 
-   
-    def split_post(self, text: str, idx):
-        split_files = []
-        
+    def add_durations(self, durations: List[Optional[float]]) -> None:
+        """Adds the durations of finished clips to the total length, None marks a clip that couldn't be read."""
+        for duration in durations:
+            if duration is None:
+                self.length = 0
+                continue
+            self.last_clip_length = duration
+            self.length += duration
+
+    def map_tts(self, clips: List[Tuple[str, str]]) -> Iterator[List[Optional[float]]]:
+        """Synthesizes (filename, text) clips in parallel and yields their durations in order."""
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            futures = [
+                pool.submit(contextvars.copy_context().run, self.call_tts, filename, text)
+                for filename, text in clips
+            ]
+            for future in futures:
+                yield [future.result()]
+
+    def split_post(self, text: str, idx) -> List[Optional[float]]:
         # Split text into smaller chunks
         split_text = []
         current_chunk = ""
@@ -143,70 +216,76 @@ class TTSEngine:
 
         print(f"Total chunks: {len(split_text)}")
 
-        self.create_silence_mp3()
-
-        idy = None
+        parts = []
         for idy, text_cut in enumerate(split_text):
             newtext = process_text(text_cut)
             
             if not newtext or newtext.isspace():
                 print(f"Chunk {idy} was blank after processing")
                 continue
-            else:
-                print(f"Processing chunk {idy}: '{newtext}' (length: {len(newtext)})")
-                self.call_tts(f"{idx}-{idy}.part", newtext)
-                with open(f"{self.path}/list.txt", "a") as f:
-                    f.write(f"file '{idx}-{idy}.part.mp3'\n")
-                    f.write("file 'silence.mp3'\n")
-                split_files.append(str(f"{self.path}/{idx}-{idy}.part.mp3"))
-
-        # Combine all parts into a single MP3
-        os.system(
-            f"ffmpeg -f concat -y -hide_banner -loglevel panic -safe 0 "
-            f"-i {self.path}/list.txt "
-            f"-c copy {self.path}/{idx}.mp3"
-        )
+            print(f"Processing chunk {idy}: '{newtext}' (length: {len(newtext)})")
+            parts.append((f"{idx}-{idy}.part", newtext))
 
-        # Clean up temporary files
-        try:
-            for file in split_files:
-                os.unlink(file)
-            os.unlink(f"{self.path}/list.txt")
-        except FileNotFoundError as e:
-            print(f"File not found: {e.filename}")
-        except OSError as e:
-            print(f"OSError: {e}")
+        durations = []
+        for durations_of_part in self.map_tts(parts):
+            durations += durations_of_part
 
-        print(f"Finished processing {len(split_files)} audio chunks")
+        # The parts aren't concatenated here, the final render reads them from the manifest
+        # and puts the silence between them, see utils/narration.py
+        silence = float(settings.config["settings"]["tts"]["silence_duration"])
+        write_manifest(
+            f"{self.path}/{idx}.mp3",
+            [
+                f"{self.path}/{filename}.mp3"
+                for (filename, _), duration in zip(parts, durations)
+                if duration is not None
+            ],
+            silence,
+        )
 
+        print(f"Finished processing {len(parts)} audio chunks")
+        return [duration + silence if duration is not None else None for duration in durations]
 
-    def call_tts(self, filename: str, text: str):
-        self.tts_module.run(
+    def call_tts(self, filename: str, text: str) -> Optional[float]:
+        """Synthesizes text to <filename>.mp3 and returns its duration, or None if it can't be read."""
+        filepath = f"{self.path}/{filename}.mp3"
+        key = tts_cache.cache_key(
+            type(self.tts_module).__name__,
+            self.voice_settings(),
             text,
-            filepath=f"{self.path}/{filename}.mp3",
-            random_voice=settings.config["settings"]["tts"]["random_voice"],
+            getattr(self.tts_module, "pitch_factor", None),
         )
-        # try:
-        #     self.length += MP3(f"{self.path}/{filename}.mp3").info.length
-        # except (MutagenError, HeaderNotFoundError):
-        #     self.length += sox.file_info.duration(f"{self.path}/{filename}.mp3")
+        if tts_cache.get(key, filepath):
+            print_substep(f"Reusing cached audio for {filename}")
+        else:
+            if os.path.lexists(filepath):
+                # May be a link to a cached clip from an earlier attempt, don't write into it
+                os.remove(filepath)
+            with self.slots:
+                wait_for_ratelimit()
+                self.tts_module.run(
+                    text,
+                    filepath=filepath,
+                    random_voice=settings.config["settings"]["tts"]["random_voice"],
+                )
+            tts_cache.put(key, filepath)
         try:
-            clip = AudioFileClip(f"{self.path}/{filename}.mp3")
-            self.last_clip_length = clip.duration
-            self.length += clip.duration
-            clip.close()
-        except:
-            self.length = 0
-
-    def create_silence_mp3(self):
-        silence_duration = settings.config["settings"]["tts"]["silence_duration"]
-        silence = AudioClip(
-            make_frame=lambda t: np.sin(440 * 2 * np.pi * t),
-            duration=silence_duration,
-            fps=44100,
-        )
-        silence = volumex(silence, 0)
-        silence.write_audiofile(f"{self.path}/silence.mp3", fps=44100, verbose=False, logger=None)
+            return get_duration(filepath)
+        except Exception:
+            return None
+
+    def voice_settings(self):
+        """Everything in the config that picks the voice, part of the TTS cache key."""
+        tts_settings = settings.config["settings"]["tts"]
+        if tts_settings["random_voice"]:
+            # Cached clips keep the voice that was drawn when they were first synthesized
+            return "random"
+        voices = {
+            name: value
+            for name, value in tts_settings.items()
+            if "voice" in name and name != "random_voice"
+        }
+        return [voices, getattr(self.tts_module, "default_voice", None)]
 
 
 def process_text(text: str, clean: bool = True):
@@ -29,6 +29,7 @@ class pyttsx:
     def __init__(self, base_url="http://10.20.0.2:8080"):
         self.base_url = base_url
         self.max_chars = 5000
+        self.max_concurrency = 4  # requests sent at the same time
         self.pitch_factor = 0.85  # Fixed 10% pitch reduction
         
         # Default voice settings
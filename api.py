@@ -1,18 +1,22 @@
-from flask import Flask, send_file, jsonify
+from flask import Flask, Response, send_file, jsonify, request
 import subprocess
 import os
 import shutil
-from pathlib import Path
-import toml
 import threading
-import uuid
 import time
-import glob
 import logging
-import re
+import toml
 
 # Import Intel GPU initialization
-from utils.intel_gpu_init import initialize_intel_arc_gpu, check_ffmpeg_hardware_support
+from utils.intel_gpu_init import initialize_intel_arc_gpu
+from utils.encoder_probe import probe_encoders, probe_result
+from utils.background_index import build_index
+from utils.background_prefetch import get_prefetcher
+from utils.background_renditions import PREPARE_RENDITIONS_ENV
+from utils.jobs import JobQueue, QUEUED, RUNNING, DONE, FAILED, POST_ID_ENV, validate_params
+from utils import metrics
+from utils.progress import parse_progress
+from utils.workdir import TEMP_ROOT_ENV, OUTPUT_PATH_ENV
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -20,50 +24,57 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Global lock to prevent concurrent video generation
-generation_lock = threading.Lock()
-generation_in_progress = False
-
 TEMP_DIR = "/app/assets/temp"
 RESULTS_DIR = "/app/results"
+JOBS_DIR = "/app/assets/jobs"
+JOB_RESULTS_DIR = os.path.join(RESULTS_DIR, "jobs")
 CONFIG_PATH = "/app/config.toml"
-VIDEO_TIMEOUT = 1200  # 20 minute timeout
+# 20 minute timeout. A main.py process is killed when it runs over, an in-process run fails
+# at the start of the next stage, since a thread can't be stopped while a stage hangs.
+VIDEO_TIMEOUT = 1200
+JOB_RETENTION = int(os.environ.get("JOB_RETENTION", 24 * 60 * 60))  # keep finished jobs for a day
+VIDEO_WORKERS = max(1, int(os.environ.get("VIDEO_WORKERS", 2)))  # videos rendered at the same time
+# "inprocess" reuses one warm Pipeline, "process" runs main.py in a fresh interpreter per video
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "inprocess").lower()
+# Backgrounds downloaded on startup: "all", "none" or names like "video:minecraft,audio:lofi"
+BACKGROUND_PREFETCH = os.environ.get("BACKGROUND_PREFETCH", "all").strip()
 
-def clean_temp():
-    """Clean temporary directory"""
-    if os.path.exists(TEMP_DIR):
+# Both are built on startup, not on import. The render pool spawns its workers from this
+# module, and importing it there must not touch the job files of the running server.
+job_queue = None
+pipeline = None  # only when running in-process
+
+def job_temp_dir(job_id):
+    """Working directory of a single job inside the temp directory"""
+    return os.path.join(TEMP_DIR, job_id)
+
+def clean_temp(job_id):
+    """Clean the temporary directory of a job"""
+    temp_dir = job_temp_dir(job_id)
+    if os.path.exists(temp_dir):
         try:
-            logger.debug(f"Cleaning temp directory: {TEMP_DIR}")
-            shutil.rmtree(TEMP_DIR)
-            os.makedirs(TEMP_DIR)
-            logger.debug("Temp directory cleaned and recreated")
+            logger.debug(f"Cleaning temp directory: {temp_dir}")
+            shutil.rmtree(temp_dir)
+            logger.debug("Temp directory cleaned")
         except Exception as e:
             logger.error(f"Error cleaning temp directory: {str(e)}")
             raise
 
-def get_subreddit_path():
-    """Get subreddit path from config"""
-    try:
-        logger.debug("Reading config file")
-        if not os.path.exists(CONFIG_PATH):
-            raise FileNotFoundError(f"Config file not found at {CONFIG_PATH}")
-        
-        with open(CONFIG_PATH, 'r') as f:
-            config = toml.load(f)
-        
-        subreddits = config.get('reddit', {}).get('thread', {}).get('subreddit')
-        if not subreddits:
-            raise ValueError("No subreddits found in config file")
-            
-        logger.debug(f"Found subreddits: {subreddits}")
-        return subreddits
-    except Exception as e:
-        logger.error(f"Error reading config: {str(e)}")
-        raise
+def run_video_generator(temp_root, output_path, post_id=None, on_progress=None, log_prefix=""):
+    """Run the main.py script with real-time logging and a 20-minute timeout
 
-def run_video_generator():
-    """Run the main.py script with real-time logging and a 20-minute timeout"""
+    The run keeps its files in temp_root and writes the video to output_path, so several
+    generators can run side by side. Progress lines written by utils.progress are passed
+    to on_progress instead of the log.
+    """
     logger.debug("Starting video generator")
+    env = dict(os.environ)
+    env[TEMP_ROOT_ENV] = temp_root
+    env[OUTPUT_PATH_ENV] = output_path
+    env[metrics.REPORT_METRICS_ENV] = "1"
+    env[PREPARE_RENDITIONS_ENV] = "0"  # the prefetcher of the API prepares them
+    if post_id:
+        env[POST_ID_ENV] = post_id
     try:
         # Use Popen to enable real-time logging
         process = subprocess.Popen(
@@ -71,13 +82,23 @@ def run_video_generator():
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             universal_newlines=True,
-            bufsize=1  # Line buffered
+            bufsize=1,  # Line buffered
+            env=env
         )
         
         # Function to log output in real-time
         def log_output(pipe, log_func):
             for line in iter(pipe.readline, ''):
-                log_func(line.rstrip())
+                progress = parse_progress(line.rstrip())
+                if progress is not None:
+                    if on_progress:
+                        on_progress(progress)
+                    continue
+                event = metrics.parse_metric(line.rstrip())
+                if event is not None:
+                    metrics.record(event)
+                    continue
+                log_func(log_prefix + line.rstrip())
             pipe.close()
         
         # Create threads to read stdout and stderr
@@ -119,104 +140,153 @@ def run_video_generator():
         logger.error(f"Error in video generation: {str(e)}")
         raise
 
-def find_latest_video():
-    """Find the most recently created video file in the results folder"""
+def run_job(job):
+    """Generate the video for a queued job and record where it ended up"""
+    job_id = job["id"]
+    params = job.get("params") or {}
+    logger.info(f"Starting job {job_id}")
+    result_path = os.path.join(JOB_RESULTS_DIR, f"{job_id}.mp4")
     try:
-        subreddits = get_subreddit_path()
-        combined_path = os.path.join(RESULTS_DIR, subreddits)
-        logger.debug(f"Looking for videos in combined path: {combined_path}")
-        
-        if not os.path.exists(combined_path):
-            logger.error(f"Results directory not found: {combined_path}")
-            return None
-            
-        logger.debug(f"Contents of combined path: {os.listdir(combined_path)}")
-        video_files = [f for f in os.listdir(combined_path) 
-                      if f.endswith('.mp4') and f != 'background.mp4']
-        
-        if not video_files:
-            logger.debug("No video files found")
-            return None
-            
-        latest_video = max(
-            video_files,
-            key=lambda x: os.path.getmtime(os.path.join(combined_path, x))
+        clean_temp(job_id)
+        os.makedirs(job_temp_dir(job_id))
+        os.makedirs(JOB_RESULTS_DIR, exist_ok=True)
+        on_progress = lambda progress: job_queue.update(job_id, **progress)
+        if pipeline is not None:
+            pipeline.run(
+                post_id=params.get("post_id"),
+                temp_root=job_temp_dir(job_id),
+                output_path=result_path,
+                on_progress=on_progress,
+                timeout=VIDEO_TIMEOUT
+            )
+        else:
+            run_video_generator(
+                job_temp_dir(job_id),
+                result_path,
+                post_id=params.get("post_id"),
+                on_progress=on_progress,
+                log_prefix=f"[{job_id[:8]}] "
+            )
+
+        if not os.path.exists(result_path):
+            raise FileNotFoundError("No video file found after generation")
+
+        job_queue.update(
+            job_id,
+            status=DONE,
+            stage="done",
+            progress=100,
+            result_path=result_path,
         )
-        full_path = os.path.join(combined_path, latest_video)
-        logger.debug(f"Found latest video: {full_path}")
-        return full_path
+        logger.info(f"Job {job_id} finished: {result_path} ({os.path.getsize(result_path)} bytes)")
     except Exception as e:
-        logger.error(f"Error finding latest video: {str(e)}")
+        logger.error(f"Job {job_id} failed: {str(e)}", exc_info=True)
+        job_queue.update(job_id, status=FAILED, error=str(e))
+    finally:
+        try:
+            clean_temp(job_id)
+        except Exception as e:
+            logger.warning(f"Cleanup error (non-fatal): {str(e)}")
+
+
+def background_selection(spec):
+    """Backgrounds to prefetch from a BACKGROUND_PREFETCH value, None for all of them"""
+    if spec.lower() == "all":
+        return None
+    names = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, name = item.partition(":")
+        names.setdefault(kind.strip(), []).append(name.strip())
+    return names
+
+def rendition_size():
+    """Size of the videos in the config, the backgrounds are prepared at it. None if renditions are off"""
+    try:
+        with open(CONFIG_PATH, 'r') as f:
+            config = toml.load(f)
+        if not config["settings"].get("background", {}).get("background_renditions", True):
+            return None
+        return int(config["settings"]["resolution_w"]), int(config["settings"]["resolution_h"])
+    except (OSError, KeyError, ValueError, toml.TomlDecodeError) as e:
+        logger.warning(f"Not preparing background renditions, couldn't read the video size: {str(e)}")
         return None
 
+def job_worker():
+    """Take jobs off the queue one at a time, forever. Several workers share the queue."""
+    while True:
+        job = job_queue.next(timeout=60)
+        if job is not None:
+            run_job(job)
+        pruned = job_queue.prune(JOB_RETENTION)
+        if pruned:
+            logger.debug(f"Pruned {pruned} expired jobs")
+
+
+def job_response(job):
+    """Public view of a job"""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+        "queue_position": job_queue.position(job["id"]),
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "error": job["error"],
+        "status_url": f"/jobs/{job['id']}",
+        "result_url": f"/jobs/{job['id']}/result",
+    }
+
+
 @app.route('/generate', methods=['POST'])
 def generate_video():
-    global generation_in_progress
-    
-    # Check if generation is already in progress
-    with generation_lock:
-        if generation_in_progress:
-            logger.warning("Video generation already in progress, rejecting request")
-            return jsonify({"error": "Video generation already in progress. Please wait."}), 429
-        generation_in_progress = True
-    
+    """Queue a new video and return its job ID right away, e.g. {"post_id": "abc123"}"""
     try:
-        logger.debug("Starting video generation process")
-        clean_temp()
-        run_id = str(uuid.uuid4())
-        
-        thread = threading.Thread(target=run_video_generator)
-        thread.start()
-        thread.join()
-        
-        # Allow some time for file system operations to complete
-        time.sleep(2)
-        video_path = find_latest_video()
-        
-        if not video_path:
-            logger.error("No video file found after generation")
-            return jsonify({"error": "No video file found after generation"}), 500
-            
-        if not os.path.exists(video_path):
-            logger.error(f"Video file not found at path: {video_path}")
-            return jsonify({"error": "Video file not found"}), 500
-            
-        try:
-            # Get file info for logging
-            file_size = os.path.getsize(video_path)
-            file_name = os.path.basename(video_path)
-            logger.info(f"Sending video file: {file_name} ({file_size} bytes)")
-            
-            response = send_file(
-                video_path,
-                mimetype='video/mp4',
-                as_attachment=True,
-                download_name=file_name
-            )
-            
-            logger.info(f"Video file sent successfully: HTTP 200 with {file_name}")
-            
-            # Clean up after successful send
-            try:
-                os.remove(video_path)
-                clean_temp()
-                logger.debug("Cleanup completed successfully")
-            except Exception as e:
-                logger.warning(f"Cleanup error (non-fatal): {str(e)}")
-            
-            return response
-            
-        except Exception as e:
-            logger.error(f"Error sending video: {str(e)}", exc_info=True)
-            return jsonify({"error": f"Error sending video: {str(e)}"}), 500
-        
+        params = validate_params(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        job = job_queue.submit(params)
+        logger.info(f"Queued job {job['id']}")
+        return jsonify(job_response(job)), 202
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 500
-    finally:
-        # Always reset the generation flag
-        with generation_lock:
-            generation_in_progress = False
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    jobs = sorted(job_queue.list(), key=lambda job: job["created_at"])
+    return jsonify([job_response(job) for job in jobs]), 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_response(job)), 200
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] == FAILED:
+        return jsonify({"error": f"Job failed: {job['error']}"}), 410
+    if job["status"] != DONE:
+        return jsonify({"error": "Job not finished yet", **job_response(job)}), 409
+    if not job["result_path"] or not os.path.exists(job["result_path"]):
+        logger.error(f"Video file not found at path: {job['result_path']}")
+        return jsonify({"error": "Video file not found"}), 404
+
+    file_name = job.get("result_name") or os.path.basename(job["result_path"])
+    logger.info(f"Sending video file: {file_name} ({os.path.getsize(job['result_path'])} bytes)")
+    return send_file(
+        job["result_path"],
+        mimetype='video/mp4',
+        as_attachment=True,
+        download_name=file_name
+    )
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -225,26 +295,84 @@ def health_check():
         "temp_dir_exists": os.path.exists(TEMP_DIR),
         "results_dir_exists": os.path.exists(RESULTS_DIR),
         "config_exists": os.path.exists(CONFIG_PATH),
-        "generation_in_progress": generation_in_progress
+        "generation_in_progress": job_queue.running > 0,
+        "pipeline_mode": "inprocess" if pipeline is not None else "process",
+        # "process" kills a run that goes over VIDEO_TIMEOUT, "stage" fails it when its next stage starts
+        "video_timeout": VIDEO_TIMEOUT,
+        "video_timeout_enforcement": "stage" if pipeline is not None else "process"
     }), 200
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics of the pipeline stages, encoders and job queue"""
+    jobs = job_queue.list()
+    lines = [
+        "# HELP rvg_jobs Jobs in the queue by status",
+        "# TYPE rvg_jobs gauge",
+    ]
+    for status in (QUEUED, RUNNING, DONE, FAILED):
+        count = sum(1 for job in jobs if job["status"] == status)
+        lines.append(f'rvg_jobs{{status="{status}"}} {count}')
+    return Response(
+        metrics.expose() + "\n".join(lines) + "\n",
+        mimetype="text/plain; version=0.0.4"
+    )
+
+@app.route('/encoders', methods=['GET'])
+def get_encoders():
+    """Result of the last encoder probe"""
+    result = probe_result()
+    if result is None:
+        return jsonify({"error": "Encoders have not been probed yet"}), 404
+    return jsonify(result), 200
+
+@app.route('/encoders/probe', methods=['POST'])
+def reprobe_encoders():
+    """Probe the encoders again, e.g. after a driver update or changing the device mapping
+
+    Backends that failed a real render are tested again as well.
+    """
+    try:
+        return jsonify(probe_encoders(clear_failures=True)), 200
+    except Exception as e:
+        logger.error(f"Encoder probe failed: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/backgrounds', methods=['GET'])
+def get_backgrounds():
+    """Download and verification state of the background videos and audios"""
+    return jsonify(get_prefetcher().status()), 200
+
+@app.route('/backgrounds/prefetch', methods=['POST'])
+def prefetch_backgrounds():
+    """Download the missing backgrounds and verify the others, all of them or e.g. {"video": ["minecraft"]}
+
+    ?verify=true hashes every file on disk, otherwise only the changed ones are hashed.
+    """
+    names = request.get_json(silent=True) or None
+    verify = request.args.get("verify", "").lower() in ("1", "true", "yes")
+    try:
+        started = get_prefetcher().prefetch(names, verify=verify)
+    except (KeyError, TypeError, AttributeError) as e:
+        return jsonify({"error": f"Invalid background selection: {e}"}), 400
+    if not started:
+        return jsonify({"error": "A prefetch is already running", **get_prefetcher().status()}), 409
+    return jsonify(get_prefetcher().status()), 202
+
 @app.route('/status', methods=['GET'])
 def get_status():
     """Get current generation status"""
     try:
-        subreddits = get_subreddit_path()
-        results_path = os.path.join(RESULTS_DIR, subreddits)
-        
-        video_files = []
-        if os.path.exists(results_path):
-            video_files = [f for f in os.listdir(results_path) 
-                          if f.endswith('.mp4') and f != 'background.mp4']
-        
+        jobs = sorted(job_queue.list(), key=lambda job: job["created_at"])
+        finished = [job for job in jobs if job["status"] == DONE]
         return jsonify({
-            "generation_in_progress": generation_in_progress,
-            "results_directory": results_path,
-            "video_files_count": len(video_files),
-            "latest_videos": video_files[-3:] if video_files else []
+            "generation_in_progress": job_queue.running > 0,
+            "workers": VIDEO_WORKERS,
+            "running_jobs": job_queue.running,
+            "queued_jobs": sum(1 for job in jobs if job["status"] == QUEUED),
+            "results_directory": JOB_RESULTS_DIR,
+            "video_files_count": len(finished),
+            "latest_videos": [job["id"] for job in finished[-3:]]
         }), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -260,10 +388,42 @@ if __name__ == '__main__':
     else:
         logger.warning("⚠️ Intel Arc GPU not available, using CPU fallback")
     
-    # Check FFmpeg hardware acceleration support
-    check_ffmpeg_hardware_support()
+    # Find the encoder every render will use, instead of trying them all per video
+    encoder_probe = probe_encoders()
+    logger.info(f"🎬 Rendering with {encoder_probe['backend']}")
     
     # Ensure temp directory exists
     os.makedirs(TEMP_DIR, exist_ok=True)
+
+    # Jobs that were queued or running when the server stopped are queued again
+    job_queue = JobQueue(JOBS_DIR)
+
+    # Probe durations and keyframes of backgrounds that were downloaded without being indexed
+    threading.Thread(target=build_index, name="background-index", daemon=True).start()
+
+    # Download the backgrounds ahead of the jobs, so no job waits for a download, and
+    # prepare their renditions afterwards, so no job waits for an encode either
+    get_prefetcher().rendition_size = rendition_size()
+    if BACKGROUND_PREFETCH.lower() not in ("", "none"):
+        try:
+            get_prefetcher().prefetch(background_selection(BACKGROUND_PREFETCH))
+            logger.info(f"📥 Prefetching backgrounds: {BACKGROUND_PREFETCH}")
+        except KeyError as e:
+            logger.error(f"Invalid BACKGROUND_PREFETCH: {e}")
+
+    if PIPELINE_MODE == "inprocess":
+        # Load config, models and clients once instead of once per video
+        from pipeline import Pipeline
+
+        logger.info("🔥 Warming up the in-process pipeline")
+        pipeline = Pipeline(config_path=CONFIG_PATH, initialize_gpu=False)
+    else:
+        logger.info("Running every video in a separate main.py process")
+
+    # Start working through the job queue, including jobs left over from a restart
+    for worker in range(VIDEO_WORKERS):
+        threading.Thread(target=job_worker, name=f"job-worker-{worker}", daemon=True).start()
+    logger.info(f"Started {VIDEO_WORKERS} video workers")
+
     logger.info("🌐 Starting Flask application on 0.0.0.0:5000")
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
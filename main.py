@@ -1,38 +1,24 @@
 #!/usr/bin/env python
-import math
-import sys
 import os
+import sys
 from os import name
 from pathlib import Path
 from subprocess import Popen
 from typing import NoReturn
 
-# Import Intel GPU initialization script
-from utils.intel_gpu_init import initialize_intel_gpu
-
 from prawcore import ResponseException
 
-from reddit.subreddit import get_subreddit_threads
+from pipeline import Pipeline
 from utils import settings
 from utils.cleanup import cleanup
 from utils.console import print_markdown, print_step, print_substep
 from utils.ffmpeg_install import ffmpeg_install
-from utils.id import id
+from utils.jobs import POST_ID_ENV
 from utils.version import checkversion
-from video_creation.background import (
-    chop_background,
-    download_background_audio,
-    download_background_video,
-    get_background_config,
-)
-from video_creation.final_video import make_final_video
-from video_creation.screenshot_downloader import get_screenshots_of_reddit_posts
-from video_creation.voices import save_text_to_mp3
 
 __VERSION__ = "3.3.0"
 
-print(
-    """
+BANNER = """
 ██████╗ ███████╗██████╗ ██████╗ ██╗████████╗    ██╗   ██╗██╗██████╗ ███████╗ ██████╗     ███╗   ███╗ █████╗ ██╗  ██╗███████╗██████╗
 ██╔══██╗██╔════╝██╔══██╗██╔══██╗██║╚══██╔══╝    ██║   ██║██║██╔══██╗██╔════╝██╔═══██╗    ████╗ ████║██╔══██╗██║ ██╔╝██╔════╝██╔══██╗
 ██████╔╝█████╗  ██║  ██║██║  ██║██║   ██║       ██║   ██║██║██║  ██║█████╗  ██║   ██║    ██╔████╔██║███████║█████╔╝ █████╗  ██████╔╝
@@ -40,37 +26,37 @@ print(
 ██║  ██║███████╗██████╔╝██████╔╝██║   ██║        ╚████╔╝ ██║██████╔╝███████╗╚██████╔╝    ██║ ╚═╝ ██║██║  ██║██║  ██╗███████╗██║  ██║
 ╚═╝  ╚═╝╚══════╝╚═════╝ ╚═════╝ ╚═╝   ╚═╝         ╚═══╝  ╚═╝╚═════╝ ╚══════╝ ╚═════╝     ╚═╝     ╚═╝╚═╝  ╚═╝╚═╝  ╚═╝╚══════╝╚═╝  ╚═╝
 """
-)
-print_markdown(
-    "### Thanks for using this tool! Feel free to contribute to this project on GitHub! If you have any questions, feel free to join my Discord server or submit a GitHub issue. You can find solutions to many common problems in the documentation: https://reddit-video-maker-bot.netlify.app/"
-)
-checkversion(__VERSION__)
+
+pipeline = None
+
+
+def print_banner() -> None:
+    print(BANNER)
+    print_markdown(
+        "### Thanks for using this tool! Feel free to contribute to this project on GitHub! If you have any questions, feel free to join my Discord server or submit a GitHub issue. You can find solutions to many common problems in the documentation: https://reddit-video-maker-bot.netlify.app/"
+    )
+    checkversion(__VERSION__)
 
 
 def main(POST_ID=None) -> None:
-    global redditid, reddit_object
-    
-    # Initialize Intel GPU if available
-    print_step("Initializing GPU settings...")
-    gpu_available = initialize_intel_gpu()
-    if gpu_available:
-        print_substep("Intel Arc A380 GPU initialized successfully", "bold green")
-    else:
-        print_substep("Using CPU for processing", "bold yellow")
-    
-    reddit_object = get_subreddit_threads(POST_ID)
-    redditid = id(reddit_object)
-    length, number_of_comments = save_text_to_mp3(reddit_object)
-    length = math.ceil(length)
-    get_screenshots_of_reddit_posts(reddit_object, number_of_comments)
-    bg_config = {
-        "video": get_background_config("video"),
-        "audio": get_background_config("audio"),
-    }
-    download_background_video(bg_config["video"])
-    download_background_audio(bg_config["audio"])
-    chop_background(bg_config, length, reddit_object)
-    make_final_video(number_of_comments, length, reddit_object, bg_config)
+    global pipeline
+
+    # Models, clients and the GPU are set up once and reused for every video of this run
+    if pipeline is None:
+        print_step("Initializing GPU settings...")
+        pipeline = Pipeline(config=settings.config)
+
+    def on_thread(reddit_id: str) -> None:
+        global redditid
+        redditid = reddit_id  # cleaned up by shutdown() if the run is interrupted
+
+    try:
+        pipeline.run(POST_ID, on_thread=on_thread)
+    except RuntimeError as e:
+        # On the command line an exit() inside the pipeline should still just exit
+        if isinstance(e.__cause__, SystemExit):
+            raise e.__cause__
+        raise
 
 
 def run_many(times) -> None:
@@ -97,12 +83,16 @@ if __name__ == "__main__":
             "Hey! Congratulations, you've made it so far (which is pretty rare with no Python 3.10). Unfortunately, this program only works on Python 3.10. Please install Python 3.10 and try again."
         )
         sys.exit()
+    print_banner()
     ffmpeg_install()
     directory = Path().absolute()
     config = settings.check_toml(
         f"{directory}/utils/.config.template.toml", f"{directory}/config.toml"
     )
     config is False and sys.exit()
+    # The API passes the post of a job here, it replaces the one in the config
+    if os.environ.get(POST_ID_ENV):
+        config["reddit"]["thread"]["post_id"] = os.environ[POST_ID_ENV]
 
     if (
         not settings.config["settings"]["tts"]["tiktok_sessionid"]
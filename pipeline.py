@@ -0,0 +1,155 @@
+import math
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from reddit.subreddit import get_subreddit_threads
+from utils import settings
+from utils.ai_methods import get_embedding_service
+from utils.browser_pool import get_browser_pool
+from utils.cleanup import cleanup
+from utils.console import print_step, print_substep
+from utils.id import id
+from utils.intel_gpu_init import initialize_intel_gpu
+from utils.metrics import stage_span
+from utils.progress import progress_handler, report_progress
+from utils.workdir import job_paths
+from video_creation.background import (
+    chop_background,
+    download_background_audio,
+    download_background_video,
+    get_background_config,
+    prepare_background_video,
+)
+from video_creation.final_video import make_final_video
+from video_creation.screenshot_downloader import get_screenshots_of_reddit_posts
+from video_creation.voices import get_tts_provider, save_text_to_mp3
+
+
+class Pipeline:
+    """Generates videos inside the current process.
+
+    Everything that is expensive to set up (config validation, GPU initialization, the TTS
+    provider and its language models, the screenshot browser and its login) is done once when the pipeline is built, so every
+    call to run only pays for the video itself.
+
+    Args:
+        config (dict, optional): An already validated config. config.toml is checked when omitted.
+        config_path (str): The config file to check when no config is passed.
+        initialize_gpu (bool): Whether to initialize the Intel GPU. Skip it if the caller already did.
+    """
+
+    def __init__(
+        self,
+        config: Optional[dict] = None,
+        config_path: str = "config.toml",
+        initialize_gpu: bool = True,
+    ):
+        if config is None:
+            directory = Path().absolute()
+            config = settings.check_toml(f"{directory}/utils/.config.template.toml", config_path)
+            if config is False:
+                raise ValueError(f"Invalid config file {config_path}")
+        self.config = config
+
+        self.gpu_available = initialize_intel_gpu() if initialize_gpu else None
+        if self.gpu_available is not None:
+            if self.gpu_available:
+                print_substep("Intel Arc A380 GPU initialized successfully", "bold green")
+            else:
+                print_substep("Using CPU for processing", "bold yellow")
+
+        # Warm up the TTS provider so its models are loaded before the first video
+        self.tts_provider = get_tts_provider(config["settings"]["tts"]["voice_choice"])
+        # Load the similarity model now, it's kept for every video after that
+        if config["ai"]["ai_similarity_enabled"]:
+            get_embedding_service().load()
+        # Launch the screenshot browser and log in now instead of during the first video
+        storymode = config["settings"]["storymode"]
+        if storymode:
+            needs_browser = config["settings"]["storymodemethod"] != 1
+        else:
+            needs_browser = config["settings"].get("comment_renderer", "browser") == "browser"
+        if needs_browser:
+            try:
+                get_browser_pool().warm()
+            except Exception as e:
+                print_substep(f"Couldn't warm up the browser, retrying on first use: {e}", "bold yellow")
+
+    def run(
+        self,
+        post_id: Optional[str] = None,
+        temp_root: Optional[str] = None,
+        output_path: Optional[str] = None,
+        on_progress: Optional[Callable[[dict], None]] = None,
+        on_thread: Optional[Callable[[str], None]] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """Generates a single video.
+
+        The timeout is checked whenever a stage starts. A stage that hangs isn't interrupted,
+        the run only fails once that stage returns.
+
+        Args:
+            post_id (str, optional): The submission to use. Picked from the subreddit when omitted.
+            temp_root (str, optional): Folder for the temporary files of this run.
+            output_path (str, optional): Where to write the video. Defaults to the results folder.
+            on_progress (callable, optional): Called with every progress report of this run.
+            on_thread (callable, optional): Called with the id of the thread as soon as it's picked.
+            timeout (float, optional): Seconds after which the run fails with a TimeoutError.
+
+        Returns:
+            str: The id of the thread the video was made of
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        with job_paths(temp_root, output_path), progress_handler(on_progress):
+            try:
+                return self._run(post_id, on_thread, deadline)
+            except SystemExit as e:
+                # Parts of the pipeline exit() on bad input, that must not take down the caller
+                raise RuntimeError(f"Video generation stopped (exit code {e.code})") from e
+
+    def _run(
+        self,
+        post_id: Optional[str],
+        on_thread: Optional[Callable[[str], None]],
+        deadline: Optional[float],
+    ) -> str:
+        def start(stage: str) -> None:
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Video generation timed out before the {stage} stage")
+            report_progress(stage)
+
+        start("reddit")
+        with stage_span("reddit"):
+            reddit_object = get_subreddit_threads(post_id)
+        reddit_id = id(reddit_object)
+        if on_thread is not None:
+            on_thread(reddit_id)
+        start("tts")
+        with stage_span("tts"):
+            length, number_of_comments = save_text_to_mp3(reddit_object)
+        length = math.ceil(length)
+        start("screenshots")
+        with stage_span("screenshots"):
+            get_screenshots_of_reddit_posts(reddit_object, number_of_comments)
+        start("background")
+        bg_config = {
+            "video": get_background_config("video"),
+            "audio": get_background_config("audio"),
+        }
+        with stage_span("background_download"):
+            download_background_video(bg_config["video"])
+            download_background_audio(bg_config["audio"])
+        with stage_span("prepare_background"):
+            prepare_background_video(bg_config["video"])
+        with stage_span("chop_background"):
+            background_cuts = chop_background(bg_config, length, reddit_object)
+        start("render")
+        with stage_span("render"):
+            make_final_video(number_of_comments, length, reddit_object, bg_config, background_cuts)
+
+        print_step("Removing temporary files 🗑")
+        cleanups = cleanup(reddit_id)
+        print_substep(f"Removed {cleanups} temporary files 🗑")
+        return reddit_id
@@ -0,0 +1,215 @@
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional
+
+from praw.models import MoreComments
+
+CACHE_DIR = "assets/reddit_cache"
+FIXTURES_DIR = "assets/reddit_fixtures"
+DEFAULT_TTL = 300
+
+LIVE = "live"  # fetch from reddit, reuse responses younger than the TTL
+RECORD = "record"  # always fetch from reddit and store every response as a fixture
+REPLAY = "replay"  # only serve fixtures, reddit is never contacted
+MODES = (LIVE, RECORD, REPLAY)
+
+
+class FixtureMissing(Exception):
+    """Replay mode needs a response that was never recorded."""
+
+
+@dataclass
+class SubmissionRecord:
+    """The fields of a praw Submission the pipeline reads, as plain data."""
+
+    id: str
+    title: str
+    selftext: str
+    is_self: bool
+    over_18: bool
+    stickied: bool
+    num_comments: int
+    score: int
+    upvote_ratio: float
+    permalink: str
+    edited: float = 0  # time of the last edit, 0 if it never was
+
+    def __str__(self) -> str:
+        return self.id  # like praw, the done videos are keyed by str(submission)
+
+    @classmethod
+    def from_praw(cls, submission) -> "SubmissionRecord":
+        return cls(
+            id=submission.id,
+            title=submission.title,
+            selftext=submission.selftext,
+            is_self=submission.is_self,
+            over_18=submission.over_18,
+            stickied=submission.stickied,
+            num_comments=submission.num_comments,
+            score=submission.score,
+            upvote_ratio=submission.upvote_ratio,
+            permalink=submission.permalink,
+            edited=float(submission.edited or 0),
+        )
+
+
+@dataclass
+class CommentRecord:
+    """The fields of a top level praw Comment the pipeline reads, author is None for deleted accounts."""
+
+    id: str
+    body: str
+    permalink: str
+    author: Optional[str]
+    score: int
+    stickied: bool
+
+    @classmethod
+    def from_praw(cls, comment) -> "CommentRecord":
+        return cls(
+            id=comment.id,
+            body=comment.body,
+            permalink=comment.permalink,
+            author=comment.author.name if comment.author is not None else None,
+            score=comment.score,
+            stickied=comment.stickied,
+        )
+
+
+class RedditCache:
+    """Serves the reddit responses of the pipeline from a cache or from recorded fixtures.
+
+    Listings, submissions and comments are stored as JSON, keyed by what was asked for. In
+    live mode a stored response younger than ttl seconds is reused, so back to back runs on
+    the same subreddit share one fetch, across processes as well. Record mode fetches every
+    response and keeps it in the fixtures folder, replay mode serves only those fixtures and
+    doesn't need reddit or credentials at all.
+
+    Args:
+        reddit (praw.Reddit, optional): The client to fetch with, not needed in replay mode
+        mode (str): live, record or replay
+        ttl (float): Seconds a live response is reused, 0 turns the cache off
+        cache_dir (str): Where live responses are stored
+        fixtures_dir (str): Where fixtures are recorded to and replayed from
+    """
+
+    def __init__(
+        self,
+        reddit=None,
+        mode: str = LIVE,
+        ttl: float = DEFAULT_TTL,
+        cache_dir: str = CACHE_DIR,
+        fixtures_dir: str = FIXTURES_DIR,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown reddit cache mode {mode}, use one of {', '.join(MODES)}")
+        self.reddit = reddit
+        self.mode = mode
+        self.ttl = ttl
+        self.directory = cache_dir if mode == LIVE else fixtures_dir
+        self._lock = threading.Lock()
+
+    def _path(self, *key) -> str:
+        name = "-".join(re.sub(r"[^\w+]", "_", str(part)) for part in key if part is not None)
+        return os.path.join(self.directory, f"{name}.json")
+
+    def _get(self, key: tuple, fetch: Callable[[], object]):
+        path = self._path(*key)
+        if self.mode != RECORD:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    stored = json.load(f)
+                if self.mode == REPLAY or time.time() - stored["fetched_at"] < self.ttl:
+                    return stored["data"]
+            except (OSError, json.JSONDecodeError, KeyError):
+                if self.mode == REPLAY:
+                    raise FixtureMissing(f"No recorded response for {key} in {path}")
+        data = fetch()
+        if self.mode == RECORD or self.ttl > 0:
+            with self._lock:
+                os.makedirs(self.directory, exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"fetched_at": time.time(), "data": data}, f, ensure_ascii=False)
+                os.replace(tmp, path)
+        return data
+
+    def listing(
+        self, subreddit: str, listing: str, limit: int, time_filter: Optional[str] = None
+    ) -> List[SubmissionRecord]:
+        """Returns the submissions of a listing of a subreddit.
+
+        Args:
+            subreddit (str): Name of the subreddit, several can be joined with +
+            listing (str): hot or top
+            limit (int): How many submissions to fetch
+            time_filter (str, optional): Time filter of the top listing, e.g. day
+        """
+
+        def fetch():
+            kwargs = {"limit": limit}
+            if time_filter is not None:
+                kwargs["time_filter"] = time_filter
+            submissions = getattr(self.reddit.subreddit(subreddit), listing)(**kwargs)
+            return [asdict(SubmissionRecord.from_praw(submission)) for submission in submissions]
+
+        data = self._get((subreddit.lower(), listing, time_filter, limit), fetch)
+        return [SubmissionRecord(**submission) for submission in data]
+
+    def submission(self, submission_id: str) -> SubmissionRecord:
+        """Returns a single submission by its id."""
+        data = self._get(
+            ("submission", submission_id),
+            lambda: asdict(SubmissionRecord.from_praw(self.reddit.submission(id=submission_id))),
+        )
+        return SubmissionRecord(**data)
+
+    def comments(
+        self, submission_id: str, sort: str = "confidence", limit: Optional[int] = None
+    ) -> List[CommentRecord]:
+        """Returns the top level comments of a submission in the given sort order.
+
+        Only the comments reddit returns with the first request are read. MoreComments
+        stubs are skipped instead of expanded, which would cost a request each.
+
+        Args:
+            submission_id (str): The submission
+            sort (str): confidence (reddit's "best"), top, new, controversial, old or qa
+            limit (int, optional): How many comments reddit returns at most, replies included
+        """
+
+        def fetch():
+            submission = self.reddit.submission(id=submission_id)
+            submission.comment_sort = sort
+            submission.comment_limit = limit
+            return [
+                asdict(CommentRecord.from_praw(comment))
+                for comment in submission.comments
+                if not isinstance(comment, MoreComments)
+            ]
+
+        data = self._get(("comments", submission_id, sort, limit), fetch)
+        return [CommentRecord(**comment) for comment in data]
+
+
+class CachedSubreddit:
+    """Stands in for a praw Subreddit in utils/subreddit.py, its listings come from the cache."""
+
+    def __init__(self, cache: RedditCache, name: str):
+        self.cache = cache
+        self.name = name
+
+    def __str__(self) -> str:
+        return self.name
+
+    def hot(self, limit: int) -> List[SubmissionRecord]:
+        return self.cache.listing(self.name, "hot", limit)
+
+    def top(self, time_filter: str, limit: int) -> List[SubmissionRecord]:
+        return self.cache.listing(self.name, "top", limit, time_filter=time_filter)
+
@@ -1,26 +1,32 @@
 import re
 
 import praw
-from praw.models import MoreComments
-from prawcore.exceptions import ResponseException
-
+from prawcore.exceptions import Forbidden, NotFound, ResponseException
+
+from reddit.cache import (
+    DEFAULT_TTL,
+    FIXTURES_DIR,
+    LIVE,
+    RECORD,
+    REPLAY,
+    CachedSubreddit,
+    RedditCache,
+)
+from TTS.engine_wrapper import DEFAULT_MAX_LENGTH
 from utils import settings
-from utils.ai_methods import sort_by_similarity
 from utils.console import print_step, print_substep
 from utils.posttextparser import posttextparser
 from utils.subreddit import get_subreddit_undone
 from utils.videos import check_done
 from utils.voice import sanitize_text
 
+NARRATION_CHARS_PER_SECOND = 15  # rough speaking rate of the TTS voices
+BUDGET_MARGIN = 2
 
-def get_subreddit_threads(POST_ID: str):
-    """
-    Returns a list of threads from the AskReddit subreddit.
-    """
 
+def login() -> praw.Reddit:
     print_substep("Logging into Reddit.")
 
-    content = {}
     if settings.config["reddit"]["creds"]["2fa"]:
         print("\nEnter your two-factor authentication code from your authenticator app.\n")
         code = input("> ")
@@ -32,6 +38,7 @@ def get_subreddit_threads(POST_ID: str):
     username = settings.config["reddit"]["creds"]["username"]
     if str(username).casefold().startswith("u/"):
         username = username[2:]
+    reddit = None
     try:
         reddit = praw.Reddit(
             client_id=settings.config["reddit"]["creds"]["client_id"],
@@ -46,6 +53,28 @@ def get_subreddit_threads(POST_ID: str):
             print("Invalid credentials - please check them in config.toml")
     except:
         print("Something went wrong...")
+    return reddit
+
+
+def get_subreddit_threads(POST_ID: str):
+    """
+    Returns a list of threads from the AskReddit subreddit.
+    """
+
+    content = {}
+    cache_mode = settings.config["reddit"]["thread"].get("cache_mode", LIVE)
+    reddit = None
+    if cache_mode == REPLAY:
+        print_substep(f"Replaying recorded reddit responses from {FIXTURES_DIR}", style="bold blue")
+    else:
+        reddit = login()
+    cache = RedditCache(
+        reddit,
+        mode=cache_mode,
+        ttl=float(settings.config["reddit"]["thread"].get("cache_ttl", DEFAULT_TTL)),
+    )
+    if cache_mode == RECORD:
+        print_substep(f"Recording reddit responses to {FIXTURES_DIR}", style="bold blue")
 
     # Ask user for subreddit input
     print_step("Getting subreddit threads...")
@@ -53,54 +82,48 @@ def get_subreddit_threads(POST_ID: str):
     if not settings.config["reddit"]["thread"][
         "subreddit"
     ]:  # note to user. you can have multiple subreddits via reddit.subreddit("redditdev+learnpython")
-        try:
-            subreddit = reddit.subreddit(
-                re.sub(r"r\/", "", input("What subreddit would you like to pull from? "))
-                # removes the r/ from the input
-            )
-        except ValueError:
-            subreddit = reddit.subreddit("askreddit")
+        subreddit_choice = re.sub(
+            r"r\/", "", input("What subreddit would you like to pull from? ")
+        )  # removes the r/ from the input
+        if not subreddit_choice.strip():
+            subreddit_choice = "askreddit"
             print_substep("Subreddit not defined. Using AskReddit.")
+        subreddit = CachedSubreddit(cache, subreddit_choice.strip())
     else:
         sub = settings.config["reddit"]["thread"]["subreddit"]
         print_substep(f"Using subreddit: r/{sub} from TOML config")
         subreddit_choice = sub
         if str(subreddit_choice).casefold().startswith("r/"):  # removes the r/ from the input
             subreddit_choice = subreddit_choice[2:]
-        subreddit = reddit.subreddit(subreddit_choice)
+        subreddit = CachedSubreddit(cache, subreddit_choice)
 
-    if POST_ID:  # would only be called if there are multiple queued posts
-        submission = reddit.submission(id=POST_ID)
+    submission = None
+    if POST_ID:  # a job's post or one of multiple queued posts, never swapped for another
+        try:
+            submission = check_done(cache.submission(POST_ID), requested=True)
+        except (NotFound, Forbidden) as e:
+            raise ValueError(f"The requested post {POST_ID} can't be read: {e}") from e
 
     elif (
         settings.config["reddit"]["thread"]["post_id"]
         and len(str(settings.config["reddit"]["thread"]["post_id"]).split("+")) == 1
     ):
-        submission = reddit.submission(id=settings.config["reddit"]["thread"]["post_id"])
-    elif settings.config["ai"]["ai_similarity_enabled"]:  # ai sorting based on comparison
-        threads = subreddit.hot(limit=50)
-        keywords = settings.config["ai"]["ai_similarity_keywords"].split(",")
-        keywords = [keyword.strip() for keyword in keywords]
-        # Reformat the keywords for printing
-        keywords_print = ", ".join(keywords)
-        print(f"Sorting threads by similarity to the given keywords: {keywords_print}")
-        threads, similarity_scores = sort_by_similarity(threads, keywords)
-        submission, similarity_score = get_subreddit_undone(
-            threads, subreddit, similarity_scores=similarity_scores
-        )
-    else:
-        threads = subreddit.hot(limit=25)
-        submission = get_subreddit_undone(threads, subreddit)
-
-    if submission is None:
-        return get_subreddit_threads(POST_ID)  # submission already done. rerun
-
-    elif not submission.num_comments and settings.config["settings"]["storymode"] == "false":
+        submission = check_done(cache.submission(settings.config["reddit"]["thread"]["post_id"]))
+
+    if submission is None:  # no post given or it was already done
+        keywords = None
+        if settings.config["ai"]["ai_similarity_enabled"]:  # ai sorting based on comparison
+            keywords = settings.config["ai"]["ai_similarity_keywords"].split(",")
+            keywords = [keyword.strip() for keyword in keywords]
+            # Reformat the keywords for printing
+            keywords_print = ", ".join(keywords)
+            print(f"Sorting threads by similarity to the given keywords: {keywords_print}")
+        submission, similarity_score = get_subreddit_undone(subreddit, keywords)
+
+    if not submission.num_comments and settings.config["settings"]["storymode"] == "false":
         print_substep("No comments found. Skipping.")
         exit()
 
-    submission = check_done(submission)  # double-checking
-
     upvotes = submission.score
     ratio = submission.upvote_ratio * 100
     num_comments = submission.num_comments
@@ -128,33 +151,42 @@ def get_subreddit_threads(POST_ID: str):
         else:
             content["thread_post"] = submission.selftext
     else:
-        for top_level_comment in submission.comments:
-            if isinstance(top_level_comment, MoreComments):
-                continue
-
+        max_comment_length = int(settings.config["reddit"]["thread"]["max_comment_length"])
+        min_comment_length = int(settings.config["reddit"]["thread"]["min_comment_length"])
+        # Stop once the comments would fill the narration a few times over, the TTS cuts off
+        # the rest anyway. Some headroom is left for comments that can't be captured.
+        budget = DEFAULT_MAX_LENGTH * NARRATION_CHARS_PER_SECOND * BUDGET_MARGIN
+        characters = 0
+        comments = cache.comments(
+            submission.id,
+            sort=settings.config["reddit"]["thread"].get("comment_sort", "confidence"),
+            limit=int(settings.config["reddit"]["thread"].get("comment_limit", 100)) or None,
+        )
+        for top_level_comment in comments:
             if top_level_comment.body in ["[removed]", "[deleted]"]:
                 continue  # # see https://github.com/JasonLovesDoggo/RedditVideoMakerBot/issues/78
-            if not top_level_comment.stickied:
-                sanitised = sanitize_text(top_level_comment.body)
-                if not sanitised or sanitised == " ":
-                    continue
-                if len(top_level_comment.body) <= int(
-                    settings.config["reddit"]["thread"]["max_comment_length"]
-                ):
-                    if len(top_level_comment.body) >= int(
-                        settings.config["reddit"]["thread"]["min_comment_length"]
-                    ):
-                        if (
-                            top_level_comment.author is not None
-                            and sanitize_text(top_level_comment.body) is not None
-                        ):  # if errors occur with this change to if not.
-                            content["comments"].append(
-                                {
-                                    "comment_body": top_level_comment.body,
-                                    "comment_url": top_level_comment.permalink,
-                                    "comment_id": top_level_comment.id,
-                                }
-                            )
+            if top_level_comment.stickied or top_level_comment.author is None:
+                continue
+            if not min_comment_length <= len(top_level_comment.body) <= max_comment_length:
+                continue
+            sanitised = sanitize_text(top_level_comment.body)
+            if not sanitised or sanitised == " ":
+                continue
+            content["comments"].append(
+                {
+                    "comment_body": top_level_comment.body,
+                    "comment_url": top_level_comment.permalink,
+                    "comment_id": top_level_comment.id,
+                    "comment_author": top_level_comment.author,
+                    "comment_score": top_level_comment.score,
+                }
+            )
+            characters += len(sanitised)
+            if characters >= budget:
+                break
+        print_substep(
+            f"Using {len(content['comments'])} of {len(comments)} fetched comments", style="bold blue"
+        )
 
     print_substep("Received subreddit threads Successfully.", style="bold green")
     return content
@@ -0,0 +1,133 @@
+import os
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+from utils import audio_duration
+from utils.audio_duration import get_duration, mp3_duration, wav_duration
+
+# MPEG-1 layer III, 128 kbit/s, 44.1 kHz, stereo: 417 bytes and 1152 samples per frame
+MPEG1_HEADER = b"\xff\xfb\x90\x00"
+MPEG1_FRAME = 417
+# MPEG-1 layer III, 128 kbit/s, 44.1 kHz, mono: a smaller side info before the Xing tag
+MPEG1_MONO_HEADER = b"\xff\xfb\x90\xc0"
+# MPEG-2 layer III, 64 kbit/s, 22.05 kHz, stereo: 208 bytes and 576 samples per frame
+MPEG2_HEADER = b"\xff\xf3\x80\x00"
+MPEG2_FRAME = 208
+
+
+def frames(header: bytes, length: int, count: int) -> bytes:
+    return (header + bytes(length - len(header))) * count
+
+
+def id3v2(size: int) -> bytes:
+    syncsafe = bytes([size >> 21 & 0x7F, size >> 14 & 0x7F, size >> 7 & 0x7F, size & 0x7F])
+    return b"ID3\x04\x00\x00" + syncsafe + bytes(size)
+
+
+def xing_frame(header: bytes, side_info: int, frame_count: int, tag: bytes = b"Xing") -> bytes:
+    body = tag + b"\x00\x00\x00\x01" + struct.pack(">I", frame_count)
+    frame = header + bytes(side_info) + body
+    return frame + bytes(MPEG1_FRAME - len(frame))
+
+
+def vbri_frame(frame_count: int) -> bytes:
+    frame = MPEG1_HEADER + bytes(32) + b"VBRI" + bytes(10) + struct.pack(">I", frame_count)
+    return frame + bytes(MPEG1_FRAME - len(frame))
+
+
+def wav(byte_rate: int, data: bytes, data_size=None, extra_chunk: bytes = b"") -> bytes:
+    channels, sample_rate, bits = 1, byte_rate // 2, 16
+    fmt = struct.pack("<HHIIHH", 1, channels, sample_rate, byte_rate, channels * bits // 8, bits)
+    chunks = b"fmt " + struct.pack("<I", len(fmt)) + fmt
+    if extra_chunk:
+        chunks += b"LIST" + struct.pack("<I", len(extra_chunk)) + extra_chunk
+        chunks += bytes(len(extra_chunk) & 1)
+    size = len(data) if data_size is None else data_size
+    chunks += b"data" + struct.pack("<I", size) + data
+    return b"RIFF" + struct.pack("<I", 4 + len(chunks)) + b"WAVE" + chunks
+
+
+class Mp3DurationTest(unittest.TestCase):
+    def test_counts_cbr_frames(self):
+        data = frames(MPEG1_HEADER, MPEG1_FRAME, 100)
+        self.assertAlmostEqual(mp3_duration(data), 100 * 1152 / 44100)
+
+    def test_skips_id3_tags(self):
+        data = id3v2(300) + frames(MPEG1_HEADER, MPEG1_FRAME, 10) + b"TAG" + bytes(125)
+        self.assertAlmostEqual(mp3_duration(data), 10 * 1152 / 44100)
+
+    def test_resyncs_after_garbage(self):
+        data = b"\x00\x01\x02" + frames(MPEG2_HEADER, MPEG2_FRAME, 50)
+        self.assertAlmostEqual(mp3_duration(data), 50 * 576 / 22050)
+
+    def test_trusts_the_xing_frame_count(self):
+        data = xing_frame(MPEG1_HEADER, 32, 2000) + frames(MPEG1_HEADER, MPEG1_FRAME, 3)
+        self.assertAlmostEqual(mp3_duration(data), 2000 * 1152 / 44100)
+
+    def test_reads_the_info_tag_of_mono_files(self):
+        data = xing_frame(MPEG1_MONO_HEADER, 17, 500, tag=b"Info")
+        self.assertAlmostEqual(mp3_duration(data), 500 * 1152 / 44100)
+
+    def test_trusts_the_vbri_frame_count(self):
+        data = vbri_frame(1234) + frames(MPEG1_HEADER, MPEG1_FRAME, 3)
+        self.assertAlmostEqual(mp3_duration(data), 1234 * 1152 / 44100)
+
+    def test_no_frames(self):
+        self.assertIsNone(mp3_duration(b""))
+        self.assertIsNone(mp3_duration(bytes(1000)))
+
+
+class WavDurationTest(unittest.TestCase):
+    def test_reads_the_data_chunk(self):
+        self.assertAlmostEqual(wav_duration(wav(32000, bytes(64000))), 2.0)
+
+    def test_skips_other_chunks_and_their_padding(self):
+        self.assertAlmostEqual(wav_duration(wav(32000, bytes(16000), extra_chunk=b"odd")), 0.5)
+
+    def test_streamed_data_runs_to_the_end(self):
+        self.assertAlmostEqual(wav_duration(wav(32000, bytes(8000), data_size=0xFFFFFFFF)), 0.25)
+
+    def test_rejects_other_files(self):
+        self.assertIsNone(wav_duration(frames(MPEG1_HEADER, MPEG1_FRAME, 2)))
+        self.assertIsNone(wav_duration(b"RIFF\x00\x00\x00\x00AVI "))
+
+
+class GetDurationTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name: str, data: bytes, mtime: int = 1_000_000) -> str:
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_parses_headers_without_ffprobe(self):
+        with mock.patch.object(audio_duration.ffmpeg, "probe") as probe:
+            self.assertAlmostEqual(get_duration(self.write("a.wav", wav(32000, bytes(32000)))), 1.0)
+            mp3 = self.write("a.mp3", frames(MPEG1_HEADER, MPEG1_FRAME, 100))
+            self.assertAlmostEqual(get_duration(mp3), 100 * 1152 / 44100)
+        probe.assert_not_called()
+
+    def test_falls_back_to_ffprobe(self):
+        path = self.write("a.ogg", b"OggS" + bytes(100))
+        with mock.patch.object(
+            audio_duration.ffmpeg, "probe", return_value={"format": {"duration": "3.5"}}
+        ) as probe:
+            self.assertEqual(get_duration(path), 3.5)
+        probe.assert_called_once_with(os.path.abspath(path))
+
+    def test_measures_rewritten_files_again(self):
+        path = self.write("b.wav", wav(32000, bytes(32000)))
+        self.assertAlmostEqual(get_duration(path), 1.0)
+        self.write("b.wav", wav(32000, bytes(64000)), mtime=2_000_000)
+        self.assertAlmostEqual(get_duration(path), 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from unittest import mock
+
+from utils import settings
+from utils.background_index import snap_to_keyframe
+from video_creation import background
+
+VIDEO = ("https://youtu.be/video", "parkour.mp4", "Credit", "center")
+AUDIO = ("https://youtu.be/audio", "lofi.mp3", "Credit")
+SOURCE = "assets/backgrounds/video/Credit-parkour.mp4"
+RENDITION = "assets/backgrounds/vertical/1080x1920/Credit-parkour.mp4"
+
+
+def config(volume=0.15, renditions=True):
+    return {
+        "settings": {
+            "background": {"background_audio_volume": volume, "background_renditions": renditions},
+            "resolution_w": 1080,
+            "resolution_h": 1920,
+        }
+    }
+
+
+class SnapToKeyframeTest(unittest.TestCase):
+    ENTRY = {"keyframes": [0.0, 2.5, 5.0, 7.5]}
+
+    def test_snaps_back_to_the_last_keyframe(self):
+        self.assertEqual(snap_to_keyframe(self.ENTRY, 6.2), 5.0)
+        self.assertEqual(snap_to_keyframe(self.ENTRY, 100), 7.5)
+
+    def test_keeps_a_time_on_a_keyframe(self):
+        self.assertEqual(snap_to_keyframe(self.ENTRY, 2.5), 2.5)
+
+    def test_before_the_first_keyframe(self):
+        self.assertEqual(snap_to_keyframe({"keyframes": [1.0, 3.0]}, 0.4), 1.0)
+
+    def test_without_keyframes(self):
+        self.assertEqual(snap_to_keyframe({}, 6.2), 6.2)
+        self.assertEqual(snap_to_keyframe({"keyframes": []}, 6.2), 6.2)
+
+
+class ChopBackgroundTest(unittest.TestCase):
+    def setUp(self):
+        self.entries = {
+            SOURCE: {"duration": 600.0, "keyframes": [0.0, 90.0, 180.0]},
+            RENDITION: {"duration": 600.0, "keyframes": [0.0, 98.0, 99.0, 101.0]},
+            "assets/backgrounds/audio/Credit-lofi.mp3": {"duration": 900.0},
+        }
+        for patch in (
+            mock.patch.object(background, "randrange", return_value=100),
+            mock.patch.object(background, "get_entry", side_effect=self.entries.__getitem__),
+            mock.patch.object(background, "print_step"),
+            mock.patch.object(background, "print_substep"),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def chop(self, rendition=RENDITION, **options):
+        with mock.patch.object(settings, "config", config(**options), create=True), mock.patch.object(
+            background, "get_rendition", return_value=rendition
+        ) as get_rendition:
+            cuts = background.chop_background({"video": VIDEO, "audio": AUDIO}, 30, {})
+        return cuts, get_rendition
+
+    def test_cuts_the_rendition_at_a_keyframe(self):
+        cuts, get_rendition = self.chop()
+        get_rendition.assert_called_once_with(SOURCE, 1080, 1920)
+        self.assertEqual(cuts["video"], (RENDITION, 99.0, 129.0))
+
+    def test_falls_back_to_the_source(self):
+        cuts, _ = self.chop(rendition=None)
+        self.assertEqual(cuts["video"], (SOURCE, 90.0, 120.0))
+
+    def test_renditions_turned_off(self):
+        cuts, get_rendition = self.chop(renditions=False)
+        get_rendition.assert_not_called()
+        self.assertEqual(cuts["video"], (SOURCE, 90.0, 120.0))
+
+    def test_cuts_the_background_audio(self):
+        cuts, _ = self.chop()
+        self.assertEqual(cuts["audio"], ("assets/backgrounds/audio/Credit-lofi.mp3", 100, 130))
+
+    def test_no_background_audio_at_volume_zero(self):
+        cuts, _ = self.chop(volume=0)
+        self.assertNotIn("audio", cuts)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from utils import background_prefetch
+from utils.background_prefetch import FAILED, READY, BackgroundPrefetcher
+
+
+class LocalDownloader:
+    """Stands in for yt-dlp, "downloads" by writing the content registered for a uri."""
+
+    def __init__(self, files):
+        self.files = files
+        self.calls = []
+        self.fail = False
+
+    def __call__(self, kind, uri, path, on_progress):
+        self.calls.append(uri)
+        content = self.files[uri]
+        if self.fail:
+            on_progress(len(content) // 2, len(content))
+            raise ConnectionError("connection reset")
+        with open(path, "wb") as f:
+            f.write(content)
+        on_progress(len(content), len(content))
+
+
+class BackgroundPrefetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        options = {}
+        for kind, name, uri in (("video", "minecraft", "video-uri"), ("audio", "lofi", "audio-uri")):
+            path = os.path.join(self.directory, f"{kind}.json")
+            with open(path, "w") as f:
+                json.dump({"__comment": "", name: [uri, f"{name}.mp4", "credit", "center"]}, f)
+            options[kind] = path
+        for patch in (
+            mock.patch.object(background_prefetch, "BACKGROUNDS_DIR", self.directory),
+            mock.patch.object(background_prefetch, "OPTIONS_FILES", options),
+            mock.patch.object(background_prefetch, "get_entry"),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.downloader = LocalDownloader({"video-uri": b"video" * 100, "audio-uri": b"audio" * 100})
+        self.prefetcher = BackgroundPrefetcher(
+            self.downloader, os.path.join(self.directory, "checksums.json")
+        )
+        self.path = background_prefetch.background_path("video", "minecraft.mp4", "credit")
+
+    def fetch(self, verify=False):
+        return self.prefetcher.fetch("video", "video-uri", self.path, verify=verify)
+
+    def state(self):
+        return self.prefetcher.status()["backgrounds"][self.path]["state"]
+
+    def test_downloads_once(self):
+        self.assertTrue(self.fetch())
+        self.assertFalse(self.fetch())
+        self.assertEqual(self.downloader.calls, ["video-uri"])
+        self.assertEqual(self.state(), READY)
+        with open(self.prefetcher.checksums_file) as f:
+            self.assertIn(self.path, json.load(f))
+
+    def test_downloads_a_corrupted_file_again(self):
+        self.fetch()
+        with open(self.path, "r+b") as f:
+            f.write(b"x")
+        os.utime(self.path, (time.time() + 10, time.time() + 10))
+        self.assertTrue(self.fetch())
+        self.assertEqual(len(self.downloader.calls), 2)
+
+    def test_verify_hashes_an_unchanged_file(self):
+        self.fetch()
+        stat = os.stat(self.path)
+        with open(self.path, "r+b") as f:
+            f.write(b"x")
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertFalse(self.fetch())  # size and mtime match, the file isn't hashed
+        self.assertTrue(self.fetch(verify=True))
+        self.assertEqual(len(self.downloader.calls), 2)
+
+    def test_reports_a_failed_download(self):
+        self.downloader.fail = True
+        with self.assertRaises(ConnectionError):
+            self.fetch()
+        self.assertEqual(self.state(), FAILED)
+        self.downloader.fail = False
+        self.assertTrue(self.fetch())
+        self.assertEqual(self.state(), READY)
+
+    def test_prefetch(self):
+        self.assertTrue(self.prefetcher.prefetch({"video": ["minecraft"]}))
+        self.prefetcher._thread.join(timeout=10)
+        self.assertEqual(self.downloader.calls, ["video-uri"])
+        self.assertEqual(self.state(), READY)
+        self.assertFalse(self.prefetcher.status()["running"])
+
+    def test_prefetch_rejects_unknown_backgrounds(self):
+        with self.assertRaises(KeyError):
+            self.prefetcher.prefetch({"video": ["unknown"]})
+
+
+if __name__ == "__main__":
+    unittest.main()
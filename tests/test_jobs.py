@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from utils.jobs import DONE, QUEUED, RUNNING, JobQueue, validate_params
+
+
+class ValidateParamsTest(unittest.TestCase):
+    def test_accepts_a_reddit_id(self):
+        self.assertEqual(validate_params({"post_id": "1c2x3yz"}), {"post_id": "1c2x3yz"})
+
+    def test_drops_empty_options(self):
+        self.assertEqual(validate_params({}), {})
+        self.assertEqual(validate_params({"post_id": None}), {})
+
+    def test_rejects_unknown_options(self):
+        with self.assertRaisesRegex(ValueError, "Unknown parameters subreddit"):
+            validate_params({"post_id": "1c2x3yz", "subreddit": "askreddit"})
+
+    def test_rejects_anything_but_a_bare_id(self):
+        for post_id in (123, "", "abc+def12", "https://redd.it/1c2x3yz", "ABCDEF", "abc", ["1c2x3yz"]):
+            with self.subTest(post_id=post_id), self.assertRaises(ValueError):
+                validate_params({"post_id": post_id})
+
+    def test_rejects_a_body_that_isnt_an_object(self):
+        with self.assertRaises(ValueError):
+            validate_params(["1c2x3yz"])
+
+
+class JobQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.queue = JobQueue(self.directory)
+
+    def stored(self, job_id):
+        with open(os.path.join(self.directory, f"{job_id}.json")) as f:
+            return json.load(f)
+
+    def test_runs_jobs_in_order(self):
+        first = self.queue.submit({"post_id": "1c2x3yz"})
+        second = self.queue.submit()
+        self.assertEqual(self.queue.position(second["id"]), 1)
+        job = self.queue.next(timeout=1)
+        self.assertEqual(job["id"], first["id"])
+        self.assertEqual(job["status"], RUNNING)
+        self.assertEqual(job["params"], {"post_id": "1c2x3yz"})
+        self.assertEqual(self.stored(first["id"])["status"], RUNNING)
+        self.assertEqual(self.queue.position(second["id"]), 0)
+        self.assertEqual(self.queue.running, 1)
+        self.assertEqual(self.queue.next(timeout=1)["id"], second["id"])
+        self.assertIsNone(self.queue.next(timeout=0.01))
+
+    def test_requeues_interrupted_jobs_on_restart(self):
+        job = self.queue.submit()
+        self.queue.next(timeout=1)
+        self.queue.update(job["id"], stage="render", progress=70)
+
+        restarted = JobQueue(self.directory)
+        self.assertEqual(restarted.get(job["id"])["status"], QUEUED)
+        self.assertEqual(restarted.get(job["id"])["progress"], 0)
+        # Loading doesn't rewrite the file, another process may still be running the job
+        self.assertEqual(self.stored(job["id"])["status"], RUNNING)
+        self.assertEqual(restarted.next(timeout=1)["id"], job["id"])
+
+    def test_skips_finished_and_broken_jobs_on_restart(self):
+        job = self.queue.submit()
+        self.queue.update(job["id"], status=DONE)
+        with open(os.path.join(self.directory, "broken.json"), "w") as f:
+            f.write('{"id": ')
+        restarted = JobQueue(self.directory)
+        self.assertEqual(restarted.get(job["id"])["status"], DONE)
+        self.assertIsNone(restarted.next(timeout=0.01))
+
+    def test_save_is_atomic(self):
+        job = self.queue.submit()
+        with mock.patch("utils.jobs.json.dump", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.queue.update(job["id"], progress=50)
+        self.assertEqual(self.stored(job["id"])["progress"], 0)
+
+    def test_prune_deletes_old_jobs_and_their_videos(self):
+        old = self.queue.submit()
+        recent = self.queue.submit()
+        running = self.queue.submit()
+        result_path = os.path.join(self.directory, "old.mp4")
+        open(result_path, "w").close()
+        self.queue.update(old["id"], status=DONE, result_path=result_path)
+        self.queue.update(old["id"], finished_at=time.time() - 120)
+        self.queue.update(recent["id"], status=DONE)
+        self.queue.update(running["id"], status=RUNNING)
+
+        self.assertEqual(self.queue.prune(60), 1)
+        self.assertIsNone(self.queue.get(old["id"]))
+        self.assertFalse(os.path.exists(result_path))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, f"{old['id']}.json")))
+        self.assertIsNotNone(self.queue.get(recent["id"]))
+        self.assertIsNotNone(self.queue.get(running["id"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from praw.models import MoreComments
+
+from reddit import cache as reddit_cache
+from reddit.cache import LIVE, RECORD, REPLAY, CachedSubreddit, FixtureMissing, RedditCache
+
+
+def fake_submission(reddit_id):
+    return SimpleNamespace(
+        id=reddit_id,
+        title=f"Title of {reddit_id}",
+        selftext="",
+        is_self=False,
+        over_18=False,
+        stickied=False,
+        num_comments=42,
+        score=1000,
+        upvote_ratio=0.97,
+        permalink=f"/r/askreddit/comments/{reddit_id}/",
+        edited=False,
+    )
+
+
+def fake_comment(reddit_id, author="someone"):
+    return SimpleNamespace(
+        id=reddit_id,
+        body=f"Comment {reddit_id}",
+        permalink=f"/r/askreddit/comments/abc123/_/{reddit_id}/",
+        author=SimpleNamespace(name=author) if author else None,
+        score=10,
+        stickied=False,
+    )
+
+
+class FakeReddit:
+    """Stands in for a praw client and counts the requests made through it."""
+
+    def __init__(self):
+        self.requests = []
+
+    def subreddit(self, name):
+        def hot(limit):
+            self.requests.append(("hot", name, limit))
+            return [fake_submission(f"hot{index:03}") for index in range(limit)]
+
+        return SimpleNamespace(hot=hot)
+
+    def submission(self, id):
+        self.requests.append(("submission", id))
+        submission = fake_submission(id)
+        # A stub for the comments that weren't loaded, praw builds it from the listing
+        submission.comments = [
+            fake_comment("c1"),
+            MoreComments.__new__(MoreComments),
+            fake_comment("c2", author=None),
+        ]
+        return submission
+
+
+class RedditCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cache_dir = os.path.join(directory, "cache")
+        self.fixtures_dir = os.path.join(directory, "fixtures")
+        self.reddit = FakeReddit()
+
+    def cache(self, mode=LIVE, reddit=None, **kwargs):
+        return RedditCache(
+            reddit or self.reddit, mode, cache_dir=self.cache_dir, fixtures_dir=self.fixtures_dir, **kwargs
+        )
+
+    def test_reuses_live_responses_within_the_ttl(self):
+        cache = self.cache(ttl=300)
+        with mock.patch.object(reddit_cache.time, "time", return_value=1_000_000):
+            first = cache.listing("AskReddit", "hot", 3)
+        with mock.patch.object(reddit_cache.time, "time", return_value=1_000_299):
+            self.assertEqual(self.cache(ttl=300).listing("askreddit", "hot", 3), first)
+        self.assertEqual(len(self.reddit.requests), 1)
+        with mock.patch.object(reddit_cache.time, "time", return_value=1_000_301):
+            cache.listing("askreddit", "hot", 3)
+        self.assertEqual(len(self.reddit.requests), 2)
+
+    def test_ttl_zero_turns_the_cache_off(self):
+        cache = self.cache(ttl=0)
+        cache.submission("abc123")
+        cache.submission("abc123")
+        self.assertEqual(len(self.reddit.requests), 2)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_records_fixtures_and_replays_them_without_a_client(self):
+        recorder = self.cache(RECORD)
+        listing = recorder.listing("askreddit", "hot", 2)
+        submission = recorder.submission("abc123")
+        recorder.submission("abc123")  # record mode always fetches
+        self.assertEqual(len(self.reddit.requests), 3)
+        self.assertEqual(len(os.listdir(self.fixtures_dir)), 2)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+        replay = RedditCache(None, REPLAY, cache_dir=self.cache_dir, fixtures_dir=self.fixtures_dir)
+        self.assertEqual(CachedSubreddit(replay, "askreddit").hot(2), listing)
+        self.assertEqual(replay.submission("abc123"), submission)
+        self.assertEqual(str(replay.submission("abc123")), "abc123")
+
+    def test_replay_fails_on_a_missing_fixture(self):
+        replay = RedditCache(None, REPLAY, cache_dir=self.cache_dir, fixtures_dir=self.fixtures_dir)
+        with self.assertRaises(FixtureMissing):
+            replay.submission("abc123")
+
+    def test_skips_more_comments(self):
+        comments = self.cache().comments("abc123", sort="top", limit=10)
+        self.assertEqual([comment.id for comment in comments], ["c1", "c2"])
+        self.assertEqual(comments[0].author, "someone")
+        self.assertIsNone(comments[1].author)
+
+    def test_rejects_unknown_modes(self):
+        with self.assertRaises(ValueError):
+            RedditCache(mode="offline")
+
+
+if __name__ == "__main__":
+    unittest.main()
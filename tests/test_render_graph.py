@@ -0,0 +1,130 @@
+import unittest
+from dataclasses import replace
+
+from video_creation.render_graph import (
+    ENCODERS,
+    AudioSegment,
+    Overlay,
+    RenderSpec,
+    build_command,
+    compile_filter_graph,
+)
+
+AUDIO_FORMAT = "aformat=sample_fmts=fltp:sample_rates=44100:channel_layouts=stereo"
+
+SPEC = RenderSpec(
+    background="bg.mp4",
+    background_start=12.5,
+    background_duration=30,
+    narration=[
+        AudioSegment("title.mp3", 4.25),
+        AudioSegment(None, 0.5),
+        AudioSegment("comment.mp3", 25.25),
+    ],
+    overlays=[
+        Overlay("title.png", 0, 4.25),
+        Overlay("comment.png", 4.75, 30, opacity=0.9),
+    ],
+    width=1080,
+    height=1920,
+    overlay_width=972,
+)
+
+
+class CompileFilterGraphTest(unittest.TestCase):
+    def test_crops_and_scales_the_source(self):
+        self.assertEqual(
+            compile_filter_graph(SPEC, "libx264").split(";"),
+            [
+                "[0:v]crop=ih*(1080/1920):ih,scale=1080:1920,setsar=1[bg0]",
+                "[1:v]scale=972:-1[img1]",
+                "[bg0][img1]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2"
+                ":enable='between(t,0.000,4.250)'[bg1]",
+                "[2:v]scale=972:-1,format=rgba,colorchannelmixer=aa=0.9[img2]",
+                "[bg1][img2]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2"
+                ":enable='between(t,4.750,30.000)'[bg2]",
+                "[bg2]format=yuv420p[v]",
+                f"[3:a]{AUDIO_FORMAT}[n0]",
+                f"anullsrc=r=44100:cl=stereo,atrim=duration=0.500,{AUDIO_FORMAT}[n1]",
+                f"[4:a]{AUDIO_FORMAT}[n2]",
+                "[n0][n1][n2]concat=n=3:v=0:a=1[a]",
+            ],
+        )
+
+    def test_fitted_background_is_only_overlaid(self):
+        graph = compile_filter_graph(replace(SPEC, background_fitted=True), "libx264")
+        self.assertEqual(graph.split(";")[0], "[0:v]setsar=1[bg0]")
+        self.assertNotIn("crop=", graph)
+
+    def test_mixes_the_background_bed_under_the_narration(self):
+        spec = replace(SPEC, background_audio="music.mp3", background_audio_volume=0.15)
+        self.assertEqual(
+            compile_filter_graph(spec, "libx264").split(";")[-3:],
+            [
+                "[n0][n1][n2]concat=n=3:v=0:a=1[narration]",
+                f"[5:a]{AUDIO_FORMAT},volume=0.15[bed]",
+                "[narration][bed]amix=inputs=2:duration=first:dropout_transition=0:normalize=0[a]",
+            ],
+        )
+
+    def test_uploads_for_every_backend(self):
+        for backend, encoder in ENCODERS.items():
+            with self.subTest(backend=backend):
+                graph = compile_filter_graph(SPEC, backend)
+                self.assertIn(f"[bg2]{','.join(encoder['upload'])}[v]", graph)
+
+    def test_without_overlays(self):
+        spec = replace(SPEC, overlays=[], narration=[AudioSegment("title.mp3", 4)])
+        self.assertEqual(
+            compile_filter_graph(spec, "libx264").split(";"),
+            [
+                "[0:v]crop=ih*(1080/1920):ih,scale=1080:1920,setsar=1[bg0]",
+                "[bg0]format=yuv420p[v]",
+                f"[1:a]{AUDIO_FORMAT}[n0]",
+                "[n0]concat=n=1:v=0:a=1[a]",
+            ],
+        )
+
+
+class BuildCommandTest(unittest.TestCase):
+    def command(self, spec, backend):
+        return build_command(spec, backend, "out.mp4", "progress.txt")
+
+    def test_inputs_and_outputs(self):
+        spec = replace(SPEC, background_audio="music.mp3", background_audio_start=3)
+        for backend, encoder in ENCODERS.items():
+            with self.subTest(backend=backend):
+                cmd = self.command(spec, backend)
+                graph = compile_filter_graph(spec, backend)
+                self.assertEqual(
+                    cmd,
+                    [
+                        "ffmpeg", "-y", "-progress", "progress.txt", "-threads", "1",
+                        *encoder["global_args"],
+                        "-ss", "12.500", "-t", "30.000", "-an", "-i", "bg.mp4",
+                        "-i", "title.png",
+                        "-i", "comment.png",
+                        "-i", "title.mp3",
+                        "-i", "comment.mp3",
+                        "-ss", "3.000", "-t", "30.000", "-vn", "-i", "music.mp3",
+                        "-filter_complex", graph,
+                        "-map", "[v]", "-map", "[a]",
+                        *encoder["codec_args"],
+                        "-shortest",
+                        "-c:a", "aac", "-b:a", "192k", "-movflags", "+faststart", "out.mp4",
+                    ],
+                )
+
+    def test_seeks_only_the_background_inputs(self):
+        for backend in ENCODERS:
+            with self.subTest(backend=backend):
+                cmd = self.command(SPEC, backend)
+                # Without a bed only the background video is cut, the narration is read whole
+                self.assertEqual(cmd.count("-ss"), 1)
+                self.assertLess(cmd.index("-ss"), cmd.index("bg.mp4"))
+                self.assertLess(cmd.index("-shortest"), cmd.index("out.mp4"))
+                self.assertGreater(cmd.index("-shortest"), cmd.index("-filter_complex"))
+
+
+if __name__ == "__main__":
+    unittest.main()
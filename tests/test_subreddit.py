@@ -0,0 +1,162 @@
+import threading
+import unittest
+from unittest import mock
+
+from utils import settings, subreddit
+from utils.subreddit import filter_candidates, get_subreddit_undone, select_candidates
+
+
+class FakeSubmission:
+    def __init__(self, reddit_id, num_comments=100, over_18=False, stickied=False, selftext=""):
+        self.id = reddit_id
+        self.num_comments = num_comments
+        self.over_18 = over_18
+        self.stickied = stickied
+        self.is_self = bool(selftext)
+        self.selftext = selftext
+
+    def __str__(self):
+        return self.id
+
+
+class FakeSubreddit:
+    def __init__(self, hot, top=None):
+        self._hot = hot
+        self._top = top or {}
+
+    def hot(self, limit):
+        return self._hot
+
+    def top(self, time_filter, limit):
+        return self._top.get(time_filter, [])
+
+    def __str__(self):
+        return "askreddit"
+
+
+def config(storymode=False, allow_nsfw=False):
+    return {
+        "settings": {"storymode": storymode, "storymode_max_length": 100, "allow_nsfw": allow_nsfw},
+        "reddit": {"thread": {"min_comments": 20}},
+    }
+
+
+class SubredditTest(unittest.TestCase):
+    def setUp(self):
+        self.done = set()
+        self.config = config()
+        for patch in (
+            mock.patch.object(settings, "config", self.config, create=True),
+            mock.patch.object(subreddit, "done_ids", side_effect=lambda ids: self.done & set(ids)),
+            mock.patch.object(subreddit, "print_substep"),
+            mock.patch("builtins.print"),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+
+class FilterCandidatesTest(SubredditTest):
+    def test_drops_unusable_submissions_in_order(self):
+        self.done = {"done01"}
+        submissions = [
+            FakeSubmission("keep01"),
+            FakeSubmission("done01"),
+            FakeSubmission("nsfw01", over_18=True),
+            FakeSubmission("pin001", stickied=True),
+            FakeSubmission("few001", num_comments=20),
+            FakeSubmission("keep02"),
+        ]
+        self.assertEqual([str(s) for s in filter_candidates(submissions)], ["keep01", "keep02"])
+
+    def test_allows_nsfw(self):
+        self.config.update(config(allow_nsfw=True))
+        kept = filter_candidates([FakeSubmission("nsfw01", over_18=True)])
+        self.assertEqual([str(s) for s in kept], ["nsfw01"])
+
+    def test_storymode_needs_post_text_of_the_right_length(self):
+        self.config.update(config(storymode=True))
+        submissions = [
+            FakeSubmission("link01"),
+            FakeSubmission("long01", selftext="x" * 101),
+            FakeSubmission("short1", selftext="x" * 29),
+            FakeSubmission("story1", selftext="x" * 50, num_comments=0),
+        ]
+        self.assertEqual([str(s) for s in filter_candidates(submissions)], ["story1"])
+
+
+class SelectCandidatesTest(SubredditTest):
+    def test_takes_the_first_listing_with_candidates(self):
+        self.done = {"hot001"}
+        reddit = FakeSubreddit(
+            [FakeSubmission("hot001")],
+            {"day": [FakeSubmission("hot001"), FakeSubmission("day001")], "week": [FakeSubmission("week01")]},
+        )
+        self.assertEqual([(str(s), score) for s, score in select_candidates(reddit)], [("day001", 0)])
+
+    def test_skips_submissions_of_earlier_listings(self):
+        reddit = FakeSubreddit([FakeSubmission("hot001", stickied=True)], {"day": [FakeSubmission("hot001")]})
+        self.assertEqual(select_candidates(reddit), [])
+
+    def test_ranks_by_similarity_to_the_keywords(self):
+        reddit = FakeSubreddit([FakeSubmission("hot001"), FakeSubmission("hot002")])
+        scores = [mock.Mock(item=lambda: 0.9), mock.Mock(item=lambda: 0.4)]
+        with mock.patch.object(
+            subreddit, "sort_by_similarity", side_effect=lambda c, k: (c[::-1], scores)
+        ) as sort:
+            ranked = select_candidates(reddit, ["cats"])
+        sort.assert_called_once()
+        self.assertEqual([(str(s), score) for s, score in ranked], [("hot002", 0.9), ("hot001", 0.4)])
+
+
+class GetSubredditUndoneTest(SubredditTest):
+    def setUp(self):
+        super().setUp()
+        for patch in (
+            mock.patch.object(subreddit, "_batches", {}),
+            mock.patch.object(subreddit, "_batch_locks", {}),
+            mock.patch.object(subreddit, "claim", return_value=True),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_keeps_the_rest_of_a_batch(self):
+        reddit = FakeSubreddit([FakeSubmission("hot001"), FakeSubmission("hot002")])
+        with mock.patch.object(subreddit, "select_candidates", wraps=select_candidates) as select:
+            self.assertEqual(str(get_subreddit_undone(reddit)[0]), "hot001")
+            self.assertEqual(str(get_subreddit_undone(reddit)[0]), "hot002")
+        select.assert_called_once()
+
+    def test_skips_candidates_claimed_elsewhere(self):
+        reddit = FakeSubreddit([FakeSubmission("hot001"), FakeSubmission("hot002")])
+        subreddit.claim.side_effect = lambda reddit_id: reddit_id != "hot001"
+        self.assertEqual(str(get_subreddit_undone(reddit)[0]), "hot002")
+
+    def test_refilling_a_batch_doesnt_block_other_subreddits(self):
+        refilling, release = threading.Event(), threading.Event()
+
+        def select(reddit, keywords):
+            if keywords:
+                refilling.set()
+                release.wait(5)
+            return [(FakeSubmission(f"{reddit}1"), 0)]
+
+        reddit = FakeSubreddit([])
+        with mock.patch.object(subreddit, "select_candidates", side_effect=select):
+            slow = threading.Thread(target=get_subreddit_undone, args=(reddit, ["cats"]))
+            slow.start()
+            self.assertTrue(refilling.wait(5))
+            # The refill for the keywords is still running, the plain batch doesn't wait for it
+            results = []
+            fast = threading.Thread(target=lambda: results.append(get_subreddit_undone(reddit)))
+            fast.start()
+            fast.join(2)
+            finished_first = not fast.is_alive()
+            release.set()
+            slow.join(5)
+            fast.join(5)
+        self.assertTrue(finished_first)
+        self.assertEqual(str(results[0][0]), "askreddit1")
+
+
+if __name__ == "__main__":
+    unittest.main()
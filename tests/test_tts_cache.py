@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from utils import settings, tts_cache
+
+
+class TTSCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.config = {"settings": {"tts": {"cache_size_mb": 1000 / 1024 / 1024}}}
+        for patch in (
+            mock.patch.object(tts_cache, "CACHE_DIR", os.path.join(self.directory, "cache")),
+            mock.patch.object(tts_cache, "_size", None),
+            mock.patch.object(settings, "config", self.config, create=True),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def clip(self, name, size=400):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        return path
+
+    def put(self, key, mtime=None, size=400):
+        source = self.clip(f"{key}.mp3", size)
+        tts_cache.put(key, source)
+        if mtime is not None:
+            os.utime(tts_cache._entry(key), (mtime, mtime))
+        return source
+
+    def cached(self, key):
+        return os.path.exists(tts_cache._entry(key))
+
+    def test_get_copies_the_clip(self):
+        source = self.put("a" * 64)
+        destination = os.path.join(self.directory, "out.mp3")
+        self.assertTrue(tts_cache.get("a" * 64, destination))
+        with open(source, "rb") as f, open(destination, "rb") as g:
+            self.assertEqual(f.read(), g.read())
+        self.assertFalse(tts_cache.get("b" * 64, destination))
+
+    def test_overwriting_a_clip_counts_it_once(self):
+        self.put("a" * 64)
+        self.put("a" * 64)
+        self.put("a" * 64, size=300)
+        self.assertEqual(tts_cache._size, 300)
+
+    def test_evicts_the_least_recently_used_clips(self):
+        self.put("a" * 64, mtime=1_000)
+        self.put("b" * 64, mtime=2_000)
+        # Reading a clip makes it the most recently used
+        tts_cache.get("a" * 64, os.path.join(self.directory, "out.mp3"))
+        self.put("c" * 64)
+        self.assertTrue(self.cached("a" * 64))
+        self.assertFalse(self.cached("b" * 64))
+        self.assertTrue(self.cached("c" * 64))
+        self.assertEqual(tts_cache._size, 800)
+
+    def test_size_zero_turns_the_cache_off(self):
+        self.config["settings"]["tts"]["cache_size_mb"] = 0
+        self.put("a" * 64)
+        self.assertFalse(self.cached("a" * 64))
+        self.assertFalse(tts_cache.get("a" * 64, os.path.join(self.directory, "out.mp3")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from utils import videos
+from utils.videos import CLAIM_TTL, claim, done_ids, import_json, is_done, save_data
+
+
+class VideoStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.json_file = os.path.join(self.directory, "videos.json")
+        self.write_json(["1a2b3c"], mtime=1_000_000)
+        for patch in (
+            mock.patch.object(videos, "DB_FILE", os.path.join(self.directory, "videos.db")),
+            mock.patch.object(videos, "JSON_FILE", self.json_file),
+            mock.patch.object(videos, "_local", threading.local()),
+            mock.patch.object(videos, "_initialized", False),
+            mock.patch.object(videos, "print_substep"),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(lambda: videos._connect().close())
+
+    def write_json(self, ids, mtime):
+        with open(self.json_file, "w") as f:
+            json.dump([{"id": reddit_id, "subreddit": "askreddit"} for reddit_id in ids], f)
+        os.utime(self.json_file, (mtime, mtime))
+
+    def test_imports_the_json_store(self):
+        self.assertTrue(is_done("1a2b3c"))
+        self.assertFalse(is_done("4d5e6f"))
+
+    def test_imports_the_json_store_again_when_it_changed(self):
+        is_done("1a2b3c")
+        self.assertEqual(import_json(self.json_file), 0)
+        self.write_json(["1a2b3c", "4d5e6f"], mtime=2_000_000)
+        self.assertEqual(import_json(self.json_file), 1)
+        self.assertEqual(import_json(self.json_file), 0)
+        self.assertTrue(is_done("4d5e6f"))
+
+    def test_done_ids(self):
+        save_data("askreddit", "video.mp4", "title", "4d5e6f", "credit")
+        self.assertEqual(done_ids(["1a2b3c", "4d5e6f", "7g8h9i"]), {"1a2b3c", "4d5e6f"})
+        self.assertEqual(done_ids([]), set())
+
+    def test_claims_a_submission_once(self):
+        self.assertTrue(claim("4d5e6f"))
+        self.assertFalse(claim("4d5e6f"))
+        self.assertFalse(claim("1a2b3c"))  # already done
+
+    def test_claims_expire(self):
+        with mock.patch.object(videos.time, "time", return_value=1_000_000):
+            self.assertTrue(claim("4d5e6f"))
+        with mock.patch.object(videos.time, "time", return_value=1_000_000 + CLAIM_TTL - 1):
+            self.assertFalse(claim("4d5e6f"))
+        with mock.patch.object(videos.time, "time", return_value=1_000_000 + CLAIM_TTL + 1):
+            self.assertTrue(claim("4d5e6f"))
+
+    def test_saving_a_video_releases_its_claim(self):
+        self.assertTrue(claim("4d5e6f"))
+        save_data("askreddit", "video.mp4", "title", "4d5e6f", "credit")
+        self.assertTrue(is_done("4d5e6f"))
+        self.assertEqual(videos._db().execute("SELECT COUNT(*) FROM claims").fetchone()[0], 0)
+        self.assertFalse(claim("4d5e6f"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,27 @@
-import numpy as np
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
 import torch
 from transformers import AutoModel, AutoTokenizer
 
+from utils import settings
+from utils.console import print_substep
+
+# ONNX Runtime is optional, the onnx backend falls back to torch without it
+try:
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+
+    HAS_ONNX = True
+except ImportError:
+    HAS_ONNX = False
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+BACKENDS = ("torch", "quantized", "onnx")
+BATCH_SIZE = 32  # texts per forward pass
+MAX_SUBMISSIONS = 4096  # submission embeddings kept in memory
+MAX_KEYWORDS = 256  # keyword embeddings kept in memory
+
 
 # Mean Pooling - Take attention mask into account for correct averaging
 def mean_pooling(model_output, attention_mask):
@@ -12,53 +32,137 @@ def mean_pooling(model_output, attention_mask):
     )
 
 
-# This function sort the given threads based on their total similarity with the given keywords
-def sort_by_similarity(thread_objects, keywords):
-    # Initialize tokenizer + model.
-    tokenizer = AutoTokenizer.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
-    model = AutoModel.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
+class _LRU(OrderedDict):
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
 
-    # Transform the generator to a list of Submission Objects, so we can sort later based on context similarity to
-    # keywords
-    thread_objects = list(thread_objects)
+    def get(self, key):
+        if key not in self:
+            return None
+        self.move_to_end(key)
+        return self[key]
 
-    threads_sentences = []
-    for i, thread in enumerate(thread_objects):
-        threads_sentences.append(" ".join([thread.title, thread.selftext]))
+    def put(self, key, value) -> None:
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
 
-    # Threads inference
-    encoded_threads = tokenizer(
-        threads_sentences, padding=True, truncation=True, return_tensors="pt"
-    )
-    with torch.no_grad():
-        threads_embeddings = model(**encoded_threads)
-    threads_embeddings = mean_pooling(threads_embeddings, encoded_threads["attention_mask"])
-
-    # Keywords inference
-    encoded_keywords = tokenizer(keywords, padding=True, truncation=True, return_tensors="pt")
-    with torch.no_grad():
-        keywords_embeddings = model(**encoded_keywords)
-    keywords_embeddings = mean_pooling(keywords_embeddings, encoded_keywords["attention_mask"])
-
-    # Compare every keyword w/ every thread embedding
-    threads_embeddings_tensor = torch.tensor(threads_embeddings)
-    total_scores = torch.zeros(threads_embeddings_tensor.shape[0])
-    cosine_similarity = torch.nn.CosineSimilarity()
-    for keyword_embedding in keywords_embeddings:
-        keyword_embedding = torch.tensor(keyword_embedding).repeat(
-            threads_embeddings_tensor.shape[0], 1
-        )
-        similarity = cosine_similarity(keyword_embedding, threads_embeddings_tensor)
-        total_scores += similarity
-
-    similarity_scores, indices = torch.sort(total_scores, descending=True)
-
-    threads_sentences = np.array(threads_sentences)[indices.numpy()]
-
-    thread_objects = np.array(thread_objects)[indices.numpy()].tolist()
-
-    # print('Similarity Thread Ranking')
-    # for i, thread in enumerate(thread_objects):
-    #    print(f'{i}) {threads_sentences[i]} score {similarity_scores[i]}')
-
-    return thread_objects, similarity_scores
+
+class EmbeddingService:
+    """Keeps the sentence embedding model loaded and ranks submissions by similarity to keywords.
+
+    The model is loaded on first use and then kept for the life of the process. Embeddings
+    are L2 normalized, so the cosine similarity of every submission to every keyword is a
+    single matrix multiply. Keyword embeddings and submission embeddings are cached, the
+    latter by submission id and edit time, so an edited post is embedded again.
+
+    Args:
+        backend (str): torch, quantized (int8 dynamic quantization of the linear layers) or
+            onnx (ONNX Runtime on the CPU, needs optimum[onnxruntime])
+    """
+
+    def __init__(self, backend: str = "torch"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend}, use one of {', '.join(BACKENDS)}")
+        if backend == "onnx" and not HAS_ONNX:
+            print_substep(
+                "optimum[onnxruntime] isn't installed, embedding with torch instead", style="bold yellow"
+            )
+            backend = "torch"
+        self.backend = backend
+        self._tokenizer = None
+        self._model = None
+        self._lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._keywords = _LRU(MAX_KEYWORDS)
+        self._submissions = _LRU(MAX_SUBMISSIONS)
+
+    def load(self) -> None:
+        """Loads the model, if it isn't loaded yet."""
+        with self._lock:
+            if self._model is not None:
+                return
+            print_substep(f"Loading the similarity model ({self.backend})...")
+            self._tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+            if self.backend == "onnx":
+                self._model = ORTModelForFeatureExtraction.from_pretrained(MODEL_NAME, export=True)
+            else:
+                model = AutoModel.from_pretrained(MODEL_NAME).eval()
+                if self.backend == "quantized":
+                    model = torch.quantization.quantize_dynamic(
+                        model, {torch.nn.Linear}, dtype=torch.qint8
+                    )
+                self._model = model
+
+    def embed(self, texts: List[str]) -> torch.Tensor:
+        """Returns the normalized embeddings of the texts, one row per text."""
+        self.load()
+        batches = []
+        with self._lock, torch.no_grad():
+            for start in range(0, len(texts), BATCH_SIZE):
+                encoded = self._tokenizer(
+                    texts[start : start + BATCH_SIZE],
+                    padding=True,
+                    truncation=True,
+                    return_tensors="pt",
+                )
+                output = self._model(**encoded)
+                batches.append(mean_pooling(output, encoded["attention_mask"]))
+        if not batches:
+            return torch.empty(0, 0)
+        return torch.nn.functional.normalize(torch.cat(batches), dim=1)
+
+    def _cached(self, cache: _LRU, keys: list, texts: List[str]) -> torch.Tensor:
+        with self._cache_lock:
+            found = [cache.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(found) if embedding is None]
+        if missing:
+            embeddings = self.embed([texts[i] for i in missing])
+            with self._cache_lock:
+                for i, embedding in zip(missing, embeddings):
+                    found[i] = embedding.clone()  # don't keep the whole batch alive
+                    cache.put(keys[i], found[i])
+        return torch.stack(found)
+
+    def keyword_embeddings(self, keywords: List[str]) -> torch.Tensor:
+        return self._cached(self._keywords, list(keywords), list(keywords))
+
+    def submission_embeddings(self, submissions: list) -> torch.Tensor:
+        keys = [(submission.id, getattr(submission, "edited", None)) for submission in submissions]
+        texts = [" ".join([submission.title, submission.selftext]) for submission in submissions]
+        return self._cached(self._submissions, keys, texts)
+
+    def rank(self, submissions: list, keywords: List[str]) -> Tuple[list, torch.Tensor]:
+        """Sorts the submissions by their summed cosine similarity to the keywords.
+
+        Returns:
+            Tuple[list,torch.Tensor]: The sorted submissions and their scores in the same order
+        """
+        submissions = list(submissions)
+        if not submissions:
+            return [], torch.zeros(0)
+        scores = (
+            self.submission_embeddings(submissions) @ self.keyword_embeddings(keywords).T
+        ).sum(dim=1)
+        scores, indices = torch.sort(scores, descending=True)
+        return [submissions[i] for i in indices.tolist()], scores
+
+
+_service: Optional[EmbeddingService] = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    """Returns the embedding service of this process, with the backend from the config."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = EmbeddingService(settings.config["ai"].get("ai_backend", "torch"))
+        return _service
+
+
+# This function sort the given threads based on their total similarity with the given keywords
+def sort_by_similarity(thread_objects, keywords):
+    return get_embedding_service().rank(thread_objects, keywords)
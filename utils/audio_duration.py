@@ -0,0 +1,129 @@
+import os
+import struct
+from functools import lru_cache
+from typing import Optional
+
+import ffmpeg
+
+# Bitrates in kbit/s by (MPEG-1, layer) and (MPEG-2/2.5, layer), index 0 is "free" and 15 is invalid
+_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates by the version bits of the frame header
+_SAMPLE_RATES = {0: (11025, 12000, 8000), 2: (22050, 24000, 16000), 3: (44100, 48000, 32000)}
+
+
+def _frame_info(header: int):
+    """Returns (frame length, samples, sample rate, side info size) of an MP3 frame header, or None."""
+    if header >> 21 != 0x7FF:
+        return None
+    version = (header >> 19) & 3
+    layer = 4 - ((header >> 17) & 3)
+    bitrate_index = (header >> 12) & 15
+    rate_index = (header >> 10) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (header >> 9) & 1
+    mono = (header >> 6) & 3 == 3
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate, 0
+    samples = 1152 if layer == 2 or mpeg1 else 576
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate, side_info
+
+
+def mp3_duration(data: bytes) -> Optional[float]:
+    """Returns the duration of MP3 data by walking its frame headers, or None if there are no frames.
+
+    A Xing/Info header in the first frame is trusted for the frame count, otherwise every
+    frame is counted, which is exact for VBR files without one as well.
+    """
+    offset = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = data[6] << 21 | data[7] << 14 | data[8] << 7 | data[9]
+        offset = 10 + size + (10 if data[5] & 0x10 else 0)
+
+    samples = 0
+    sample_rate = None
+    first = True
+    end = len(data) - 4
+    while offset <= end:
+        info = _frame_info(struct.unpack_from(">I", data, offset)[0])
+        if info is None:
+            if data[offset : offset + 3] == b"TAG":  # ID3v1 at the end of the file
+                break
+            offset += 1  # resync
+            continue
+        length, frame_samples, rate, side_info = info
+        if first:
+            first = False
+            tag = offset + 4 + side_info
+            if (
+                data[tag : tag + 4] in (b"Xing", b"Info")
+                and len(data) >= tag + 12
+                and data[tag + 7] & 1
+            ):
+                frames = struct.unpack_from(">I", data, tag + 8)[0]
+                return frames * frame_samples / rate
+            if data[offset + 36 : offset + 40] == b"VBRI" and len(data) >= offset + 54:
+                frames = struct.unpack_from(">I", data, offset + 50)[0]
+                return frames * frame_samples / rate
+        samples += frame_samples
+        sample_rate = rate
+        offset += length
+    if sample_rate is None:
+        return None
+    return samples / sample_rate
+
+
+def wav_duration(data: bytes) -> Optional[float]:
+    """Returns the duration of RIFF/WAVE data from its fmt and data chunks, or None."""
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    offset = 12
+    byte_rate = None
+    while offset + 8 <= len(data):
+        chunk_id = data[offset : offset + 4]
+        chunk_size = struct.unpack_from("<I", data, offset + 4)[0]
+        body = offset + 8
+        if chunk_id == b"fmt " and chunk_size >= 16:
+            byte_rate = struct.unpack_from("<I", data, body + 8)[0]
+        elif chunk_id == b"data" and byte_rate:
+            # Streamed files leave the size open, the data then runs to the end of the file
+            size = min(chunk_size, len(data) - body)
+            return size / byte_rate
+        offset = body + chunk_size + (chunk_size & 1)
+    return None
+
+
+@lru_cache(maxsize=4096)
+def _duration(path: str, mtime_ns: int, size: int) -> float:
+    with open(path, "rb") as f:
+        data = f.read()
+    duration = wav_duration(data) if data[:4] == b"RIFF" else mp3_duration(data)
+    if duration is None:
+        # Not a file the header parsers understand, ask ffmpeg
+        duration = float(ffmpeg.probe(path)["format"]["duration"])
+    return duration
+
+
+def get_duration(path: str) -> float:
+    """Returns the duration of an MP3 or WAV file in seconds.
+
+    The headers are parsed in process, ffprobe is only started for other formats. Results are
+    cached by path, modification time and size, so rewritten files are measured again.
+
+    Raises:
+        OSError: If the file can't be read
+        ffmpeg.Error: If the file isn't MP3 or WAV and ffprobe can't read it either
+    """
+    stat = os.stat(path)
+    return _duration(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,123 @@
+import json
+import os
+import subprocess
+import threading
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+import ffmpeg
+
+from utils.console import print_substep
+
+BACKGROUNDS_DIR = "assets/backgrounds"
+INDEX_FILE = f"{BACKGROUNDS_DIR}/index.json"
+
+_lock = threading.Lock()
+_index: Optional[Dict[str, dict]] = None
+
+
+def _load() -> Dict[str, dict]:
+    global _index
+    if _index is None:
+        try:
+            with open(INDEX_FILE) as f:
+                _index = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            _index = {}
+    return _index
+
+
+def _save() -> None:
+    tmp = f"{INDEX_FILE}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(_index, f)
+    os.replace(tmp, INDEX_FILE)
+
+
+def _keyframes(path: str) -> List[float]:
+    """Returns the timestamps of the keyframes of the first video stream, read from the packets without decoding."""
+    result = subprocess.run(
+        [
+            "ffprobe", "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,flags",
+            "-of", "csv=p=0",
+            path,
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframes.append(float(pts_time))
+    return sorted(keyframes)
+
+
+def _probe(path: str) -> dict:
+    info = ffmpeg.probe(path)
+    entry = {
+        "duration": float(info["format"]["duration"]),
+        "size": os.path.getsize(path),
+        "mtime": os.path.getmtime(path),
+    }
+    video = next((s for s in info["streams"] if s["codec_type"] == "video"), None)
+    audio = next((s for s in info["streams"] if s["codec_type"] == "audio"), None)
+    if video is not None:
+        entry["video_codec"] = video["codec_name"]
+        entry["width"] = video["width"]
+        entry["height"] = video["height"]
+        entry["keyframes"] = _keyframes(path)
+    if audio is not None:
+        entry["audio_codec"] = audio["codec_name"]
+    return entry
+
+
+def get_entry(path: str) -> dict:
+    """Returns the index entry of a background file, probing it first if it's new or changed.
+
+    Returns:
+        dict: duration, size and mtime, for videos also video_codec, width, height and keyframes,
+        for files with audio audio_codec
+    """
+    with _lock:
+        entry = _load().get(path)
+        if (
+            entry is not None
+            and entry["size"] == os.path.getsize(path)
+            and entry["mtime"] == os.path.getmtime(path)
+        ):
+            return entry
+    print_substep(f"Indexing background {path}...")
+    entry = _probe(path)
+    with _lock:
+        _load()[path] = entry
+        _save()
+    return entry
+
+
+def build_index() -> None:
+    """Indexes every downloaded background video and audio that isn't indexed yet."""
+    for kind in ("video", "audio"):
+        directory = f"{BACKGROUNDS_DIR}/{kind}"
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            path = f"{directory}/{name}"
+            if name.endswith((".part", ".ytdl", ".lock")) or not os.path.isfile(path):
+                continue
+            try:
+                get_entry(path)
+            except (ffmpeg.Error, subprocess.CalledProcessError) as e:
+                print_substep(f"Couldn't index {path}: {e}", style="bold red")
+
+
+def snap_to_keyframe(entry: dict, time: float) -> float:
+    """Returns the last keyframe at or before time, so seeking there needs no decoding of skipped frames."""
+    keyframes = entry.get("keyframes")
+    if not keyframes:
+        return time
+    index = bisect_right(keyframes, time)
+    return keyframes[index - 1] if index else keyframes[0]
@@ -0,0 +1,296 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import yt_dlp
+
+from utils.background_index import get_entry
+from utils.background_renditions import schedule_rendition
+from utils.console import print_substep
+
+BACKGROUNDS_DIR = "assets/backgrounds"
+CHECKSUMS_FILE = f"{BACKGROUNDS_DIR}/checksums.json"
+OPTIONS_FILES = {"video": "utils/background_videos.json", "audio": "utils/background_audios.json"}
+YDL_OPTIONS = {
+    "video": {"format": "bestvideo[height<=1080][ext=mp4]"},
+    "audio": {"format": "bestaudio/best", "extract_audio": True},
+}
+
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+VERIFYING = "verifying"
+READY = "ready"
+FAILED = "failed"
+
+# Called as downloader(kind, uri, path, on_progress) and has to leave the file at path.
+# on_progress takes the downloaded and the total bytes, the total may be None.
+Downloader = Callable[[str, str, str, Callable[[int, Optional[int]], None]], None]
+
+
+def yt_dlp_downloader(
+    kind: str, uri: str, path: str, on_progress: Callable[[int, Optional[int]], None]
+) -> None:
+    """Downloads a background from YouTube, continuing the .part file of an interrupted download."""
+
+    def hook(status: dict) -> None:
+        if status["status"] == "downloading":
+            on_progress(
+                status.get("downloaded_bytes") or 0,
+                status.get("total_bytes") or status.get("total_bytes_estimate"),
+            )
+
+    ydl_opts = {
+        **YDL_OPTIONS[kind],
+        "outtmpl": path,
+        "retries": 10,
+        "continuedl": True,
+        "progress_hooks": [hook],
+        "quiet": True,
+        "noprogress": True,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        ydl.download([uri])
+
+
+def load_options(kind: str) -> Dict[str, Tuple[str, str, str]]:
+    """Returns the uri, filename and credit of every background of a kind ("video" or "audio") by name."""
+    with open(OPTIONS_FILES[kind]) as f:
+        options = json.load(f)
+    del options["__comment"]
+    return {name: tuple(option[:3]) for name, option in options.items()}
+
+
+def background_path(kind: str, filename: str, credit: str) -> str:
+    # note: make sure the file name doesn't include an - in it
+    return f"{BACKGROUNDS_DIR}/{kind}/{credit}-{filename}"
+
+
+def sha256sum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Holds an exclusive lock on path across threads and processes, e.g. main.py runs next to the API."""
+    with open(f"{path}.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class BackgroundPrefetcher:
+    """Downloads background videos and audios ahead of the jobs that need them.
+
+    Every download goes through fetch, which holds a file lock per background, so a job that
+    needs a background the prefetcher is downloading waits for that download instead of
+    starting its own. Finished files are recorded in CHECKSUMS_FILE with their size, mtime
+    and SHA-256. A file is hashed again when its mtime changed, or for a verifying prefetch,
+    and downloaded again when it doesn't match. Interrupted downloads are continued by the downloader.
+
+    With a rendition size, prefetch runs also queue the vertical rendition of every background
+    video, see utils/background_renditions.py.
+
+    Args:
+        downloader (Downloader): Fetches a single background, a local stand-in can be passed for tests.
+        checksums_file (str): Where the checksums of the finished downloads are kept.
+        rendition_size (Tuple[int,int], optional): Width and height of the videos, None prepares no renditions.
+    """
+
+    def __init__(
+        self,
+        downloader: Downloader = yt_dlp_downloader,
+        checksums_file: str = CHECKSUMS_FILE,
+        rendition_size: Optional[Tuple[int, int]] = None,
+    ):
+        self.downloader = downloader
+        self.checksums_file = checksums_file
+        self.rendition_size = rendition_size
+        self._lock = threading.Lock()
+        self._status: Dict[str, dict] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def _load_checksums(self) -> Dict[str, dict]:
+        try:
+            with open(self.checksums_file) as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _record_checksum(self, path: str, checksum: str) -> None:
+        with self._lock:
+            # Read again right before writing, other processes may have added entries
+            checksums = self._load_checksums()
+            checksums[path] = {
+                "sha256": checksum,
+                "size": os.path.getsize(path),
+                "mtime": os.path.getmtime(path),
+            }
+            os.makedirs(os.path.dirname(self.checksums_file), exist_ok=True)
+            tmp = f"{self.checksums_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(checksums, f, indent=4)
+            os.replace(tmp, self.checksums_file)
+
+    def _update(self, path: str, **fields) -> None:
+        with self._lock:
+            self._status.setdefault(path, {}).update(fields, updated_at=time.time())
+
+    def _verify(self, path: str, checksum: Optional[Tuple[int, float, str]] = None) -> bool:
+        """Checks a downloaded file against its recorded checksum.
+
+        The file is only hashed if its mtime differs from the recorded one, unless a checksum
+        taken outside the lock is passed, as (size, mtime, sha256) of the file at that time.
+        Files downloaded before checksums were kept are trusted and recorded.
+        """
+        stat = os.stat(path)
+        if checksum is not None and checksum[:2] != (stat.st_size, stat.st_mtime):
+            checksum = None  # the file was replaced since it was hashed
+        recorded = self._load_checksums().get(path)
+        if recorded is None:
+            self._update(path, state=VERIFYING)
+            self._record_checksum(path, checksum[2] if checksum else sha256sum(path))
+            return True
+        if recorded["size"] != stat.st_size:
+            return False
+        if checksum is not None:
+            return checksum[2] == recorded["sha256"]
+        if recorded["mtime"] == stat.st_mtime:
+            return True
+        self._update(path, state=VERIFYING)
+        return sha256sum(path) == recorded["sha256"]
+
+    def fetch(self, kind: str, uri: str, path: str, verify: bool = False) -> bool:
+        """Makes sure a background is on disk and intact, downloading it if needed.
+
+        Args:
+            kind (str): "video" or "audio"
+            uri (str): Where to download the background from
+            path (str): Where the background is stored
+            verify (bool): Hash the file even if its size and mtime match the recorded ones. The
+                hash is taken before the file is locked, so jobs that need it don't wait for it.
+
+        Returns:
+            bool: Whether the background had to be downloaded
+
+        Raises:
+            Exception: Whatever the downloader raises, the status of the background is set to failed
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        checksum = None
+        if verify and os.path.isfile(path):
+            self._update(path, kind=kind, state=VERIFYING)
+            stat = os.stat(path)
+            checksum = (stat.st_size, stat.st_mtime, sha256sum(path))
+        with _file_lock(path):
+            if os.path.isfile(path):
+                if self._verify(path, checksum):
+                    self._update(path, kind=kind, state=READY, error=None)
+                    return False
+                print_substep(f"{path} doesn't match its checksum, downloading it again", style="bold red")
+                os.remove(path)
+
+            self._update(path, kind=kind, state=DOWNLOADING, downloaded_bytes=0, total_bytes=None, error=None)
+            try:
+                self.downloader(
+                    kind,
+                    uri,
+                    path,
+                    lambda downloaded, total: self._update(
+                        path, downloaded_bytes=downloaded, total_bytes=total
+                    ),
+                )
+                if not os.path.isfile(path):
+                    raise FileNotFoundError(f"The download of {uri} didn't produce {path}")
+                self._update(path, state=VERIFYING)
+                self._record_checksum(path, sha256sum(path))
+                get_entry(path)
+            except Exception as e:
+                self._update(path, state=FAILED, error=str(e))
+                raise
+            self._update(path, state=READY)
+            return True
+
+    def selection(self, names: Optional[Dict[str, Iterable[str]]] = None) -> List[Tuple[str, str]]:
+        """Returns the (kind, name) pairs to prefetch, every background when names is None.
+
+        Args:
+            names (dict, optional): Names of the backgrounds by kind, e.g. {"video": ["minecraft"]}
+
+        Raises:
+            KeyError: If a kind or name isn't in the background options
+        """
+        if names is None:
+            return [(kind, name) for kind in OPTIONS_FILES for name in load_options(kind)]
+        pairs = []
+        for kind, kind_names in names.items():
+            options = load_options(kind)
+            for name in kind_names:
+                if name not in options:
+                    raise KeyError(f"Unknown background {kind} {name}")
+                pairs.append((kind, name))
+        return pairs
+
+    def prefetch(self, names: Optional[Dict[str, Iterable[str]]] = None, verify: bool = False) -> bool:
+        """Starts downloading and verifying the selected backgrounds in a background thread.
+
+        Backgrounds on disk are only hashed if their size or mtime changed, or with verify.
+
+        Returns:
+            bool: False if a prefetch is already running
+        """
+        pairs = self.selection(names)
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(
+                target=self._run, args=(pairs, verify), name="background-prefetch", daemon=True
+            )
+            self._thread.start()
+        return True
+
+    def _run(self, pairs: List[Tuple[str, str]], verify: bool) -> None:
+        for kind, name in pairs:
+            uri, filename, credit = load_options(kind)[name]
+            self._update(background_path(kind, filename, credit), kind=kind, name=name, state=QUEUED)
+        for kind, name in pairs:
+            uri, filename, credit = load_options(kind)[name]
+            path = background_path(kind, filename, credit)
+            try:
+                self.fetch(kind, uri, path, verify=verify)
+            except Exception as e:
+                print_substep(f"Couldn't prefetch background {kind} {name}: {e}", style="bold red")
+                continue
+            if kind == "video" and self.rendition_size is not None:
+                schedule_rendition(path, *self.rendition_size)
+
+    def status(self) -> dict:
+        """Returns whether a prefetch is running and the state of every background seen so far."""
+        with self._lock:
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "backgrounds": {path: dict(status) for path, status in self._status.items()},
+            }
+
+
+_prefetcher: Optional[BackgroundPrefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> BackgroundPrefetcher:
+    """Returns the background prefetcher of this process."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = BackgroundPrefetcher()
+        return _prefetcher
@@ -0,0 +1,167 @@
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set
+
+from utils.background_index import get_entry
+from utils.console import print_step, print_substep
+
+RENDITIONS_DIR = "assets/backgrounds/vertical"
+KEYFRAME_INTERVAL = 1  # seconds between keyframes, bounds how much a seek has to decode
+STALE_TMP_AGE = 10 * 60  # seconds an unfinished encode may go without writing before it's removed
+# Set to "0" for main.py processes of the API, the API prepares the renditions itself
+PREPARE_RENDITIONS_ENV = "RVG_PREPARE_RENDITIONS"
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_lock = threading.Lock()
+# Renditions are encoded one at a time, next to the renders, by a single thread
+_preparer: Optional[ThreadPoolExecutor] = None
+_pending: Set[str] = set()
+
+
+def rendition_path(source: str, width: int, height: int) -> str:
+    """Returns where the vertical rendition of a background video at the given size is stored."""
+    return f"{RENDITIONS_DIR}/{width}x{height}/{os.path.basename(source)}"
+
+
+def get_rendition(source: str, width: int, height: int) -> Optional[str]:
+    """Returns the vertical rendition of a background video, or None if it isn't prepared
+    or is older than its source."""
+    path = rendition_path(source, width, height)
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(source):
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def clean_stale_tmp() -> int:
+    """Removes the temporary files of encodes that were interrupted, e.g. by killing main.py.
+
+    A file is stale when the process that wrote it is gone or it wasn't written to for
+    STALE_TMP_AGE seconds.
+
+    Returns:
+        int: How many files were removed
+    """
+    removed = 0
+    for directory, _, names in os.walk(RENDITIONS_DIR):
+        for name in names:
+            match = re.search(r"\.(\d+)\.tmp\.mp4$", name)
+            if not match:
+                continue
+            path = os.path.join(directory, name)
+            try:
+                pid = int(match.group(1))
+                if (pid != os.getpid() and not _pid_alive(pid)) or (
+                    time.time() - os.path.getmtime(path) > STALE_TMP_AGE
+                ):
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
+
+
+def prepare_rendition(source: str, width: int, height: int) -> str:
+    """Crops and scales a background video to the output size once and stores it as a rendition.
+
+    The rendition has no audio and a keyframe every KEYFRAME_INTERVAL seconds, so the final
+    render only has to seek into it and overlay the images, instead of cropping and scaling
+    the full resolution source for every video. Preparing the same rendition from several
+    threads encodes it once.
+
+    Args:
+        source (str): The downloaded background video
+        width (int): Width of the final video
+        height (int): Height of the final video
+
+    Returns:
+        str: Path of the rendition
+
+    Raises:
+        subprocess.CalledProcessError: If ffmpeg can't encode the rendition
+    """
+    path = rendition_path(source, width, height)
+    with _locks_lock:
+        lock = _locks.setdefault(path, threading.Lock())
+    with lock:
+        if get_rendition(source, width, height):
+            return path
+        clean_stale_tmp()
+        print_step(f"Preparing a {width}x{height} rendition of {os.path.basename(source)} 🎞️")
+        print_substep("This is only done once per background, videos use the source until it's ready")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp.mp4"
+        cmd = [
+            "ffmpeg", "-y", "-v", "error",
+            "-i", source,
+            "-an",
+            "-vf", f"crop=ih*({width}/{height}):ih,scale={width}:{height},setsar=1",
+            "-c:v", "libx264",
+            "-preset", "veryfast",
+            "-crf", "18",
+            "-pix_fmt", "yuv420p",
+            "-force_key_frames", f"expr:gte(t,n_forced*{KEYFRAME_INTERVAL})",
+            "-sc_threshold", "0",
+            "-movflags", "+faststart",
+            tmp,
+        ]
+        try:
+            subprocess.run(cmd, capture_output=True, text=True, check=True)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        get_entry(path)
+        print_substep("Background rendition prepared successfully! 🎉", style="bold green")
+        return path
+
+
+def _prepare_scheduled(source: str, width: int, height: int) -> None:
+    try:
+        prepare_rendition(source, width, height)
+    except Exception as e:
+        error = getattr(e, "stderr", None) or e
+        print_substep(
+            f"Couldn't prepare the rendition of {source}, renders keep using the source: {error}",
+            style="bold red",
+        )
+    finally:
+        with _locks_lock:
+            _pending.discard(rendition_path(source, width, height))
+
+
+def schedule_rendition(source: str, width: int, height: int) -> bool:
+    """Prepares the rendition of a background video in a background thread of this process.
+
+    Renders use the source until the rendition is ready, so no job waits for the encode.
+    The renditions are encoded one after another, each of them once.
+
+    Returns:
+        bool: Whether the preparation was queued, False if the rendition is ready or already queued
+    """
+    global _preparer
+    path = rendition_path(source, width, height)
+    with _locks_lock:
+        if path in _pending or get_rendition(source, width, height):
+            return False
+        if _preparer is None:
+            _preparer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="background-rendition")
+        _pending.add(path)
+    _preparer.submit(_prepare_scheduled, source, width, height)
+    return True
@@ -0,0 +1,269 @@
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+from playwright.async_api import Browser, BrowserContext, ViewportSize, async_playwright
+
+from utils import settings
+from utils.console import print_substep
+from utils.playwright import clear_cookie_by_name
+
+STORAGE_STATE_FILE = "assets/browser/storage_state.json"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
+LOGIN_TIMEOUT = 15  # seconds to wait for the session cookie after submitting the login form
+MAX_IDLE_CONTEXTS = 4  # idle contexts kept per set of context options
+PAGES_PER_CONTEXT = 50  # contexts are replaced after this many pages to keep memory in check
+
+
+class LoginError(Exception):
+    """Reddit rejected the credentials in the config."""
+
+
+class _PooledContext:
+    def __init__(self, context: BrowserContext):
+        self.context = context
+        self.pages = 0
+        self.closed = False
+        context.on("close", lambda _: setattr(self, "closed", True))
+
+
+class BrowserPool:
+    """A long-lived headless Chromium shared by every screenshot run of the process.
+
+    Playwright objects belong to the event loop that created them, so the browser lives in
+    an asyncio loop on its own thread and callers submit coroutines with run. The login is
+    done once and its storage state is written to STORAGE_STATE_FILE, so new contexts and
+    later processes start out logged in. Contexts are pooled per set of options, checked
+    before they are handed out and replaced after PAGES_PER_CONTEXT pages.
+    """
+
+    def __init__(self, storage_state_file: str = STORAGE_STATE_FILE):
+        self.storage_state_file = storage_state_file
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._playwright = None
+        self._browser: Optional[Browser] = None
+        self._idle: Dict[Tuple, List[_PooledContext]] = {}
+        self._login_lock: Optional[asyncio.Lock] = None
+
+    def start(self) -> None:
+        """Starts the event loop thread, the browser itself is launched on first use."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self._loop.run_forever, name="browser-pool", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.close)
+
+    def run(self, coroutine):
+        """Runs the coroutine on the loop of the pool and returns its result."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def warm(self) -> None:
+        """Launches the browser and logs in ahead of the first screenshot."""
+        self.run(self._warm())
+
+    def close(self) -> None:
+        if self._loop is None or not self._loop.is_running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close(), self._loop).result(timeout=30)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _warm(self) -> None:
+        await self._ensure_browser()
+        await self._ensure_login()
+
+    async def _close(self) -> None:
+        for contexts in self._idle.values():
+            for pooled in contexts:
+                await self._discard(pooled)
+        self._idle.clear()
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def _ensure_browser(self) -> Browser:
+        if self._browser is not None and self._browser.is_connected():
+            return self._browser
+        if self._browser is not None:
+            print_substep("Headless browser disconnected, relaunching...", style="yellow")
+            self._idle.clear()
+        if self._playwright is None:
+            self._playwright = await async_playwright().start()
+        print_substep("Launching Headless Browser...")
+        # headless=False will show the browser for debugging purposes
+        self._browser = await self._playwright.chromium.launch(headless=True)
+        return self._browser
+
+    def _login_valid(self) -> bool:
+        try:
+            with open(self.storage_state_file) as f:
+                cookies = json.load(f)["cookies"]
+        except (OSError, KeyError, json.JSONDecodeError):
+            return False
+        now = time.time()
+        return any(
+            cookie["name"] == "reddit_session" and (cookie["expires"] == -1 or cookie["expires"] > now)
+            for cookie in cookies
+        )
+
+    async def _ensure_login(self) -> None:
+        if self._login_lock is None:
+            self._login_lock = asyncio.Lock()
+        async with self._login_lock:
+            if not self._login_valid():
+                await self._login()
+
+    async def _login(self) -> None:
+        print_substep("Logging in to Reddit...")
+        browser = await self._ensure_browser()
+        context = await browser.new_context(
+            viewport=ViewportSize(width=1920, height=1080), user_agent=USER_AGENT
+        )
+        try:
+            page = await context.new_page()
+            await page.goto("https://www.reddit.com/login", timeout=0)
+            await page.wait_for_load_state()
+
+            await page.locator('input[name="username"]').fill(
+                settings.config["reddit"]["creds"]["username"]
+            )
+            await page.locator('input[name="password"]').fill(
+                settings.config["reddit"]["creds"]["password"]
+            )
+            await page.get_by_role("button", name="Log In").click()
+
+            # Wait for the session cookie instead of a fixed delay
+            deadline = time.monotonic() + LOGIN_TIMEOUT
+            while time.monotonic() < deadline:
+                if any(cookie["name"] == "reddit_session" for cookie in await context.cookies()):
+                    break
+                login_error_div = page.locator(".AnimatedForm__errorMessage").first
+                if await login_error_div.is_visible() and (await login_error_div.inner_text()).strip():
+                    raise LoginError("Reddit rejected the credentials")
+                await asyncio.sleep(0.25)
+            else:
+                raise LoginError(f"Reddit didn't log in within {LOGIN_TIMEOUT} seconds")
+
+            await page.wait_for_load_state()
+            # Handle the redesign
+            # Check if the redesign optout cookie is set
+            if await page.locator("#redesign-beta-optin-btn").is_visible():
+                # Clear the redesign optout cookie
+                await clear_cookie_by_name(context, "redesign_optout")
+
+            os.makedirs(os.path.dirname(self.storage_state_file), exist_ok=True)
+            await context.storage_state(path=self.storage_state_file)
+        finally:
+            await context.close()
+
+    async def _new_context(self, options: Tuple) -> _PooledContext:
+        browser = await self._ensure_browser()
+        await self._ensure_login()
+        locale, width, height, device_scale_factor, cookie_file = options
+        context = await browser.new_context(
+            locale=locale,
+            color_scheme="dark",
+            viewport=ViewportSize(width=width, height=height),
+            device_scale_factor=device_scale_factor,
+            user_agent=USER_AGENT,
+            storage_state=self.storage_state_file,
+        )
+        if cookie_file:
+            with open(cookie_file, encoding="utf-8") as f:
+                await context.add_cookies(json.load(f))  # load preference cookies
+        return _PooledContext(context)
+
+    async def _healthy(self, pooled: _PooledContext) -> bool:
+        if pooled.closed or self._browser is None or not self._browser.is_connected():
+            return False
+        try:
+            await asyncio.wait_for(pooled.context.cookies(), timeout=5)
+        except Exception:
+            return False
+        return True
+
+    async def _discard(self, pooled: _PooledContext) -> None:
+        try:
+            await pooled.context.close()
+        except Exception:
+            pass
+
+    @asynccontextmanager
+    async def page(
+        self,
+        locale: str,
+        width: int,
+        height: int,
+        device_scale_factor: int,
+        cookie_file: Optional[str] = None,
+    ):
+        """Yields a fresh page in a pooled, logged in context with the given options.
+
+        Args:
+            locale (str): Locale of the context, e.g. en-us
+            width (int): Viewport width
+            height (int): Viewport height
+            device_scale_factor (int): Device scale factor of the context
+            cookie_file (str, optional): JSON file with preference cookies, e.g. the theme
+        """
+        options = (locale, width, height, device_scale_factor, cookie_file)
+        idle = self._idle.setdefault(options, [])
+        pooled = None
+        while idle and pooled is None:
+            candidate = idle.pop()
+            if await self._healthy(candidate):
+                pooled = candidate
+            else:
+                await self._discard(candidate)
+        if pooled is None:
+            pooled = await self._new_context(options)
+
+        page = await pooled.context.new_page()
+        pooled.pages += 1
+        healthy = True
+        try:
+            yield page
+        finally:
+            try:
+                await page.close()
+            except Exception:
+                healthy = False
+            if (
+                healthy
+                and not pooled.closed
+                and pooled.pages < PAGES_PER_CONTEXT
+                and len(self._idle[options]) < MAX_IDLE_CONTEXTS
+            ):
+                self._idle[options].append(pooled)
+            else:
+                await self._discard(pooled)
+
+
+_pool: Optional[BrowserPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """Returns the browser pool of this process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+        return _pool
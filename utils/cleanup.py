@@ -2,20 +2,22 @@ import os
 import shutil
 from os.path import exists
 
+from utils.workdir import temp_path
+
 
 def _listdir(d):  # listdir with full path
     return [os.path.join(d, f) for f in os.listdir(d)]
 
 
 def cleanup(reddit_id) -> int:
-    """Deletes all temporary assets in assets/temp
+    """Deletes all temporary assets of the thread in assets/temp
 
     Returns:
         int: How many files were deleted
     """
     # Try both possible directory paths
     directories = [
-        f"assets/temp/{reddit_id}/",  # Current working directory
+        f"{temp_path(reddit_id)}/",  # Current working directory
         f"../assets/temp/{reddit_id}/"  # Parent directory
     ]
     
@@ -0,0 +1,106 @@
+import os
+import re
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from utils.fonts import get_font, getheight
+
+# Colors of the card background, the body text and the author line per theme
+THEMES: Dict[str, Dict[str, tuple]] = {
+    "dark": {"background": (26, 26, 27, 255), "text": (215, 218, 220), "meta": (129, 131, 132)},
+    "light": {"background": (255, 255, 255, 255), "text": (28, 28, 28), "meta": (120, 124, 126)},
+    "transparent": {"background": (0, 0, 0, 0), "text": (255, 255, 255), "meta": (220, 220, 220)},
+}
+CARD_WIDTH = 1200
+PADDING = 40
+BODY_SIZE = 44
+META_SIZE = 32
+LINE_SPACING = 12
+
+
+def format_score(score: int) -> str:
+    """Formats a comment score the way reddit does, e.g. 1.2k points"""
+    if abs(score) >= 1000:
+        return f"{score / 1000:.1f}k points".replace(".0k", "k")
+    return f"{score} point{'' if abs(score) == 1 else 's'}"
+
+
+def clean_markdown(text: str) -> str:
+    """Removes the markdown that would show up literally on the card."""
+    text = re.sub(r"\[([^\]]+)\]\([^)]+\)", r"\1", text)  # [link](url) -> link
+    text = re.sub(r"(\*\*|__|~~|\*|`|^>\s?|^#+\s)", "", text, flags=re.MULTILINE)
+    return text.replace("&amp;", "&").replace("&lt;", "<").replace("&gt;", ">")
+
+
+def wrap_text(text: str, font: ImageFont.FreeTypeFont, width: int) -> List[str]:
+    """Wraps text to lines no wider than width pixels, keeping the paragraphs of the comment."""
+    lines = []
+    for paragraph in re.split(r"\n\s*\n", text.strip()):
+        line = ""
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if line and font.getlength(candidate) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+        lines.append("")  # blank line between paragraphs
+    return lines[:-1]
+
+
+def render_comment_card(
+    path: str, author: str, score: int, body: str, theme: str = "dark", compress_level: int = 6
+) -> Tuple[int, int]:
+    """Renders a reddit style comment card to a PNG.
+
+    Only plain values are passed in, so this can run in the render pool.
+
+    Args:
+        path (str): Where to save the PNG, e.g. assets/temp/<reddit_id>/png/comment_0.png
+        author (str): Name of the commenter without the u/ prefix
+        score (int): Score of the comment
+        body (str): The comment text, may contain markdown
+        theme (str): dark, light or transparent
+        compress_level (int): zlib level of the PNG, 0 is fastest
+
+    Returns:
+        Tuple[int,int]: Size of the card
+    """
+    colors = THEMES.get(theme, THEMES["dark"])
+    transparent = colors["background"][3] == 0
+    body_font = get_font(os.path.join("fonts", "Roboto-Regular.ttf"), BODY_SIZE)
+    meta_font = get_font(os.path.join("fonts", "Roboto-Bold.ttf"), META_SIZE)
+
+    text_width = CARD_WIDTH - 2 * PADDING
+    lines = wrap_text(clean_markdown(body), body_font, text_width)
+    line_height = getheight(body_font, "Ag") + LINE_SPACING
+    meta_height = getheight(meta_font, "Ag")
+    height = 2 * PADDING + meta_height + LINE_SPACING * 2 + line_height * len(lines)
+
+    image = Image.new("RGBA", (CARD_WIDTH, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    if not transparent:
+        draw.rounded_rectangle(
+            (0, 0, CARD_WIDTH - 1, height - 1), radius=24, fill=colors["background"]
+        )
+    # Text on the transparent theme gets an outline so it stays readable on any background
+    outline = {"stroke_width": 3, "stroke_fill": "black"} if transparent else {}
+
+    y = PADDING
+    draw.text(
+        (PADDING, y),
+        f"u/{author} · {format_score(score)}",
+        font=meta_font,
+        fill=colors["meta"],
+        **outline,
+    )
+    y += meta_height + LINE_SPACING * 2
+    for line in lines:
+        if line:
+            draw.text((PADDING, y), line, font=body_font, fill=colors["text"], **outline)
+        y += line_height
+
+    image.save(path, compress_level=compress_level)
+    return image.size
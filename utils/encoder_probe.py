@@ -0,0 +1,155 @@
+import json
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, Optional
+
+from utils.intel_gpu_init import check_ffmpeg_hardware_support
+from video_creation.render_graph import ENCODERS, HARDWARE_ENCODERS
+
+PROBE_FILE = "assets/encoder_probe.json"
+SOFTWARE_ENCODER = "libx264"
+PROBE_TIMEOUT = 30
+
+_lock = threading.Lock()
+_result: Optional[dict] = None
+
+
+def _probe_command(backend: str) -> list:
+    """A tiny synthetic clip pushed through the same upload and encoder flags as a real render."""
+    encoder = ENCODERS[backend]
+    return [
+        "ffmpeg", "-hide_banner", "-y",
+        *encoder["global_args"],
+        "-f", "lavfi", "-i", "testsrc=duration=0.5:size=320x240:rate=30",
+        "-vf", ",".join(encoder["upload"]),
+        *encoder["codec_args"],
+        "-f", "null", "-",
+    ]
+
+
+def _ffmpeg_version() -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-version"], capture_output=True, text=True, timeout=PROBE_TIMEOUT
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout.splitlines()[0] if result.stdout else None
+
+
+def _test_encode(backend: str) -> Dict[str, object]:
+    started = time.perf_counter()
+    try:
+        result = subprocess.run(
+            _probe_command(backend), capture_output=True, text=True, timeout=PROBE_TIMEOUT
+        )
+    except subprocess.TimeoutExpired:
+        return {"ok": False, "error": f"timed out after {PROBE_TIMEOUT}s"}
+    except OSError as e:
+        return {"ok": False, "error": str(e)}
+    if result.returncode != 0:
+        return {"ok": False, "error": result.stderr[-500:]}
+    return {"ok": True, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def _save(result: dict) -> None:
+    os.makedirs(os.path.dirname(PROBE_FILE), exist_ok=True)
+    tmp = f"{PROBE_FILE}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(result, f, indent=4)
+    os.replace(tmp, PROBE_FILE)
+
+
+def _load() -> Optional[dict]:
+    try:
+        with open(PROBE_FILE) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def probe_encoders(clear_failures: bool = False) -> dict:
+    """Test-encodes a short synthetic clip with every backend and stores the result.
+
+    Hardware backends ffmpeg wasn't built with are skipped without launching an encode, so
+    are backends that failed a real render (see mark_failed), unless clear_failures is set.
+    The first working backend in ENCODERS order becomes the one renders use, libx264 is the
+    last resort. The result is written to PROBE_FILE so main.py processes don't have to probe again.
+
+    Args:
+        clear_failures (bool): Test the backends that failed a real render again as well
+
+    Returns:
+        dict: The chosen backend, the result and failures per backend, the ffmpeg version and probe time.
+    """
+    global _result
+    with _lock:
+        previous = _result if _result is not None else _load()
+        failed = {} if clear_failures or previous is None else dict(previous.get("failed", {}))
+        intel_encoders, _ = check_ffmpeg_hardware_support()
+        available = " ".join(intel_encoders)
+        backends = {}
+        for backend in HARDWARE_ENCODERS:
+            if backend in failed:
+                backends[backend] = {"ok": False, "error": "failed a render: " + failed[backend]["error"]}
+                continue
+            if f"h264_{backend}" not in available:
+                backends[backend] = {"ok": False, "error": f"h264_{backend} not built into ffmpeg"}
+                continue
+            backends[backend] = _test_encode(backend)
+        backends[SOFTWARE_ENCODER] = _test_encode(SOFTWARE_ENCODER)
+
+        _result = {
+            "backend": _choose(backends),
+            "backends": backends,
+            "failed": failed,
+            "ffmpeg_version": _ffmpeg_version(),
+            "probed_at": time.time(),
+        }
+        _save(_result)
+        return _result
+
+
+def _choose(backends: Dict[str, dict]) -> str:
+    return next(
+        (backend for backend in HARDWARE_ENCODERS if backends.get(backend, {}).get("ok")),
+        SOFTWARE_ENCODER,
+    )
+
+
+def probe_result() -> Optional[dict]:
+    """Returns the last probe result of this process or the one stored on disk, if any."""
+    global _result
+    with _lock:
+        if _result is None:
+            _result = _load()
+        return _result
+
+
+def preferred_backend() -> str:
+    """Returns the encoder backend renders should use, probing first if there's no result yet."""
+    result = probe_result()
+    if result is None:
+        result = probe_encoders()
+    return result["backend"]
+
+
+def mark_failed(backend: str, error: str = "") -> None:
+    """Excludes a backend after it failed a real render, renders use the next working one from then on.
+
+    The synthetic probe clip usually still passes on a backend that fails real renders, so
+    the backend stays excluded, across restarts as well, until probe_encoders is called
+    with clear_failures, i.e. POST /encoders/probe.
+    """
+    global _result
+    with _lock:
+        if _result is None:
+            _result = _load()
+        if _result is None:
+            return
+        _result.setdefault("failed", {})[backend] = {"error": error[-500:], "failed_at": time.time()}
+        _result["backends"][backend] = {"ok": False, "error": error[-500:]}
+        _result["backend"] = _choose(_result["backends"])
+        _save(_result)
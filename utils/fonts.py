@@ -1,13 +1,24 @@
-from PIL.ImageFont import FreeTypeFont, ImageFont
+from functools import lru_cache
 
+from PIL import ImageFont
+from PIL.ImageFont import FreeTypeFont, ImageFont as BitmapFont
 
-def getsize(font: ImageFont | FreeTypeFont, text: str):
+
+@lru_cache(maxsize=64)
+def get_font(path: str, size: int) -> FreeTypeFont:
+    """Returns the font at path in the given size, every font is only loaded once per process."""
+    return ImageFont.truetype(path, size)
+
+
+@lru_cache(maxsize=4096)
+def getsize(font: BitmapFont | FreeTypeFont, text: str):
+    # Fonts from get_font are long-lived, so measurements are cached per font and text
     left, top, right, bottom = font.getbbox(text)
     width = right - left
     height = bottom - top
     return width, height
 
 
-def getheight(font: ImageFont | FreeTypeFont, text: str):
+def getheight(font: BitmapFont | FreeTypeFont, text: str):
     _, height = getsize(font, text)
     return height
@@ -2,11 +2,14 @@ import os
 import re
 import textwrap
 
-from PIL import Image, ImageDraw, ImageFont
-from rich.progress import track
+from PIL import Image, ImageDraw, ImageFilter
 
 from TTS.engine_wrapper import process_text
-from utils.fonts import getheight, getsize
+from utils import settings
+from utils.fonts import get_font, getheight, getsize
+from utils.progress import track
+from utils.render_pool import render_all
+from utils.workdir import temp_path
 
 
 def draw_multiple_line_text(
@@ -23,37 +26,22 @@ def draw_multiple_line_text(
     for line in lines:
         line_width, line_height = getsize(font, line)
         if transparent:
-            shadowcolor = "black"
-            for i in range(1, 5):
-                draw.text(
-                    ((image_width - line_width) / 2 - i, y - i),
-                    line,
-                    font=font,
-                    fill=shadowcolor,
-                )
-                draw.text(
-                    ((image_width - line_width) / 2 + i, y - i),
-                    line,
-                    font=font,
-                    fill=shadowcolor,
-                )
-                draw.text(
-                    ((image_width - line_width) / 2 - i, y + i),
-                    line,
-                    font=font,
-                    fill=shadowcolor,
-                )
-                draw.text(
-                    ((image_width - line_width) / 2 + i, y + i),
-                    line,
-                    font=font,
-                    fill=shadowcolor,
-                )
+            draw_shadow(image, ((image_width - line_width) / 2, y), line, font)
         draw.text(((image_width - line_width) / 2, y), line, font=font, fill=text_color)
         y += line_height + padding
 
 
-
+def draw_shadow(image, xy, text, font, offset=4, shadowcolor="black") -> None:
+    """
+    Draw a shadow reaching offset pixels around the text, for text on transparent images.
+    The text is drawn once into a mask that is dilated, instead of drawing it at every offset.
+    """
+    x, y = xy
+    _, _, right, bottom = font.getbbox(text)
+    mask = Image.new("L", (right + 2 * offset, bottom + 2 * offset), 0)
+    ImageDraw.Draw(mask).text((offset, offset), text, font=font, fill=255)
+    mask = mask.filter(ImageFilter.MaxFilter(2 * offset + 1))
+    image.paste(shadowcolor, (int(x - offset), int(y - offset)), mask)
 
 
 def draw_single_word_text(image, word, font, text_color, padding, transparent=False) -> None:
@@ -67,12 +55,7 @@ def draw_single_word_text(image, word, font, text_color, padding, transparent=Fa
     x = (image_width / 2) - (word_width / 2)
     
     if transparent:
-        shadowcolor = "black"
-        for i in range(1, 5):
-            draw.text((x - i, y - i), word, font=font, fill=shadowcolor)
-            draw.text((x + i, y - i), word, font=font, fill=shadowcolor)
-            draw.text((x - i, y + i), word, font=font, fill=shadowcolor)
-            draw.text((x + i, y + i), word, font=font, fill=shadowcolor)
+        draw_shadow(image, (x, y), word, font)
     
     draw.text((x, y), word, font=font, fill=text_color)
 
@@ -81,6 +64,18 @@ def draw_single_word_text(image, word, font, text_color, padding, transparent=Fa
 
 
 
+def render_sentence_image(
+    path, text, size, theme, txtclr, padding, font_path, transparent, compress_level
+) -> None:
+    """
+    Render a single sentence image, runs in the render pool
+    """
+    font = get_font(font_path, 100)
+    image = Image.new("RGBA", size, theme)
+    draw_multiple_line_text(image, text, font, txtclr, padding, wrap=30, transparent=transparent)
+    image.save(path, compress_level=compress_level)
+
+
 def imagemaker(theme, reddit_obj: dict, txtclr, padding=5, transparent=False) -> None:
     """
     Render Images for video
@@ -89,18 +84,28 @@ def imagemaker(theme, reddit_obj: dict, txtclr, padding=5, transparent=False) ->
     id = re.sub(r"[^\w\s-]", "", reddit_obj["thread_id"])
 
     if transparent:
-        font = ImageFont.truetype(os.path.join("fonts", "Roboto-Black.ttf"), 100)
+        font_path = os.path.join("fonts", "Roboto-Black.ttf")
     else:
-        font = ImageFont.truetype(os.path.join("fonts", "Roboto-Regular.ttf"), 100)
+        font_path = os.path.join("fonts", "Roboto-Regular.ttf")
     size = (1920, 1080)
+    # The images are only read once by ffmpeg, so by default they're barely compressed
+    compress_level = int(settings.config["settings"].get("png_compress_level", 1))
 
-    image = Image.new("RGBA", size, theme)
-
-    for idx, text in track(enumerate(texts), "Rendering Image"):
-        image = Image.new("RGBA", size, theme)
-        text = process_text(text, False)
-        draw_multiple_line_text(image, text, font, txtclr, padding, wrap=30, transparent=transparent)
-        image.save(f"assets/temp/{id}/png/img{idx}.png")
+    jobs = [
+        (
+            f"{temp_path(id)}/png/img{idx}.png",
+            process_text(text, False),
+            size,
+            theme,
+            txtclr,
+            padding,
+            font_path,
+            transparent,
+            compress_level,
+        )
+        for idx, text in track(enumerate(texts), "Rendering Image")
+    ]
+    render_all(render_sentence_image, jobs)
 
 
 
@@ -132,4 +137,4 @@ def imagemaker(theme, reddit_obj: dict, txtclr, padding=5, transparent=False) ->
 #         image = Image.new("RGBA", size, theme)
 #         processed_word = process_text(word, False)  # Process the word if needed
 #         draw_single_word_text(image, processed_word, font, txtclr, padding, transparent=transparent)
-#         image.save(f"assets/temp/{id}/png/img{idx}.png")
\ No newline at end of file
+#         image.save(f"{temp_path(id)}/png/img{idx}.png")
\ No newline at end of file
@@ -0,0 +1,179 @@
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+FINISHED_STATES = (DONE, FAILED)
+
+# Options a /generate request may set, with the pattern their string value has to match
+JOB_PARAMS = {"post_id": re.compile(r"[a-z0-9]{5,10}")}  # a bare reddit id, e.g. 1c2x3yz
+# How the API passes the post_id of a job to a main.py child process
+POST_ID_ENV = "RVG_POST_ID"
+
+
+def validate_params(params: dict) -> dict:
+    """Checks the options of a /generate request.
+
+    Raises:
+        ValueError: If an option is unknown or its value doesn't match its pattern
+    """
+    if not isinstance(params, dict):
+        raise ValueError("The request body has to be a JSON object")
+    unknown = sorted(set(params) - set(JOB_PARAMS))
+    if unknown:
+        raise ValueError(
+            f"Unknown parameters {', '.join(unknown)}, supported are {', '.join(JOB_PARAMS)}"
+        )
+    for name, value in params.items():
+        if value is None:
+            continue
+        if not isinstance(value, str) or not JOB_PARAMS[name].fullmatch(value):
+            raise ValueError(f"{name} has to be a string matching {JOB_PARAMS[name].pattern}")
+    return {name: value for name, value in params.items() if value is not None}
+
+
+class JobQueue:
+    """A persistent FIFO queue of video generation jobs.
+
+    Every job is stored as its own JSON file in ``directory`` so the queue survives restarts.
+    Jobs that were queued or running when the process stopped are queued again on start.
+
+    Args:
+        directory (str): Folder the job files are written to.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._jobs: Dict[str, dict] = {}
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _load(self) -> None:
+        jobs = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                    jobs.append(json.load(f))
+            except (OSError, json.JSONDecodeError):
+                continue  # half written job file, nothing to recover
+        for job in sorted(jobs, key=lambda j: j["created_at"]):
+            self._jobs[job["id"]] = job
+            if job["status"] in (QUEUED, RUNNING):
+                # Only in memory, the file is written once a worker picks the job up again.
+                # A process that merely loads the queue must not rewrite jobs another one runs.
+                job.update(status=QUEUED, stage="queued", progress=0, started_at=None)
+                self._pending.put(job["id"])
+
+    def _save(self, job: dict) -> None:
+        # Write to a temporary file first so a crash never leaves a truncated job behind
+        tmp_path = self._path(job["id"]) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self._path(job["id"]))
+
+    def submit(self, params: Optional[dict] = None) -> dict:
+        """Adds a new job to the end of the queue and returns it."""
+        job = {
+            "id": str(uuid.uuid4()),
+            "status": QUEUED,
+            "stage": "queued",
+            "progress": 0,
+            "params": params or {},
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "result_path": None,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self._save(job)
+        self._pending.put(job["id"])
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def position(self, job_id: str) -> int:
+        """Returns how many queued jobs are ahead of the given one."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job["status"] != QUEUED:
+                return 0
+            return sum(
+                1
+                for other in self._jobs.values()
+                if other["status"] == QUEUED and other["created_at"] < job["created_at"]
+            )
+
+    def next(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Blocks until a job is queued, marks it as running and returns it."""
+        while True:
+            try:
+                job_id = self._pending.get(timeout=timeout)
+            except queue.Empty:
+                return None
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if not job or job["status"] != QUEUED:
+                    continue
+                job.update(status=RUNNING, started_at=time.time())
+                self._save(job)
+                return dict(job)
+
+    def update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return
+            job.update(fields)
+            if fields.get("status") in FINISHED_STATES:
+                job["finished_at"] = time.time()
+            self._save(job)
+
+    @property
+    def running(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job["status"] == RUNNING)
+
+    def prune(self, max_age: float) -> int:
+        """Deletes finished jobs (and their videos) older than max_age seconds.
+
+        Returns:
+            int: How many jobs were deleted
+        """
+        now = time.time()
+        with self._lock:
+            expired = [
+                job
+                for job in self._jobs.values()
+                if job["status"] in FINISHED_STATES and now - (job["finished_at"] or now) > max_age
+            ]
+            for job in expired:
+                del self._jobs[job["id"]]
+                for path in (job.get("result_path"), self._path(job["id"])):
+                    if path and os.path.exists(path):
+                        os.remove(path)
+        return len(expired)
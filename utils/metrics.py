@@ -0,0 +1,231 @@
+import json
+import os
+import resource
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+from utils.workdir import output_path, temp_root
+
+METRIC_PREFIX = "::metric::"
+# Set by the API for main.py child processes, their metrics are sent through stdout
+REPORT_METRICS_ENV = "RVG_REPORT_METRICS"
+
+SECONDS_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+BYTES_BUCKETS = tuple(2**power for power in range(20, 34, 2))  # 1 MiB to 8 GiB
+
+STAGE_HISTOGRAMS = {
+    "wall_seconds": ("rvg_stage_wall_seconds", "Wall time of a pipeline stage", SECONDS_BUCKETS),
+    # CPU and memory can't be told apart per job inside one process, so these two are
+    # process wide. With PIPELINE_MODE=process every job has its own process.
+    "cpu_seconds": (
+        "rvg_stage_process_cpu_seconds",
+        "CPU time of all threads, finished child processes and render pool workers of the process"
+        " during a pipeline stage, jobs running at the same time count into each other's",
+        SECONDS_BUCKETS,
+    ),
+    "peak_rss_bytes": (
+        "rvg_stage_process_peak_rss_bytes",
+        "Peak resident memory of the process since it started, or of its largest child process,"
+        " at the end of a pipeline stage",
+        BYTES_BUCKETS,
+    ),
+    "bytes_written": (
+        "rvg_stage_bytes_written",
+        "Bytes a pipeline stage added to the temp folder and output file of its run",
+        BYTES_BUCKETS,
+    ),
+}
+ENCODER_COUNTER = ("rvg_encoder_attempts_total", "Final render attempts per encoder backend")
+
+
+class Histogram:
+    """A Prometheus style histogram with labels."""
+
+    def __init__(self, name: str, documentation: str, buckets: Iterable[float]):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        # label values -> (bucket counts, sum, count)
+        self._series: Dict[Tuple[Tuple[str, str], ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def expose(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(key, le=_format(bound))} {cumulative}")
+            lines.append(f'{self.name}_bucket{_labels(key, le="+Inf")} {count}')
+            lines.append(f"{self.name}_sum{_labels(key)} {_format(total)}")
+            lines.append(f"{self.name}_count{_labels(key)} {count}")
+        return "\n".join(lines)
+
+
+class Counter:
+    """A Prometheus style counter with labels."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._series: Dict[Tuple[Tuple[str, str], ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        self._series[key] = self._series.get(key, 0) + amount
+
+    def expose(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_labels(key)} {_format(value)}")
+        return "\n".join(lines)
+
+
+def _labels(key: Tuple[Tuple[str, str], ...], **extra) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+_lock = threading.Lock()
+_histograms = {
+    field: Histogram(name, documentation, buckets)
+    for field, (name, documentation, buckets) in STAGE_HISTOGRAMS.items()
+}
+_encoder_attempts = Counter(*ENCODER_COUNTER)
+
+
+def record(event: dict) -> None:
+    """Adds a span or encoder event to the metrics of this process.
+
+    In a main.py child of the API the event is written to stdout and recorded by the API instead.
+    """
+    if os.environ.get(REPORT_METRICS_ENV):
+        print(f"{METRIC_PREFIX}{json.dumps(event)}", flush=True)
+        return
+    with _lock:
+        if event["type"] == "span":
+            for field, histogram in _histograms.items():
+                histogram.observe(event[field], stage=event["stage"])
+        elif event["type"] == "encoder":
+            _encoder_attempts.inc(backend=event["backend"], result=event["result"])
+
+
+def parse_metric(line: str) -> Optional[dict]:
+    """Returns the event of a line written by record, or None."""
+    if not line.startswith(METRIC_PREFIX):
+        return None
+    try:
+        return json.loads(line[len(METRIC_PREFIX) :])
+    except json.JSONDecodeError:
+        return None
+
+
+def count_encoder(backend: str, success: bool) -> None:
+    """Counts a final render attempt with the given encoder backend."""
+    record({"type": "encoder", "backend": backend, "result": "success" if success else "failure"})
+
+
+def expose() -> str:
+    """Returns all metrics in the Prometheus text format."""
+    with _lock:
+        parts = [histogram.expose() for histogram in _histograms.values()]
+        parts.append(_encoder_attempts.expose())
+    return "\n".join(parts) + "\n"
+
+
+_worker_cpu = 0.0  # CPU seconds the render pool workers reported, they are never reaped while running
+
+
+def add_worker_cpu(seconds: float) -> None:
+    """Counts CPU time a worker process of this process used, see utils/render_pool.py"""
+    global _worker_cpu
+    with _lock:
+        _worker_cpu += seconds
+
+
+def _cpu_seconds() -> float:
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    with _lock:
+        workers = _worker_cpu
+    return time.process_time() + children.ru_utime + children.ru_stime + workers
+
+
+def _peak_rss_bytes() -> int:
+    peak = 0
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    return max(peak, children)
+
+
+def _file_sizes() -> Dict[str, int]:
+    sizes = {}
+    for root, _, files in os.walk(temp_root()):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                sizes[path] = os.path.getsize(path)
+            except OSError:
+                continue
+    if output_path() and os.path.exists(output_path()):
+        sizes[output_path()] = os.path.getsize(output_path())
+    return sizes
+
+
+@contextmanager
+def stage_span(stage: str):
+    """Times the pipeline stage run inside the block.
+
+    Records wall time and the bytes the stage added to the temp folder and output file of
+    the run, which are per job, and the CPU time and peak RSS of the whole process, which
+    include the other jobs running at the same time in-process.
+    """
+    sizes_before = _file_sizes()
+    cpu_before = _cpu_seconds()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - started
+        cpu = _cpu_seconds() - cpu_before
+        sizes_after = _file_sizes()
+        bytes_written = sum(
+            max(0, size - sizes_before.get(path, 0)) for path, size in sizes_after.items()
+        )
+        record(
+            {
+                "type": "span",
+                "stage": stage,
+                "wall_seconds": wall,
+                "cpu_seconds": cpu,
+                "peak_rss_bytes": _peak_rss_bytes(),
+                "bytes_written": bytes_written,
+            }
+        )
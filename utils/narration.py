@@ -0,0 +1,48 @@
+import json
+import os
+from typing import List, Optional, Tuple
+
+from utils.audio_duration import get_duration
+
+
+def manifest_path(clip_path: str) -> str:
+    """Returns the manifest that stands in for a clip that was synthesized in parts, e.g. mp3/3.json for mp3/3.mp3"""
+    return os.path.splitext(clip_path)[0] + ".json"
+
+
+def write_manifest(clip_path: str, parts: List[str], silence: float) -> None:
+    """Records the parts of a split clip instead of concatenating them into clip_path.
+
+    Args:
+        clip_path (str): The clip the parts make up, e.g. assets/temp/<reddit_id>/mp3/3.mp3
+        parts (List[str]): The part files in reading order
+        silence (float): Seconds of silence after every part
+    """
+    with open(manifest_path(clip_path), "w") as f:
+        json.dump({"parts": parts, "silence": silence}, f)
+
+
+def clip_exists(clip_path: str) -> bool:
+    return os.path.exists(clip_path) or os.path.exists(manifest_path(clip_path))
+
+
+def clip_segments(clip_path: str) -> List[Tuple[Optional[str], float]]:
+    """Returns the files of a clip with their durations, None standing for silence.
+
+    A clip is either a single file or the parts listed in its manifest, every part followed
+    by the silence of the manifest. The final render reads the segments directly, so split
+    clips are never concatenated to a file of their own.
+
+    Raises:
+        FileNotFoundError: If neither the clip nor its manifest exists
+    """
+    if os.path.exists(clip_path):
+        return [(clip_path, get_duration(clip_path))]
+    with open(manifest_path(clip_path)) as f:
+        manifest = json.load(f)
+    segments = []
+    for part in manifest["parts"]:
+        segments.append((part, get_duration(part)))
+        if manifest["silence"] > 0:
+            segments.append((None, manifest["silence"]))
+    return segments
@@ -1,6 +1,7 @@
 import os
 import re
 import time
+from functools import lru_cache
 from typing import List
 
 import spacy
@@ -9,11 +10,17 @@ from utils.console import print_step
 from utils.voice import sanitize_text
 
 
+@lru_cache(maxsize=1)
+def load_model():
+    """Loads the spacy model once per process."""
+    return spacy.load("en_core_web_sm")
+
+
 # working good
 def posttextparser(obj, *, tried: bool = False) -> List[str]:
     text: str = re.sub("\n", " ", obj)
     try:
-        nlp = spacy.load("en_core_web_sm")
+        nlp = load_model()
     except OSError as e:
         if not tried:
             os.system("python -m spacy download en_core_web_sm")
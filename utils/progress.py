@@ -0,0 +1,80 @@
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterable, Optional
+
+from rich.progress import track as rich_track
+
+PROGRESS_PREFIX = "::progress::"
+
+# Rough share of the total run time each stage starts at. The render stage fills the rest.
+STAGE_START = {
+    "queued": 0,
+    "reddit": 2,
+    "tts": 10,
+    "screenshots": 30,
+    "background": 45,
+    "render": 55,
+    "done": 100,
+}
+
+# In-process runs get their progress through a callback instead of stdout
+_handler: ContextVar[Optional[Callable[[dict], None]]] = ContextVar("progress_handler", default=None)
+
+
+@contextmanager
+def progress_handler(handler: Optional[Callable[[dict], None]]):
+    """Sends every progress report made inside the block to handler instead of stdout."""
+    token = _handler.set(handler)
+    try:
+        yield
+    finally:
+        _handler.reset(token)
+
+
+def report_progress(stage: str, percent: Optional[float] = None, **extra) -> None:
+    """Reports the current stage of the pipeline to whoever is running it.
+
+    The payload goes to the handler set with progress_handler, otherwise a line is written
+    to stdout so the API can follow a ``main.py`` child process.
+
+    Args:
+        stage (str): Name of the current stage, see STAGE_START
+        percent (float, optional): Overall progress in percent. Defaults to the start of the stage.
+        **extra: Additional JSON serializable fields passed along with the progress.
+    """
+    if percent is None:
+        percent = STAGE_START.get(stage, 0)
+    payload = {"stage": stage, "progress": round(min(max(percent, 0), 100), 1), **extra}
+    handler = _handler.get()
+    if handler is not None:
+        handler(payload)
+        return
+    print(f"{PROGRESS_PREFIX}{json.dumps(payload)}", flush=True)
+
+
+def track(sequence: Iterable, description: str = "Working...", total: Optional[float] = None) -> Iterable:
+    """rich.progress.track for the pipeline, without the progress bar in runs that have a progress handler.
+
+    rich allows one live display per console at a time, so two in-process jobs showing a bar
+    at once fail with a LiveError. Those jobs report their progress to the handler anyway.
+    """
+    if _handler.get() is not None:
+        return sequence
+    return rich_track(sequence, description, total=total)
+
+
+def report_render_progress(fraction: float) -> None:
+    """Maps the ffmpeg progress of the final render onto the overall progress."""
+    start = STAGE_START["render"]
+    report_progress("render", start + (100 - start) * min(max(fraction, 0), 1) * 0.99)
+
+
+def parse_progress(line: str) -> Optional[dict]:
+    """Returns the progress payload of a line written by report_progress, or None."""
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    try:
+        return json.loads(line[len(PROGRESS_PREFIX) :])
+    except json.JSONDecodeError:
+        return None
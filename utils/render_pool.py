@@ -0,0 +1,54 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from utils.metrics import add_worker_cpu
+
+# Image rendering is CPU bound, so it runs in worker processes instead of threads. The
+# processes are spawned, forking a process that runs Flask, Playwright and TTS threads isn't safe.
+# Spawned workers import the main script again (as __mp_main__), so api.py and main.py keep
+# everything with side effects under their __main__ guard.
+RENDER_WORKERS_ENV = "RVG_RENDER_WORKERS"
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _workers() -> int:
+    return max(1, int(os.environ.get(RENDER_WORKERS_ENV, 0)) or (os.cpu_count() or 2) - 1)
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Returns the process pool shared by all image renderers of this process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=_workers(), mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _timed(function: Callable, *args) -> Tuple[object, float]:
+    started = time.process_time()
+    result = function(*args)
+    return result, time.process_time() - started
+
+
+def render_all(function: Callable, jobs: Iterable[tuple]) -> List:
+    """Calls function with every tuple of arguments in the render pool and returns the results in order.
+
+    The function and its arguments have to be picklable, so pass plain values instead of fonts
+    or images and keep the function at the top level of its module. The CPU time of the
+    calls is added to the stage metrics of this process.
+    """
+    futures = [get_render_pool().submit(_timed, function, *args) for args in jobs]
+    results = []
+    for future in futures:
+        result, cpu = future.result()
+        add_worker_cpu(cpu)
+        results.append(result)
+    return results
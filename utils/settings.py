@@ -27,6 +27,9 @@ def check(value, checks, name):
 
     incorrect = False
     if value == {}:
+        if checks.get("optional") is True and "default" in checks:
+            # Optional settings added in newer versions fall back to their default without asking
+            return checks["default"]
         incorrect = True
     if not incorrect and "type" in checks:
         try:
@@ -1,110 +1,150 @@
-import json
-from os.path import exists
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
 
 from utils import settings
 from utils.ai_methods import sort_by_similarity
 from utils.console import print_substep
+from utils.videos import claim, done_ids, is_done
 
+VALID_TIME_FILTERS = ["day", "hour", "month", "week", "year", "all"]
+TOP_LIMIT = 100  # submissions per top listing, the most reddit returns in one request
+BATCH_MAX_AGE = 10 * 60  # seconds a batch of candidates is consumed before reddit is asked again
 
-def get_subreddit_undone(submissions: list, subreddit, times_checked=0, similarity_scores=None):
-    """_summary_
+# Candidates left over from earlier runs, by subreddit and keywords
+_batches: Dict[Tuple[str, Tuple[str, ...]], Tuple[float, Deque[Tuple[object, float]]]] = {}
+# One lock per batch, a worker refilling one batch from reddit doesn't hold up the others
+_batch_locks: Dict[Tuple[str, Tuple[str, ...]], threading.Lock] = {}
+_batches_lock = threading.Lock()  # guards _batch_locks
+
+
+def _batch_lock(key: Tuple[str, Tuple[str, ...]]) -> threading.Lock:
+    with _batches_lock:
+        return _batch_locks.setdefault(key, threading.Lock())
+
+
+def listings(subreddit, keywords: Optional[List[str]] = None) -> Iterator[list]:
+    """Yields the listings candidates are taken from in order, hot first and then top by time filter.
+
+    Every listing is fetched in bulk, so filtering it doesn't go back to reddit per submission.
+    """
+    yield list(subreddit.hot(limit=50 if keywords else 25))
+    for time_filter in VALID_TIME_FILTERS:
+        print(f"Looking for more submissions in the top of the {time_filter}..")
+        yield list(subreddit.top(time_filter=time_filter, limit=TOP_LIMIT))
+
+
+def filter_candidates(submissions: list) -> list:
+    """Drops the submissions that can't be made into a video.
+
+    Every check runs over the whole listing at once, the done videos are looked up in a
+    single query.
 
     Args:
-        submissions (list): List of posts that are going to potentially be generated into a video
-        subreddit (praw.Reddit.SubredditHelper): Chosen subreddit
+        submissions (list): Submissions of a listing
 
     Returns:
-        Any: The submission that has not been done
+        list: The remaining submissions in their original order
     """
-    # Second try of getting a valid Submission
-    if times_checked and settings.config["ai"]["ai_similarity_enabled"]:
-        print("Sorting based on similarity for a different date filter and thread limit..")
-        submissions = sort_by_similarity(
-            submissions, keywords=settings.config["ai"]["ai_similarity_enabled"]
+    storymode = settings.config["settings"]["storymode"]
+    min_comments = int(settings.config["reddit"]["thread"]["min_comments"])
+    max_length = settings.config["settings"]["storymode_max_length"] or 2000
+    try:
+        allow_nsfw = settings.config["settings"]["allow_nsfw"]
+    except (AttributeError, KeyError):
+        print_substep("NSFW settings not defined. Skipping NSFW post...")
+        allow_nsfw = False
+
+    done = done_ids(str(submission) for submission in submissions)
+    checks = [
+        ("already done", lambda s: str(s) not in done),
+        ("NSFW", lambda s: allow_nsfw or not s.over_18),
+        ("pinned by moderators", lambda s: not s.stickied),
+    ]
+    if storymode:
+        checks += [
+            ("without post text", lambda s: s.is_self and bool(s.selftext)),
+            (f"longer than {max_length} characters", lambda s: len(s.selftext) <= max_length),
+            ("too short", lambda s: len(s.selftext) >= 30),
+        ]
+    else:
+        checks.append(
+            (f"under the minimum of {min_comments} comments", lambda s: s.num_comments > min_comments)
         )
 
-    # recursively checks if the top submission in the list was already done.
-    if not exists("./video_creation/data/videos.json"):
-        with open("./video_creation/data/videos.json", "w+") as f:
-            json.dump([], f)
-    with open("./video_creation/data/videos.json", "r", encoding="utf-8") as done_vids_raw:
-        done_videos = json.load(done_vids_raw)
-    for i, submission in enumerate(submissions):
-        if already_done(done_videos, submission):
-            continue
-        if submission.over_18:
-            try:
-                if not settings.config["settings"]["allow_nsfw"]:
-                    print_substep("NSFW Post Detected. Skipping...")
-                    continue
-            except AttributeError:
-                print_substep("NSFW settings not defined. Skipping NSFW post...")
-        if submission.stickied:
-            print_substep("This post was pinned by moderators. Skipping...")
-            continue
-        if (
-            submission.num_comments <= int(settings.config["reddit"]["thread"]["min_comments"])
-            and not settings.config["settings"]["storymode"]
-        ):
-            print_substep(
-                f'This post has under the specified minimum of comments ({settings.config["reddit"]["thread"]["min_comments"]}). Skipping...'
-            )
-            continue
-        if settings.config["settings"]["storymode"]:
-            if not submission.selftext:
-                print_substep("You are trying to use story mode on post with no post text")
-                continue
-            else:
-                # Check for the length of the post text
-                if len(submission.selftext) > (
-                    settings.config["settings"]["storymode_max_length"] or 2000
-                ):
-                    print_substep(
-                        f"Post is too long ({len(submission.selftext)}), try with a different post. ({settings.config['settings']['storymode_max_length']} character limit)"
-                    )
-                    continue
-                elif len(submission.selftext) < 30:
-                    continue
-        if settings.config["settings"]["storymode"] and not submission.is_self:
+    for reason, check in checks:
+        kept = [submission for submission in submissions if check(submission)]
+        if len(kept) < len(submissions):
+            print_substep(f"Skipping {len(submissions) - len(kept)} posts {reason}")
+        submissions = kept
+    return submissions
+
+
+def select_candidates(subreddit, keywords: Optional[List[str]] = None) -> List[Tuple[object, float]]:
+    """Returns the first listing that has candidates left, ranked and without the done videos.
+
+    Listings are tried in the order of listings, without recursing. With keywords the
+    candidates are ranked by their similarity to them, otherwise they keep reddit's order.
+
+    Returns:
+        List[Tuple[Submission,float]]: The candidates with their similarity scores, 0 without keywords
+    """
+    seen = set()
+    for listing in listings(subreddit, keywords):
+        listing = [submission for submission in listing if str(submission) not in seen]
+        seen.update(str(submission) for submission in listing)
+        candidates = filter_candidates(listing)
+        if not candidates:
+            print("all submissions have been done going by top submission order")
             continue
-        if similarity_scores is not None:
-            return submission, similarity_scores[i].item()
-        return submission
-    print("all submissions have been done going by top submission order")
-    VALID_TIME_FILTERS = [
-        "day",
-        "hour",
-        "month",
-        "week",
-        "year",
-        "all",
-    ]  # set doesn't have __getitem__
-    index = times_checked + 1
-    if index == len(VALID_TIME_FILTERS):
-        print("All submissions have been done.")
-
-    return get_subreddit_undone(
-        subreddit.top(
-            time_filter=VALID_TIME_FILTERS[index],
-            limit=(50 if int(index) == 0 else index + 1 * 50),
-        ),
-        subreddit,
-        times_checked=index,
-    )  # all the videos in hot have already been done
-
-
-def already_done(done_videos: list, submission) -> bool:
-    """Checks to see if the given submission is in the list of videos
+        if keywords:
+            print("Sorting based on similarity to the keywords..")
+            candidates, similarity_scores = sort_by_similarity(candidates, keywords)
+            return [(c, score.item()) for c, score in zip(candidates, similarity_scores)]
+        return [(candidate, 0) for candidate in candidates]
+    return []
+
+
+def get_subreddit_undone(subreddit, keywords: Optional[List[str]] = None) -> Tuple[object, float]:
+    """Returns the next submission of the subreddit that hasn't been done, claimed for this run.
+
+    Candidates are selected in batches, the ones a run doesn't use are kept for the next
+    runs of the process for up to BATCH_MAX_AGE seconds, so a run of several videos asks
+    reddit once. Each candidate is claimed before it's returned, so parallel workers never
+    get the same submission.
 
     Args:
-        done_videos (list): Finished videos
-        submission (Any): The submission
+        subreddit (praw.Reddit.SubredditHelper): Chosen subreddit
+        keywords (List[str], optional): Rank the candidates by similarity to these
 
     Returns:
-        Boolean: Whether the video was found in the list
+        Tuple[Submission,float]: The submission and its similarity score, 0 without keywords
     """
+    key = (str(subreddit), tuple(keywords or ()))
+    # Workers of the same subreddit and keywords wait for one refill instead of each asking reddit
+    with _batch_lock(key):
+        for _ in range(2):
+            created, batch = _batches.get(key, (0, deque()))
+            if not batch or time.time() - created > BATCH_MAX_AGE:
+                created, batch = time.time(), deque(select_candidates(subreddit, keywords))
+                _batches[key] = (created, batch)
+            while batch:
+                submission, score = batch.popleft()
+                # Done or claimed by another worker since the batch was selected
+                if claim(str(submission)):
+                    return submission, score
+    print("All submissions have been done.")
+    exit()
+
+
+def already_done(submission) -> bool:
+    """Checks to see if the given submission is in the done videos
+
+    Args:
+        submission (Any): The submission
 
-    for video in done_videos:
-        if video["id"] == str(submission):
-            return True
-    return False
+    Returns:
+        Boolean: Whether the video was found in the done videos
+    """
+    return is_done(str(submission))
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import unicodedata
+from typing import Optional
+
+from utils import settings
+
+CACHE_DIR = "assets/tts_cache"
+DEFAULT_CACHE_SIZE_MB = 1024
+
+_lock = threading.Lock()
+_size: Optional[int] = None  # bytes in CACHE_DIR, counted on first use
+
+
+def _max_bytes() -> int:
+    size_mb = settings.config["settings"]["tts"].get("cache_size_mb", DEFAULT_CACHE_SIZE_MB)
+    return int(float(size_mb) * 1024 * 1024)
+
+
+def enabled() -> bool:
+    """Returns whether TTS audio is cached, a cache_size_mb of 0 turns it off."""
+    return _max_bytes() > 0
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace and unicode variants that make no difference to the spoken audio."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(engine: str, voice, text: str, pitch=None) -> str:
+    """Returns the cache key of an audio clip.
+
+    Args:
+        engine (str): Name of the TTS provider
+        voice: Anything that selects the voice, e.g. the voice name or "random"
+        text (str): The text that is read out
+        pitch (optional): Pitch settings of the provider, if it has any
+
+    Returns:
+        str: The sha256 of all arguments
+    """
+    payload = json.dumps(
+        [engine, voice, normalize_text(text), pitch], sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry(key: str) -> str:
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.mp3")
+
+
+def _entries():
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            if name.endswith(".mp3"):
+                yield os.path.join(root, name)
+
+
+def get(key: str, destination: str) -> bool:
+    """Links or copies the cached clip to destination.
+
+    Returns:
+        bool: True on a cache hit
+    """
+    if not enabled():
+        return False
+    entry = _entry(key)
+    try:
+        # A hit counts as a use, eviction removes the least recently used clips first
+        os.utime(entry)
+    except OSError:
+        return False
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(entry, destination)
+    except OSError:
+        shutil.copyfile(entry, destination)
+    return True
+
+
+def put(key: str, source: str) -> None:
+    """Adds the clip at source to the cache, evicting the least recently used clips if it's full."""
+    global _size
+    if not enabled() or not os.path.isfile(source) or os.path.getsize(source) == 0:
+        return
+    entry = _entry(key)
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    try:
+        # Overwriting a clip only adds the difference to the cache size
+        replaced = os.path.getsize(entry)
+    except OSError:
+        replaced = 0
+    # Copy instead of linking, the providers write their output files in place
+    tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.copyfile(source, tmp)
+    os.replace(tmp, entry)
+
+    with _lock:
+        if _size is None:
+            _size = sum(os.path.getsize(path) for path in _entries())
+        else:
+            _size += os.path.getsize(entry) - replaced
+        if _size > _max_bytes():
+            _evict()
+
+
+def _evict() -> None:
+    """Removes the least recently used clips until the cache is at 90% of its size."""
+    global _size
+    clips = []
+    for path in _entries():
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        clips.append((stat.st_mtime, stat.st_size, path))
+    # Recount, other processes may have added or removed clips
+    _size = sum(size for _, size, _ in clips)
+    target = _max_bytes() * 0.9
+    for _, size, path in sorted(clips):
+        if _size <= target:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        _size -= size
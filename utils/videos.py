@@ -1,40 +1,168 @@
 import json
+import os
+import sqlite3
+import threading
 import time
+from typing import Iterable, Set
 
 from praw.models import Submission
 
 from utils import settings
-from utils.console import print_step
+from utils.console import print_step, print_substep
+
+DB_FILE = "./video_creation/data/videos.db"
+JSON_FILE = "./video_creation/data/videos.json"  # the old store, imported on first use
+CLAIM_TTL = 30 * 60  # seconds a picked submission stays reserved for the run that picked it
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _connect() -> sqlite3.Connection:
+    # sqlite3 connections can't be shared between threads, every worker thread gets its own.
+    # WAL lets readers go on while another worker or process writes.
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
+        connection = sqlite3.connect(DB_FILE, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        _local.connection = connection
+    return connection
+
+
+def _db() -> sqlite3.Connection:
+    global _initialized
+    connection = _connect()
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                connection.executescript(
+                    """
+                    CREATE TABLE IF NOT EXISTS videos (
+                        id TEXT PRIMARY KEY,
+                        subreddit TEXT,
+                        time TEXT,
+                        background_credit TEXT,
+                        reddit_title TEXT,
+                        filename TEXT
+                    );
+                    CREATE TABLE IF NOT EXISTS claims (id TEXT PRIMARY KEY, claimed_at REAL);
+                    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                    """
+                )
+                import_json(JSON_FILE)
+                _initialized = True
+    return connection
+
+
+def import_json(path: str = JSON_FILE) -> int:
+    """Imports the videos of the old JSON store, again whenever the file changed since the last import.
+
+    Returns:
+        int: How many videos were added
+    """
+    if not os.path.exists(path):
+        return 0
+    connection = _connect()
+    mtime = str(os.path.getmtime(path))
+    row = connection.execute("SELECT value FROM meta WHERE key = ?", (f"imported:{path}",)).fetchone()
+    if row is not None and row[0] == mtime:
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        done_videos = json.load(f)
+    with connection:
+        connection.execute("BEGIN IMMEDIATE")
+        before = connection.total_changes
+        connection.executemany(
+            "INSERT OR IGNORE INTO videos VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    video["id"],
+                    video.get("subreddit", ""),
+                    video.get("time", ""),
+                    video.get("background_credit", ""),
+                    video.get("reddit_title", ""),
+                    video.get("filename", ""),
+                )
+                for video in done_videos
+            ],
+        )
+        added = connection.total_changes - before
+        connection.execute(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)", (f"imported:{path}", mtime)
+        )
+    if added:
+        print_substep(f"Imported {added} done videos from {path}")
+    return added
+
+
+def is_done(reddit_id: str) -> bool:
+    """Returns whether a video of the submission was already generated or the submission was skipped."""
+    return (
+        _db().execute("SELECT 1 FROM videos WHERE id = ?", (reddit_id,)).fetchone() is not None
+    )
+
+
+def done_ids(reddit_ids: Iterable[str]) -> Set[str]:
+    """Returns which of the submissions are done, in a single query."""
+    reddit_ids = list(reddit_ids)
+    if not reddit_ids:
+        return set()
+    placeholders = ",".join("?" * len(reddit_ids))
+    rows = _db().execute(f"SELECT id FROM videos WHERE id IN ({placeholders})", reddit_ids)
+    return {row[0] for row in rows}
+
+
+def claim(reddit_id: str) -> bool:
+    """Reserves a submission for the current run, so other workers don't pick it as well.
+
+    Claims expire after CLAIM_TTL seconds, a run that failed frees its submission that way.
+
+    Returns:
+        bool: False if the submission is done or another run claimed it
+    """
+    connection = _db()
+    now = time.time()
+    with connection:
+        connection.execute("BEGIN IMMEDIATE")
+        if connection.execute("SELECT 1 FROM videos WHERE id = ?", (reddit_id,)).fetchone():
+            return False
+        connection.execute("DELETE FROM claims WHERE claimed_at < ?", (now - CLAIM_TTL,))
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO claims VALUES (?, ?)", (reddit_id, now)
+        )
+        return cursor.rowcount == 1
 
 
 def check_done(
     redditobj: Submission,
+    requested: bool = False,
 ) -> Submission:
     # don't set this to be run anyplace that isn't subreddit.py bc of inspect stack
     """Checks if the chosen post has already been generated
 
     Args:
         redditobj (Submission): Reddit object gotten from reddit/subreddit.py
+        requested (bool): The post was asked for by id, e.g. by a job, so it's made again
 
     Returns:
         Submission|None: Reddit object in args
     """
-    with open("./video_creation/data/videos.json", "r", encoding="utf-8") as done_vids_raw:
-        done_videos = json.load(done_vids_raw)
-    for video in done_videos:
-        if video["id"] == str(redditobj):
-            if settings.config["reddit"]["thread"]["post_id"]:
-                print_step(
-                    "You already have done this video but since it was declared specifically in the config file the program will continue"
-                )
-                return redditobj
-            print_step("Getting new post as the current one has already been done")
-            return None
+    if is_done(str(redditobj)):
+        if requested or settings.config["reddit"]["thread"]["post_id"]:
+            print_step(
+                "You already have done this video but since it was requested specifically the program will continue"
+            )
+            return redditobj
+        print_step("Getting new post as the current one has already been done")
+        return None
     return redditobj
 
 
 def save_data(subreddit: str, filename: str, reddit_title: str, reddit_id: str, credit: str):
-    """Saves the videos that have already been generated to a JSON file in video_creation/data/videos.json
+    """Saves the videos that have already been generated to video_creation/data/videos.db
 
     Args:
         filename (str): The finished video title name
@@ -43,18 +171,11 @@ def save_data(subreddit: str, filename: str, reddit_title: str, reddit_id: str,
         @param reddit_id:
         @param reddit_title:
     """
-    with open("./video_creation/data/videos.json", "r+", encoding="utf-8") as raw_vids:
-        done_vids = json.load(raw_vids)
-        if reddit_id in [video["id"] for video in done_vids]:
-            return  # video already done but was specified to continue anyway in the config file
-        payload = {
-            "subreddit": subreddit,
-            "id": reddit_id,
-            "time": str(int(time.time())),
-            "background_credit": credit,
-            "reddit_title": reddit_title,
-            "filename": filename,
-        }
-        done_vids.append(payload)
-        raw_vids.seek(0)
-        json.dump(done_vids, raw_vids, ensure_ascii=False, indent=4)
+    with _db() as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        # A video that was already done but specified to continue anyway in the config file keeps its entry
+        connection.execute(
+            "INSERT OR IGNORE INTO videos VALUES (?, ?, ?, ?, ?, ?)",
+            (reddit_id, subreddit, str(int(time.time())), credit, reddit_title, filename),
+        )
+        connection.execute("DELETE FROM claims WHERE id = ?", (reddit_id,))
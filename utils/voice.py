@@ -1,5 +1,6 @@
 import re
 import sys
+import threading
 import time as pytime
 from datetime import datetime
 from time import sleep
@@ -13,15 +14,24 @@ if sys.version_info[0] >= 3:
     from datetime import timezone
 
 
+# Shared by every thread of the process, a ratelimit hit by one request pauses all of them
+_ratelimit_lock = threading.Lock()
+_ratelimited_until = 0.0
+
+
 def check_ratelimit(response: Response) -> bool:
     """
     Checks if the response is a ratelimit response.
     If it is, it sleeps for the time specified in the response.
+    Other threads wait in wait_for_ratelimit until then as well.
     """
+    global _ratelimited_until
     if response.status_code == 429:
         try:
             time = int(response.headers["X-RateLimit-Reset"])
             print(f"Ratelimit hit. Sleeping for {time - int(pytime.time())} seconds.")
+            with _ratelimit_lock:
+                _ratelimited_until = max(_ratelimited_until, time)
             sleep_until(time)
             return False
         except KeyError:  # if the header is not present, we don't know how long to wait
@@ -30,6 +40,14 @@ def check_ratelimit(response: Response) -> bool:
     return True
 
 
+def wait_for_ratelimit() -> None:
+    """Blocks while a ratelimit reported to check_ratelimit is in effect."""
+    with _ratelimit_lock:
+        until = _ratelimited_until
+    if until > pytime.time():
+        sleep_until(until)
+
+
 def sleep_until(time) -> None:
     """
     Pause your program until a specific end time.
@@ -0,0 +1,44 @@
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Set by the API for every job so concurrent runs never share files
+TEMP_ROOT_ENV = "RVG_TEMP_ROOT"
+OUTPUT_PATH_ENV = "RVG_OUTPUT_PATH"
+
+DEFAULT_TEMP_ROOT = "assets/temp"
+
+# In-process runs set the paths per job instead of per process
+_temp_root: ContextVar[Optional[str]] = ContextVar("temp_root", default=None)
+_output_path: ContextVar[Optional[str]] = ContextVar("output_path", default=None)
+
+
+def temp_root() -> str:
+    """Returns the folder all temporary files of the current run go to."""
+    return _temp_root.get() or os.environ.get(TEMP_ROOT_ENV) or DEFAULT_TEMP_ROOT
+
+
+def temp_path(reddit_id: str) -> str:
+    """Returns the temporary folder of the given thread, e.g. assets/temp/<reddit_id>"""
+    return f"{temp_root()}/{reddit_id}"
+
+
+def output_path() -> Optional[str]:
+    """Returns the explicit path the final video has to be written to, if the caller set one."""
+    return _output_path.get() or os.environ.get(OUTPUT_PATH_ENV) or None
+
+
+@contextmanager
+def job_paths(temp_root: Optional[str] = None, output_path: Optional[str] = None):
+    """Overrides the temp root and output path for everything run inside the block.
+
+    Threads started inside the block only see the paths if they run in a copy of the context.
+    """
+    temp_token = _temp_root.set(temp_root)
+    output_token = _output_path.set(output_path)
+    try:
+        yield
+    finally:
+        _temp_root.reset(temp_token)
+        _output_path.reset(output_token)
@@ -1,15 +1,14 @@
 import json
+import os
 import random
-import re
 from pathlib import Path
 from random import randrange
 from typing import Any, Dict, Tuple
 
-import yt_dlp
-from moviepy.editor import AudioFileClip, VideoFileClip
-from moviepy.video.io.ffmpeg_tools import ffmpeg_extract_subclip
-
 from utils import settings
+from utils.background_index import get_entry, snap_to_keyframe
+from utils.background_prefetch import background_path, get_prefetcher
+from utils.background_renditions import PREPARE_RENDITIONS_ENV, get_rendition, schedule_rendition
 from utils.console import print_step, print_substep
 
 
@@ -74,94 +73,106 @@ def get_background_config(mode: str):
 
 
 def download_background_video(background_config: Tuple[str, str, str, Any]):
-    """Downloads the background/s video from YouTube."""
-    Path("./assets/backgrounds/video/").mkdir(parents=True, exist_ok=True)
-    # note: make sure the file name doesn't include an - in it
+    """Downloads the background/s video from YouTube, unless it's already prefetched."""
     uri, filename, credit, _ = background_config
-    if Path(f"assets/backgrounds/video/{credit}-{filename}").is_file():
-        return
-    print_step(
-        "We need to download the backgrounds videos. they are fairly large but it's only done once. 😎"
-    )
-    print_substep("Downloading the backgrounds videos... please be patient 🙏 ")
-    print_substep(f"Downloading {filename} from {uri}")
-    ydl_opts = {
-        "format": "bestvideo[height<=1080][ext=mp4]",
-        "outtmpl": f"assets/backgrounds/video/{credit}-{filename}",
-        "retries": 10,
-    }
-
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download(uri)
-    print_substep("Background video downloaded successfully! 🎉", style="bold green")
+    path = background_path("video", filename, credit)
+    if not Path(path).is_file():
+        print_step(
+            "We need to download the backgrounds videos. they are fairly large but it's only done once. 😎"
+        )
+        print_substep("Downloading the backgrounds videos... please be patient 🙏 ")
+        print_substep(f"Downloading {filename} from {uri}")
+    # A prefetched file is only checked against the size and mtime recorded for it
+    if get_prefetcher().fetch("video", uri, path):
+        print_substep("Background video downloaded successfully! 🎉", style="bold green")
 
 
 def download_background_audio(background_config: Tuple[str, str, str]):
-    """Downloads the background/s audio from YouTube."""
-    Path("./assets/backgrounds/audio/").mkdir(parents=True, exist_ok=True)
-    # note: make sure the file name doesn't include an - in it
+    """Downloads the background/s audio from YouTube, unless it's already prefetched."""
     uri, filename, credit = background_config
-    if Path(f"assets/backgrounds/audio/{credit}-{filename}").is_file():
-        return
-    print_step(
-        "We need to download the backgrounds audio. they are fairly large but it's only done once. 😎"
-    )
-    print_substep("Downloading the backgrounds audio... please be patient 🙏 ")
-    print_substep(f"Downloading {filename} from {uri}")
-    ydl_opts = {
-        "outtmpl": f"./assets/backgrounds/audio/{credit}-{filename}",
-        "format": "bestaudio/best",
-        "extract_audio": True,
-    }
-
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([uri])
+    path = background_path("audio", filename, credit)
+    if not Path(path).is_file():
+        print_step(
+            "We need to download the backgrounds audio. they are fairly large but it's only done once. 😎"
+        )
+        print_substep("Downloading the backgrounds audio... please be patient 🙏 ")
+        print_substep(f"Downloading {filename} from {uri}")
+    # A prefetched file is only checked against the size and mtime recorded for it
+    if get_prefetcher().fetch("audio", uri, path):
+        print_substep("Background audio downloaded successfully! 🎉", style="bold green")
 
-    print_substep("Background audio downloaded successfully! 🎉", style="bold green")
 
+def prepare_background_video(background_config: Tuple[str, str, str, Any]):
+    """Queues the vertical rendition of the background video at the output size, see utils/background_renditions.py
 
-def chop_background(background_config: Dict[str, Tuple], video_length: int, reddit_object: dict):
-    """Generates the background audio and footage to be used in the video and writes it to assets/temp/background.mp3 and assets/temp/background.mp4
+    The rendition is encoded in a background thread, this video crops and scales the source
+    if it isn't ready yet. main.py processes of the API leave it to the API.
+    """
+    if not settings.config["settings"]["background"].get("background_renditions", True):
+        return
+    if os.environ.get(PREPARE_RENDITIONS_ENV) == "0":
+        return
+    uri, filename, credit, _ = background_config
+    if schedule_rendition(
+        background_path("video", filename, credit),
+        int(settings.config["settings"]["resolution_w"]),
+        int(settings.config["settings"]["resolution_h"]),
+    ):
+        print_substep("Preparing a rendition of the background for the next videos, this one uses the source")
+
+
+def chop_background(
+    background_config: Dict[str, Tuple], video_length: int, reddit_object: dict
+) -> Dict[str, Tuple[str, float, float]]:
+    """Picks the random spots of the background video and audio to be used in the video.
+    Nothing is written anywhere, the final render seeks into the sources itself.
+    The vertical rendition of the background is used when it's prepared, otherwise the source itself.
+    Durations and keyframes come from the background index, see utils/background_index.py
 
     Args:
         background_config (Dict[str,Tuple]]) : Current background configuration
         video_length (int): Length of the clip where the background footage is to be taken out of
-    """
-    id = re.sub(r"[^\w\s-]", "", reddit_object["thread_id"])
 
+    Returns:
+        Dict[str,Tuple[str,float,float]]: The source file, start and end time of the background video
+        under "video" and of the background audio under "audio", unless its volume is 0
+    """
+    cuts = {}
     if settings.config["settings"]["background"][f"background_audio_volume"] == 0:
         print_step("Volume was set to 0. Skipping background audio creation . . .")
     else:
         print_step("Finding a spot in the backgrounds audio to chop...✂️")
         audio_choice = f"{background_config['audio'][2]}-{background_config['audio'][1]}"
-        background_audio = AudioFileClip(f"assets/backgrounds/audio/{audio_choice}")
+        audio_path = f"assets/backgrounds/audio/{audio_choice}"
         start_time_audio, end_time_audio = get_start_and_end_times(
-            video_length, background_audio.duration
+            video_length, get_entry(audio_path)["duration"]
         )
-        background_audio = background_audio.subclip(start_time_audio, end_time_audio)
-        background_audio.write_audiofile(f"assets/temp/{id}/background.mp3")
+        cuts["audio"] = (audio_path, start_time_audio, end_time_audio)
 
     print_step("Finding a spot in the backgrounds video to chop...✂️")
     video_choice = f"{background_config['video'][2]}-{background_config['video'][1]}"
-    background_video = VideoFileClip(f"assets/backgrounds/video/{video_choice}")
-    start_time_video, end_time_video = get_start_and_end_times(
-        video_length, background_video.duration
-    )
-    # Extract video subclip
-    try:
-        ffmpeg_extract_subclip(
-            f"assets/backgrounds/video/{video_choice}",
-            start_time_video,
-            end_time_video,
-            targetname=f"assets/temp/{id}/background.mp4",
+    video_path = f"assets/backgrounds/video/{video_choice}"
+    if settings.config["settings"]["background"].get("background_renditions", True):
+        video_path = (
+            get_rendition(
+                video_path,
+                int(settings.config["settings"]["resolution_w"]),
+                int(settings.config["settings"]["resolution_h"]),
+            )
+            or video_path
         )
-    except (OSError, IOError):  # ffmpeg issue see #348
-        print_substep("FFMPEG issue. Trying again...")
-        with VideoFileClip(f"assets/backgrounds/video/{video_choice}") as video:
-            new = video.subclip(start_time_video, end_time_video)
-            new.write_videofile(f"assets/temp/{id}/background.mp4")
-    print_substep("Background video chopped successfully!", style="bold green")
-    return background_config["video"][2]
+    video_entry = get_entry(video_path)
+    start_time_video, _ = get_start_and_end_times(video_length, video_entry["duration"])
+    # Start on a keyframe, the seek of the final render then doesn't decode frames it throws away
+    start_time_video = snap_to_keyframe(video_entry, start_time_video)
+    end_time_video = start_time_video + video_length
+    # The final render seeks into the source itself, so nothing is re-encoded here
+    print_substep(
+        f"Background video will be cut from {start_time_video}s to {end_time_video}s",
+        style="bold green",
+    )
+    cuts["video"] = (video_path, start_time_video, end_time_video)
+    return cuts
 
 
 # Create a tuple for downloads background (background_audio_options, background_video_options)
@@ -1,3 +1,4 @@
+import contextvars
 import multiprocessing
 import os
 import re
@@ -6,30 +7,39 @@ import tempfile
 import textwrap
 import threading
 import time
+from dataclasses import replace
 from os.path import exists
 from pathlib import Path
 from typing import Dict, Final, Tuple
 
-import ffmpeg
-import translators
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 from rich.console import Console
-from rich.progress import track
 from tqdm import tqdm
 
 from utils import settings
-from utils.cleanup import cleanup
+from utils.background_index import get_entry
 from utils.console import print_step, print_substep
-from utils.fonts import getheight
+from utils.encoder_probe import mark_failed, preferred_backend
+from utils.fonts import get_font, getheight
+from utils.metrics import count_encoder
+from utils.narration import clip_exists, clip_segments
+from utils.progress import report_progress, report_render_progress
 from utils.thumbnail import create_thumbnail
 from utils.videos import save_data
+from utils.workdir import output_path, temp_path
+from video_creation.render_graph import (
+    AudioSegment,
+    Overlay,
+    RenderSpec,
+    build_command,
+)
 
 console = Console()
 
 def verify_files_exist(reddit_id: str, number_of_clips: int, is_story_mode: bool) -> None:
     """Verify all required files exist before processing."""
     # Ensure base directories exist
-    base_path = f"assets/temp/{reddit_id}"
+    base_path = f"{temp_path(reddit_id)}"
     for subdir in ['mp3', 'png']:
         dir_path = os.path.join(base_path, subdir)
         os.makedirs(dir_path, exist_ok=True)
@@ -37,31 +47,29 @@ def verify_files_exist(reddit_id: str, number_of_clips: int, is_story_mode: bool
     # Define required paths
     required_files = []
     
-    # Always required files
-    required_files.append(f"assets/temp/{reddit_id}/background.mp4")
-    
     # Story mode files
     if is_story_mode:
         if settings.config["settings"]["storymodemethod"] == 0:
             required_files.extend([
-                f"assets/temp/{reddit_id}/mp3/title.mp3",
-                f"assets/temp/{reddit_id}/mp3/postaudio.mp3"
+                f"{temp_path(reddit_id)}/mp3/title.mp3",
+                f"{temp_path(reddit_id)}/mp3/postaudio.mp3"
             ])
         else:
-            required_files.append(f"assets/temp/{reddit_id}/mp3/title.mp3")
+            required_files.append(f"{temp_path(reddit_id)}/mp3/title.mp3")
             for i in range(number_of_clips + 1):
-                required_files.append(f"assets/temp/{reddit_id}/mp3/postaudio-{i}.mp3")
+                required_files.append(f"{temp_path(reddit_id)}/mp3/postaudio-{i}.mp3")
     else:
         # Regular mode files
-        required_files.append(f"assets/temp/{reddit_id}/mp3/title.mp3")
+        required_files.append(f"{temp_path(reddit_id)}/mp3/title.mp3")
+        # Comments without a screenshot were skipped while capturing and are left out
         for i in range(number_of_clips):
-            required_files.append(f"assets/temp/{reddit_id}/mp3/{i}.mp3")
-            required_files.append(f"assets/temp/{reddit_id}/png/comment_{i}.png")
+            required_files.append(f"{temp_path(reddit_id)}/mp3/{i}.mp3")
     
     # Check file existence
     missing_files = []
     for file_path in required_files:
-        if not os.path.exists(file_path):
+        # Clips that were synthesized in parts only have a manifest of the parts
+        if not clip_exists(file_path):
             print(f"Missing file: {file_path}")
             missing_files.append(file_path)
             
@@ -86,8 +94,13 @@ class ProgressFfmpeg(threading.Thread):
             self.progress_file_path = self.output_file.name
         self.vid_duration_seconds = vid_duration_seconds
         self.progress_update_callback = progress_update_callback
+        # Report progress in the context of the job that started the render
+        self.context = contextvars.copy_context()
 
     def run(self):
+        self.context.run(self.poll)
+
+    def poll(self):
         while not self.stop_event.is_set():
             latest_progress = self.get_latest_ms_progress()
             if latest_progress is not None:
@@ -160,220 +173,58 @@ class ProgressFfmpeg(threading.Thread):
         """Get the progress file path for compatibility."""
         return self.progress_file_path
 
-def try_ffmpeg_output(background_clip, final_audio, path: str, progress_file: str, reddit_id: str, max_retries: int = 3) -> bool:
-    """Research-based Intel Arc hardware acceleration with proper drivers and syntax."""
-    for attempt in range(max_retries):
+def run_ffmpeg_command(cmd: list, progress_file: str) -> subprocess.CompletedProcess:
+    """Run an ffmpeg render, writing its progress to progress_file."""
+    with open(progress_file, 'w') as prog_file:
+        return subprocess.run(
+            cmd,
+            stdout=prog_file,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=600
+        )
+
+def try_ffmpeg_output(spec: RenderSpec, path: str, progress_file: str) -> bool:
+    """Render the final video in one pass with the encoder the startup probe found working.
+
+    Every backend renders the same filter graph compiled from the spec, so the title,
+    comment overlays and audio all come out of a single decode and encode. If the probed
+    hardware backend fails anyway, it's excluded from later renders and libx264 renders instead.
+    """
+    backend = preferred_backend()
+    if backend != "libx264":
+        cmd = build_command(spec, backend, path, progress_file)
+        print(f"🎯 Using Intel Arc {backend.upper()} encoding...")
         try:
-            threads = min(16, max(1, multiprocessing.cpu_count() - 1))
-            
-            print(f"🚀 Attempting Intel Arc hardware encoding (attempt {attempt + 1})...")
-            
-            # Method 1: Intel Arc-specific QSV (requires proper drivers)
-            try:
-                print("🎯 Using Intel Arc QSV (requires updated drivers)...")
-                
-                cmd = [
-                    "ffmpeg", "-y",
-                    "-progress", progress_file,
-                    "-threads", str(threads),
-                    # QSV-specific initialization
-                    "-init_hw_device", "qsv=hw",
-                    "-filter_hw_device", "hw",
-                    "-i", f"assets/temp/{reddit_id}/background_noaudio.mp4",
-                    "-i", f"assets/temp/{reddit_id}/png/title.png",
-                    "-i", f"assets/temp/{reddit_id}/audio.mp3",
-                    "-filter_complex",
-                    "[0:v]scale=1080:1920[bg];[1:v]scale=-1:1200:force_original_aspect_ratio=decrease[title];[bg][title]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2:enable='between(t,0,8)',format=qsv,hwupload=extra_hw_frames=64[v]",
-                    "-map", "[v]", "-map", "2:a",
-                    "-c:v", "h264_qsv",
-                    "-preset", "medium",
-                    "-global_quality", "23",
-                    "-c:a", "aac", "-b:a", "192k",
-                    "-movflags", "+faststart",
-                    path
-                ]
-                
-                # Run with streaming output for progress tracking
-                with open(progress_file, 'w') as prog_file:
-                    result = subprocess.run(
-                        cmd,
-                        stdout=prog_file, 
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        timeout=600
-                    )
-                
-                if result.returncode == 0:
-                    print("✅ Intel Arc QSV encoding successful!")
-                    return True
-                else:
-                    print(f"⚠️ QSV failed - likely driver issue (need intel-media-driver 22.5.2+)")
-                    raise subprocess.CalledProcessError(result.returncode, cmd, result.stderr)
-                    
-            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
-                print(f"⚠️ QSV failed, trying VA-API with software overlay...")
-                
-                # Method 2: VA-API with software overlay (more compatible)
-                try:
-                    print("🔄 Using VA-API with software preprocessing...")
-                    
-                    cmd = [
-                        "ffmpeg", "-y",
-                        "-progress", progress_file,
-                        "-threads", str(threads),
-                        "-i", f"assets/temp/{reddit_id}/background_noaudio.mp4",
-                        "-i", f"assets/temp/{reddit_id}/png/title.png",
-                        "-i", f"assets/temp/{reddit_id}/audio.mp3",
-                        "-filter_complex",
-                        # Software overlay first, then hardware upload (Intel Arc compatible)
-                        "[0:v]scale=1080:1920[bg];[1:v]scale=-1:1200:force_original_aspect_ratio=decrease[title];[bg][title]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2:enable='between(t,0,8)',format=nv12,hwupload[v]",
-                        "-map", "[v]", "-map", "2:a",
-                        "-c:v", "h264_vaapi",
-                        "-vaapi_device", "/dev/dri/renderD128",
-                        "-qp", "23",
-                        "-c:a", "aac", "-b:a", "192k",
-                        "-movflags", "+faststart",
-                        path
-                    ]
-                    
-                    # Run with streaming output for progress tracking
-                    with open(progress_file, 'w') as prog_file:
-                        result = subprocess.run(
-                            cmd,
-                            stdout=prog_file,
-                            stderr=subprocess.PIPE, 
-                            text=True,
-                            timeout=600
-                        )
-                    
-                    if result.returncode == 0:
-                        print("✅ Intel Arc VA-API encoding successful!")
-                        return True
-                    else:
-                        print(f"⚠️ VA-API failed: {result.stderr[-200:] if result.stderr else 'Unknown error'}")
-                        raise subprocess.CalledProcessError(result.returncode, cmd, result.stderr)
-                        
-                except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
-                    print(f"⚠️ VA-API also failed, trying basic VA-API...")
-                    
-                    # Method 3: Basic VA-API without hardware upload in filter
-                    try:
-                        print("🔄 Trying basic VA-API encoding...")
-                        
-                        cmd = [
-                            "ffmpeg", "-y",
-                            "-progress", progress_file,
-                            "-threads", str(threads),
-                            "-hwaccel", "vaapi",
-                            "-hwaccel_device", "/dev/dri/renderD128",
-                            "-hwaccel_output_format", "vaapi",
-                            "-i", f"assets/temp/{reddit_id}/background_noaudio.mp4",
-                            "-i", f"assets/temp/{reddit_id}/png/title.png",
-                            "-i", f"assets/temp/{reddit_id}/audio.mp3",
-                            "-filter_complex",
-                            "[0:v]scale_vaapi=1080:1920[bg];[1:v]format=yuv420p,hwupload,scale_vaapi=-1:486:force_original_aspect_ratio=decrease[title_scaled];[title_scaled]pad_vaapi=486:486:(ow-iw)/2:(oh-ih)/2[title];[bg][title]overlay_vaapi=x=(main_w-overlay_w)/2:y=(main_h-overlay_h)/2[v]",
-                            "-map", "[v]", "-map", "2:a",
-                            "-c:v", "h264_vaapi",
-                            "-qp", "23",
-                            "-c:a", "aac", "-b:a", "192k",
-                            path
-                        ]
-                        
-                        # Run with streaming output for progress tracking
-                        with open(progress_file, 'w') as prog_file:
-                            result = subprocess.run(
-                                cmd,
-                                stdout=prog_file,
-                                stderr=subprocess.PIPE,
-                                text=True, 
-                                timeout=600
-                            )
-                        
-                        if result.returncode == 0:
-                            print("✅ Basic VA-API encoding successful!")
-                            return True
-                        else:
-                            print(f"⚠️ Basic VA-API also failed")
-                            raise subprocess.CalledProcessError(result.returncode, cmd, result.stderr)
-                            
-                    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
-                        print(f"⚠️ All Intel Arc methods failed, falling back to software...")
-                        raise e
-            
-        except Exception as e:
-            print(f"❌ Intel Arc encoding attempt {attempt + 1} failed:")
-            if hasattr(e, 'stderr') and e.stderr:
-                error_msg = e.stderr if isinstance(e.stderr, str) else e.stderr.decode("utf8")
-                print("Error:", error_msg)
-                
-                # Specific Intel Arc troubleshooting
-                if "filter" in error_msg.lower() and "complex" in error_msg.lower():
-                    print("💡 Filter conflict detected - this is why we're using raw commands")
-                elif "qsv" in error_msg.lower() or "mfx" in error_msg.lower():
-                    print("💡 QSV failed - Intel drivers may need updating")
-                elif "vaapi" in error_msg.lower():
-                    print("💡 VAAPI failed - trying software fallback")
-                elif "device" in error_msg.lower():
-                    print("💡 GPU device issue - check Docker device mapping")
-            else:
-                print(f"Error: {str(e)}")
-            
-            # Don't retry on the last attempt - just fail to software
-            if attempt == max_retries - 1:
-                print(f"❌ All Intel Arc attempts failed, using guaranteed software encoding...")
-                break
-            
-            print(f"🔄 Retrying... ({attempt + 1}/{max_retries})")
-            time.sleep(2)
-    
-    # Final fallback: Guaranteed to work software encoding
-    print("🎯 Final attempt: Guaranteed software encoding...")
-    try:
-        threads = max(1, multiprocessing.cpu_count() - 1)
-        
-        cmd = [
-            "ffmpeg", "-y",
-            "-progress", progress_file,
-            "-threads", str(threads),
-            "-i", f"assets/temp/{reddit_id}/background_noaudio.mp4",
-            "-i", f"assets/temp/{reddit_id}/png/title.png",
-            "-i", f"assets/temp/{reddit_id}/audio.mp3",
-            "-filter_complex",
-            "[0:v]scale=1080:1920[bg];[1:v]scale=-1:1200:force_original_aspect_ratio=decrease[title];[bg][title]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2:enable='between(t,0,8)'[v]",
-            "-map", "[v]", "-map", "2:a",
-            "-c:v", "libx264",
-            "-preset", "medium",
-            "-crf", "23",
-            "-tune", "fastdecode",
-            "-b:v", "20M",
-            "-c:a", "aac",
-            "-b:a", "192k",
-            "-movflags", "+faststart",
-            "-pix_fmt", "yuv420p",
-            path
-        ]
-        
-        with open(progress_file, 'w') as prog_file:
-            result = subprocess.run(
-                cmd,
-                stdout=prog_file,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=600
-            )
-        
-        if result.returncode == 0:
-            print("✅ Software encoding successful!")
+            result = run_ffmpeg_command(cmd, progress_file)
+            error_msg = result.stderr or ""
+        except subprocess.TimeoutExpired as e:
+            result = None
+            error_msg = f"timed out after {e.timeout}s"
+        success = result is not None and result.returncode == 0
+        count_encoder(backend, success)
+        if success:
+            print(f"✅ Intel Arc {backend.upper()} encoding successful!")
             return True
-        else:
-            print(f"❌ Even software encoding failed:")
-            if result.stderr:
-                print("Final error:", result.stderr)
-            raise subprocess.CalledProcessError(result.returncode, cmd, result.stderr)
-            
-    except Exception as final_error:
-        print(f"❌ Software encoding exception: {final_error}")
-        raise final_error
+        print(f"⚠️ {backend.upper()} encoding failed, it won't be used again until POST /encoders/probe")
+        print("Error:", error_msg[-2000:])
+        mark_failed(backend, error_msg)
+
+    print("🎯 Using software encoding...")
+    cmd = build_command(spec, "libx264", path, progress_file)
+    try:
+        result = run_ffmpeg_command(cmd, progress_file)
+    except subprocess.TimeoutExpired:
+        count_encoder("libx264", False)
+        raise
+    count_encoder("libx264", result.returncode == 0)
+    if result.returncode == 0:
+        print("✅ Software encoding successful!")
+        return True
+    print(f"❌ Even software encoding failed:")
+    if result.stderr:
+        print("Final error:", result.stderr)
+    raise subprocess.CalledProcessError(result.returncode, cmd, stderr=result.stderr)
 
 def name_normalize(name: str) -> str:
     """Normalize a filename to be safe for all operating systems."""
@@ -395,37 +246,11 @@ def name_normalize(name: str) -> str:
     
     return name
 
-def prepare_background(reddit_id: str, W: int, H: int) -> str:
-    """Prepare the background video by cropping to correct aspect ratio."""
-    output_path = f"assets/temp/{reddit_id}/background_noaudio.mp4"
-    output = (
-        ffmpeg.input(f"assets/temp/{reddit_id}/background.mp4")
-        .filter("crop", f"ih*({W}/{H})", "ih")
-        .output(
-            output_path,
-            an=None,
-            **{
-                "c:v": "h264",
-                "b:v": "20M",
-                "b:a": "192k",
-                "threads": max(1, multiprocessing.cpu_count() - 1),
-            },
-        )
-        .overwrite_output()
-    )
-    try:
-        output.run(quiet=True)
-    except ffmpeg.Error as e:
-        if e.stderr:
-            print("Error preparing background:", e.stderr.decode("utf8"))
-        raise
-    return output_path
-
 def create_fancy_thumbnail(image, text, text_color, padding, wrap=35):
     """Create a fancy thumbnail with text overlay."""
     print_step(f"Creating fancy thumbnail for: {text}")
     font_title_size = 47
-    font = ImageFont.truetype(os.path.join("fonts", "Roboto-Bold.ttf"), font_title_size)
+    font = get_font(os.path.join("fonts", "Roboto-Bold.ttf"), font_title_size)
     image_width, image_height = image.size
     lines = textwrap.wrap(text, width=wrap)
     y = (
@@ -435,7 +260,7 @@ def create_fancy_thumbnail(image, text, text_color, padding, wrap=35):
     )
     draw = ImageDraw.Draw(image)
 
-    username_font = ImageFont.truetype(os.path.join("fonts", "Roboto-Bold.ttf"), 30)
+    username_font = get_font(os.path.join("fonts", "Roboto-Bold.ttf"), 30)
     draw.text(
         (205, 825),
         settings.config["settings"]["channel_name"],
@@ -447,7 +272,7 @@ def create_fancy_thumbnail(image, text, text_color, padding, wrap=35):
     if len(lines) >= 3:
         lines = textwrap.wrap(text, width=wrap + 10)
         font_title_size = 40 if len(lines) == 3 else 35 if len(lines) == 4 else 30
-        font = ImageFont.truetype(os.path.join("fonts", "Roboto-Bold.ttf"), font_title_size)
+        font = get_font(os.path.join("fonts", "Roboto-Bold.ttf"), font_title_size)
         y_adjustment = 35 if len(lines) == 3 else 40 if len(lines) == 4 else 30
         y = (
             (image_height / 2)
@@ -461,37 +286,29 @@ def create_fancy_thumbnail(image, text, text_color, padding, wrap=35):
 
     return image
 
-def merge_background_audio(audio: ffmpeg, reddit_id: str):
-    """Merge TTS audio with background audio."""
-    background_audio_volume = settings.config["settings"]["background"]["background_audio_volume"]
-    if background_audio_volume == 0:
-        return audio
-    
-    try:
-        bg_audio = ffmpeg.input(f"assets/temp/{reddit_id}/background.mp3").filter(
-            "volume",
-            background_audio_volume,
-        )
-        merged_audio = ffmpeg.filter([audio, bg_audio], "amix", duration="longest")
-        return merged_audio
-    except Exception as e:
-        print(f"Error merging background audio: {e}")
-        return audio
-
 def make_final_video(
     number_of_clips: int,
     length: int,
     reddit_obj: dict,
     background_config: Dict[str, Tuple],
+    background_cuts: Dict[str, Tuple[str, float, float]],
 ):
-    """Create the final video by combining all components."""
+    """Create the final video by combining all components.
+
+    Args:
+        number_of_clips (int): Number of comments or story sentences that were read out
+        length (int): Length of the video in seconds
+        reddit_obj (dict): The reddit object from reddit/subreddit.py
+        background_config (Dict[str,Tuple]): The chosen background video and audio
+        background_cuts (Dict[str,Tuple[str,float,float]]): Source, start and end of the background video and audio, see chop_background
+    """
     W: Final[int] = int(settings.config["settings"]["resolution_w"])
     H: Final[int] = int(settings.config["settings"]["resolution_h"])
     opacity = settings.config["settings"]["opacity"]
     reddit_id = re.sub(r"[^\w\s-]", "", reddit_obj["thread_id"])
     
     # Ensure temp directory exists (don't delete existing files we need!)
-    temp_dir = f"assets/temp/{reddit_id}"
+    temp_dir = temp_path(reddit_id)
     # Only create directory if it doesn't exist - don't delete existing files
     if not os.path.exists(temp_dir):
         print_substep(f"Creating temp directory for {reddit_id}")
@@ -500,12 +317,12 @@ def make_final_video(
     # Ensure all base directories exist with proper permissions
     base_dirs = [
         "assets",
-        "assets/temp",
-        f"assets/temp/{reddit_id}",
-        f"assets/temp/{reddit_id}/mp3",
-        f"assets/temp/{reddit_id}/png",
-        "results"
+        temp_path(reddit_id),
+        f"{temp_path(reddit_id)}/mp3",
+        f"{temp_path(reddit_id)}/png",
     ]
+    if not output_path():
+        base_dirs.append("results")
     
     for directory in base_dirs:
         try:
@@ -526,149 +343,90 @@ def make_final_video(
     print_step("Creating the final video 🎥")
 
     try:
-        background_clip = ffmpeg.input(prepare_background(reddit_id, W=W, H=H))
-
         # Gather all audio clips
-        audio_clips = []
         if number_of_clips == 0 and not settings.config["settings"]["storymode"]:
             print("No audio clips to gather. Please use a different TTS or post.")
             return
 
-        # Handle audio clips based on mode
+        # Pair every audio clip with the image shown while it plays
+        mp3_dir = f"{temp_path(reddit_id)}/mp3"
+        png_dir = f"{temp_path(reddit_id)}/png"
+        clips = [(f"{mp3_dir}/title.mp3", f"{png_dir}/title.png", 1.0)]
         if settings.config["settings"]["storymode"]:
             if settings.config["settings"]["storymodemethod"] == 0:
-                audio_clips = [ffmpeg.input(f"assets/temp/{reddit_id}/mp3/title.mp3")]
-                audio_clips.append(ffmpeg.input(f"assets/temp/{reddit_id}/mp3/postaudio.mp3"))
+                clips.append((f"{mp3_dir}/postaudio.mp3", f"{png_dir}/story_content.png", 1.0))
             else:
-                audio_clips = [
-                    ffmpeg.input(f"assets/temp/{reddit_id}/mp3/postaudio-{i}.mp3")
-                    for i in track(range(number_of_clips + 1), "Collecting the audio files...")
+                # Story mode 1 only shows the title, the sentences are just read out
+                clips += [
+                    (f"{mp3_dir}/postaudio-{i}.mp3", None, 1.0)
+                    for i in range(number_of_clips + 1)
                 ]
-                audio_clips.insert(0, ffmpeg.input(f"assets/temp/{reddit_id}/mp3/title.mp3"))
         else:
-            audio_clips = [
-                ffmpeg.input(f"assets/temp/{reddit_id}/mp3/{i}.mp3") 
+            clips += [
+                (f"{mp3_dir}/{i}.mp3", f"{png_dir}/comment_{i}.png", opacity)
                 for i in range(number_of_clips)
+                if exists(f"{png_dir}/comment_{i}.png")
             ]
-            audio_clips.insert(0, ffmpeg.input(f"assets/temp/{reddit_id}/mp3/title.mp3"))
-
-        # Concatenate audio clips
-        print(f"Audio clips to concatenate: {len(audio_clips)}")
-        for i, clip in enumerate(audio_clips):
-            print(f"Audio clip {i}: {clip}")
-        
-        if len(audio_clips) == 1:
-            # Only one audio file, copy it directly
-            audio_input = audio_clips[0]
-            ffmpeg.output(
-                audio_input,
-                f"assets/temp/{reddit_id}/audio.mp3",
-                **{"b:a": "192k"}
-            ).overwrite_output().run(quiet=True)
-        else:
-            # Multiple audio files, concatenate them
-            audio_concat = ffmpeg.concat(*audio_clips, a=1, v=0)
-            ffmpeg.output(
-                audio_concat, 
-                f"assets/temp/{reddit_id}/audio.mp3",
-                **{"b:a": "192k"}
-            ).overwrite_output().run(quiet=True)
-
-        # Get audio durations
+            if len(clips) == 1:
+                print("None of the comments could be captured. Please use a different post.")
+                return
+        # The narration is assembled by the render itself, straight from the TTS clips
+        narration = []
         audio_clips_durations = []
-        for i in range(number_of_clips + 1):
+        for audio_path, _, _ in clips:
             try:
-                if settings.config["settings"]["storymode"]:
-                    file_path = f"assets/temp/{reddit_id}/mp3/postaudio-{i}.mp3"
-                else:
-                    file_path = f"assets/temp/{reddit_id}/mp3/{i}.mp3"
-                duration = float(ffmpeg.probe(file_path)["format"]["duration"])
-                audio_clips_durations.append(duration)
+                segments = [AudioSegment(path, duration) for path, duration in clip_segments(audio_path)]
             except Exception as e:
-                print(f"Error getting duration for clip {i}: {e}")
+                print(f"Error getting duration for clip {audio_path}: {e}")
                 raise
+            narration += segments
+            audio_clips_durations.append(sum(segment.duration for segment in segments))
+        print(f"Audio clips to concatenate: {len(narration)}")
 
         console.log(f"[bold green] Video Will Be: {length} Seconds Long")
 
-        # Process audio
-        audio = ffmpeg.input(f"assets/temp/{reddit_id}/audio.mp3")
-        final_audio = merge_background_audio(audio, reddit_id)
-
         # Process images
         screenshot_width = int((W * 45) // 100)
-        image_clips = []
-        Path(f"assets/temp/{reddit_id}/png").mkdir(parents=True, exist_ok=True)
+        Path(png_dir).mkdir(parents=True, exist_ok=True)
 
         # Create and save title image
         title_template = Image.open("assets/title_template.png")
         title = name_normalize(reddit_obj["thread_title"])
         title_img = create_fancy_thumbnail(title_template, title, "#000000", 5)
-        title_img.save(f"assets/temp/{reddit_id}/png/title.png")
-        
-        image_clips.insert(
-            0,
-            ffmpeg.input(f"assets/temp/{reddit_id}/png/title.png")["v"].filter(
-                "scale", screenshot_width, -1
-            ),
-        )
+        title_img.save(f"{png_dir}/title.png")
 
+        # Lay the images out on the timeline of the narration
+        overlays = []
         current_time = 0
-        if settings.config["settings"]["storymode"]:
-            # Create a transparent image for story mode
-            transparent_image = Image.new('RGBA', (screenshot_width, screenshot_width), (0, 0, 0, 0))
-            transparent_image.save(f"assets/temp/{reddit_id}/png/transparent.png")
-
-            if settings.config["settings"]["storymodemethod"] == 0:
-                image_clips.insert(
-                    1,
-                    ffmpeg.input(f"assets/temp/{reddit_id}/png/story_content.png").filter(
-                        "scale", screenshot_width, -1
-                    ),
-                )
-                background_clip = background_clip.overlay(
-                    image_clips[0],
-                    enable=f"between(t,{current_time},{current_time + audio_clips_durations[0]})",
-                    x="(main_w-overlay_w)/2",
-                    y="(main_h-overlay_h)/2",
+        for (_, image_path, image_opacity), duration in zip(clips, audio_clips_durations):
+            if image_path:
+                overlays.append(
+                    Overlay(image_path, current_time, current_time + duration, image_opacity)
                 )
-                current_time += audio_clips_durations[0]
-            else:
-                for i in track(range(0, number_of_clips + 1), "Collecting the image files..."):
-                    # Create a transparent image for each clip
-                    transparent_image = Image.new('RGBA', (screenshot_width, screenshot_width), (0, 0, 0, 0))
-                    transparent_image.save(f"assets/temp/{reddit_id}/png/trs{i}.png")
-
-                    image_clips.append(
-                        ffmpeg.input(f"assets/temp/{reddit_id}/png/trs{i}.png")["v"].filter(
-                            "scale", screenshot_width, -1
-                        )
-                    )
-                    background_clip = background_clip.overlay(
-                        image_clips[i],
-                        enable=f"between(t,{current_time},{current_time + audio_clips_durations[i]})",
-                        x="(main_w-overlay_w)/2",
-                        y="(main_h-overlay_h)/2",
-                    )
-                    current_time += audio_clips_durations[i]
-        else:
-            for i in range(0, number_of_clips + 1):
-                try:
-                    image_clips.append(
-                        ffmpeg.input(f"assets/temp/{reddit_id}/png/comment_{i}.png")["v"].filter(
-                            "scale", screenshot_width, -1
-                        )
-                    )
-                    image_overlay = image_clips[i].filter("colorchannelmixer", aa=opacity)
-                    background_clip = background_clip.overlay(
-                        image_overlay,
-                        enable=f"between(t,{current_time},{current_time + audio_clips_durations[i]})",
-                        x="(main_w-overlay_w)/2",
-                        y="(main_h-overlay_h)/2",
-                    )
-                    current_time += audio_clips_durations[i]
-                except Exception as e:
-                    print(f"Error processing image {i}: {e}")
-                    raise
+            current_time += duration
+
+        background_path, background_start, background_end = background_cuts["video"]
+        background_entry = get_entry(background_path)
+        render_spec = RenderSpec(
+            background=background_path,
+            background_start=background_start,
+            background_duration=background_end - background_start,
+            # A prepared vertical rendition already has the output size
+            background_fitted=(background_entry.get("width"), background_entry.get("height")) == (W, H),
+            narration=narration,
+            overlays=overlays,
+            width=W,
+            height=H,
+            overlay_width=screenshot_width,
+            threads=min(16, max(1, multiprocessing.cpu_count() - 1)),
+        )
+        if "audio" in background_cuts:
+            background_audio_path, background_audio_start, _ = background_cuts["audio"]
+            render_spec.background_audio = background_audio_path
+            render_spec.background_audio_start = background_audio_start
+            render_spec.background_audio_volume = settings.config["settings"]["background"][
+                "background_audio_volume"
+            ]
 
         # Process title and prepare output paths
         title = name_normalize(reddit_obj["thread_title"])
@@ -676,11 +434,15 @@ def make_final_video(
         subreddit = settings.config["reddit"]["thread"]["subreddit"]
 
         # Create necessary directories
-        for dir_path in [
-            f"./results/{subreddit}",
-            f"./results/{subreddit}/OnlyTTS",
-            f"./results/{subreddit}/thumbnails"
-        ]:
+        if output_path():
+            output_dirs = [os.path.dirname(output_path()) or "."]
+        else:
+            output_dirs = [
+                f"./results/{subreddit}",
+                f"./results/{subreddit}/OnlyTTS",
+                f"./results/{subreddit}/thumbnails"
+            ]
+        for dir_path in output_dirs:
             if not exists(dir_path):
                 print_substep(f"Creating directory: {dir_path}")
                 os.makedirs(dir_path)
@@ -706,26 +468,13 @@ def make_final_video(
                         height,
                         reddit_obj["thread_title"],
                     )
-                    thumbnailSave.save(f"./assets/temp/{reddit_id}/thumbnail.png")
-                    print_substep(f"Created thumbnail in assets/temp/{reddit_id}/thumbnail.png")
+                    thumbnailSave.save(f"{temp_path(reddit_id)}/thumbnail.png")
+                    print_substep(f"Created thumbnail in {temp_path(reddit_id)}/thumbnail.png")
                 except Exception as e:
                     print(f"Error creating thumbnail: {e}")
             else:
                 print_substep("No png files found in assets/backgrounds", "red")
 
-        # Add minimal watermark
-        text = " "  # Removed background creator mention
-        background_clip = ffmpeg.drawtext(
-            background_clip,
-            text=text,
-            x=f"(w-text_w)",
-            y=f"(h-text_h)",
-            fontsize=5,
-            fontcolor="White",
-            fontfile=os.path.join("fonts", "Roboto-Regular.ttf"),
-        )
-        background_clip = background_clip.filter("scale", W, H)
-
         # Render the final video
         print_step("Rendering the video 🎥")
         pbar = tqdm(total=100, desc="Progress: ", bar_format="{l_bar}{bar}", unit=" %")
@@ -734,57 +483,53 @@ def make_final_video(
             status = round(progress * 100, 2)
             old_percentage = pbar.n
             pbar.update(status - old_percentage)
+            report_render_progress(progress)
 
         # Process main video
         defaultPath = f"results/{subreddit}"
-        path = defaultPath + f"/{filename}"
-        path = path[:251] + ".mp4"  # Limit path length
+        if output_path():
+            # The caller decides where the video goes, e.g. one file per API job
+            path = output_path()
+        else:
+            path = defaultPath + f"/{filename}"
+            path = path[:251] + ".mp4"  # Limit path length
         
-        progress_file = f"assets/temp/{reddit_id}/progress.txt"
+        progress_file = f"{temp_path(reddit_id)}/progress.txt"
         with ProgressFfmpeg(length, on_update_example, progress_file) as progress:
             try:
-                try_ffmpeg_output(
-                background_clip,
-                final_audio,
-                path,
-                progress_file,
-                    reddit_id
-                    )
-            except ffmpeg.Error as e:
+                try_ffmpeg_output(render_spec, path, progress_file)
+            except subprocess.CalledProcessError as e:
                 print("Error during final video rendering:")
                 if e.stderr:
-                    print(e.stderr.decode("utf8"))
+                    print(e.stderr)
                 raise
 
         # Process TTS-only version if enabled
         if settings.config["settings"]["background"]["enable_extra_audio"]:
-            path = defaultPath + f"/OnlyTTS/{filename}"
-            path = path[:251] + ".mp4"
+            if output_path():
+                path = os.path.splitext(output_path())[0] + "-OnlyTTS.mp4"
+            else:
+                path = defaultPath + f"/OnlyTTS/{filename}"
+                path = path[:251] + ".mp4"
             print_step("Rendering the Only TTS Video 🎥")
             
-            progress_file_tts = f"assets/temp/{reddit_id}/progress_tts.txt"
+            progress_file_tts = f"{temp_path(reddit_id)}/progress_tts.txt"
             with ProgressFfmpeg(length, on_update_example, progress_file_tts) as progress:
                 try:
                     try_ffmpeg_output(
-                        background_clip,
-                        audio,
-                        path,
-                        progress_file_tts,
-                        reddit_id
+                        replace(render_spec, background_audio=None), path, progress_file_tts
                     )
-                except ffmpeg.Error as e:
+                except subprocess.CalledProcessError as e:
                     print("Error during TTS-only video rendering:")
                     if e.stderr:
-                        print(e.stderr.decode("utf8"))
+                        print(e.stderr)
                     raise
 
         pbar.close()
 
         # Save metadata and clean up
         save_data(subreddit, filename + ".mp4", title, reddit_id, background_config["video"][2])
-        print_step("Removing temporary files 🗑")
-        cleanups = cleanup(reddit_id)
-        print_substep(f"Removed {cleanups} temporary files 🗑")
+        report_progress("done", result_name=filename + ".mp4")
         print_step("Done! 🎉 The video is in the results folder 📁")
         
     except Exception as e:
@@ -0,0 +1,142 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# Encoder backends in order of preference. Every backend gets the same software filter
+# graph, only the upload to the GPU and the encoder settings differ.
+ENCODERS: Dict[str, Dict[str, list]] = {
+    "qsv": {
+        "global_args": ["-init_hw_device", "qsv=hw", "-filter_hw_device", "hw"],
+        "upload": ["format=nv12", "hwupload=extra_hw_frames=64", "format=qsv"],
+        "codec_args": ["-c:v", "h264_qsv", "-preset", "medium", "-global_quality", "23"],
+    },
+    "vaapi": {
+        "global_args": ["-vaapi_device", "/dev/dri/renderD128"],
+        "upload": ["format=nv12", "hwupload"],
+        "codec_args": ["-c:v", "h264_vaapi", "-qp", "23"],
+    },
+    "libx264": {
+        "global_args": [],
+        "upload": ["format=yuv420p"],
+        "codec_args": [
+            "-c:v", "libx264",
+            "-preset", "medium",
+            "-crf", "23",
+            "-tune", "fastdecode",
+            "-b:v", "20M",
+            "-pix_fmt", "yuv420p",
+        ],
+    },
+}
+HARDWARE_ENCODERS = ["qsv", "vaapi"]
+
+
+@dataclass
+class Overlay:
+    """An image shown centered over the background between start and end (in seconds)."""
+
+    path: str
+    start: float
+    end: float
+    opacity: float = 1.0
+
+
+@dataclass
+class AudioSegment:
+    """A narration file played for duration seconds, or silence when path is None."""
+
+    path: Optional[str]
+    duration: float
+
+
+@dataclass
+class RenderSpec:
+    """Everything needed to render the final video in a single ffmpeg invocation."""
+
+    background: str
+    background_start: float
+    background_duration: float
+    narration: List[AudioSegment]
+    overlays: List[Overlay]
+    width: int
+    height: int
+    overlay_width: int
+    threads: int = 1
+    background_fitted: bool = False  # the background already is width x height, e.g. a vertical rendition
+    # Music mixed under the narration, cut from its source like the background video
+    background_audio: Optional[str] = None
+    background_audio_start: float = 0
+    background_audio_volume: float = 0
+
+
+def _narration_inputs(spec: RenderSpec) -> List[str]:
+    return [segment.path for segment in spec.narration if segment.path is not None]
+
+
+def compile_filter_graph(spec: RenderSpec, backend: str) -> str:
+    """Compiles the timeline of the spec into one filter_complex for the given backend.
+
+    Input 0 is the uncut background source, cropped to the output aspect ratio here unless
+    it's already fitted to the output size. Inputs 1..n are the overlays in timeline order,
+    followed by the narration files and the background audio. The video is labeled [v] and
+    the audio [a].
+    """
+    W, H = spec.width, spec.height
+    if spec.background_fitted:
+        chains = ["[0:v]setsar=1[bg0]"]
+    else:
+        chains = [f"[0:v]crop=ih*({W}/{H}):ih,scale={W}:{H},setsar=1[bg0]"]
+    for i, overlay in enumerate(spec.overlays, start=1):
+        image = f"[{i}:v]scale={spec.overlay_width}:-1"
+        if overlay.opacity < 1:
+            image += f",format=rgba,colorchannelmixer=aa={overlay.opacity}"
+        chains.append(f"{image}[img{i}]")
+        chains.append(
+            f"[bg{i - 1}][img{i}]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2"
+            f":enable='between(t,{overlay.start:.3f},{overlay.end:.3f})'[bg{i}]"
+        )
+    chains.append(f"[bg{len(spec.overlays)}]{','.join(ENCODERS[backend]['upload'])}[v]")
+
+    # The narration is decoded straight from the TTS clips and concatenated here, with the
+    # silence between split parts generated in the graph, so it's only encoded once
+    audio_format = "aformat=sample_fmts=fltp:sample_rates=44100:channel_layouts=stereo"
+    next_input = len(spec.overlays) + 1
+    segments = []
+    for j, segment in enumerate(spec.narration):
+        if segment.path is None:
+            chains.append(
+                f"anullsrc=r=44100:cl=stereo,atrim=duration={segment.duration:.3f},{audio_format}[n{j}]"
+            )
+        else:
+            chains.append(f"[{next_input}:a]{audio_format}[n{j}]")
+            next_input += 1
+        segments.append(f"[n{j}]")
+    narration_label = "[a]" if spec.background_audio is None else "[narration]"
+    chains.append(f"{''.join(segments)}concat=n={len(segments)}:v=0:a=1{narration_label}")
+    if spec.background_audio is not None:
+        chains.append(f"[{next_input}:a]{audio_format},volume={spec.background_audio_volume}[bed]")
+        chains.append("[narration][bed]amix=inputs=2:duration=first:dropout_transition=0:normalize=0[a]")
+    return ";".join(chains)
+
+
+def build_command(spec: RenderSpec, backend: str, path: str, progress_file: str) -> List[str]:
+    """Returns the ffmpeg command that renders the spec to path with the given backend."""
+    encoder = ENCODERS[backend]
+    cmd = ["ffmpeg", "-y", "-progress", progress_file, "-threads", str(spec.threads)]
+    cmd += encoder["global_args"]
+    # Seeking on the input side cuts the background straight out of the cached source
+    cmd += ["-ss", f"{spec.background_start:.3f}", "-t", f"{spec.background_duration:.3f}"]
+    cmd += ["-an", "-i", spec.background]
+    for overlay in spec.overlays:
+        cmd += ["-i", overlay.path]
+    for narration_path in _narration_inputs(spec):
+        cmd += ["-i", narration_path]
+    if spec.background_audio is not None:
+        cmd += ["-ss", f"{spec.background_audio_start:.3f}", "-t", f"{spec.background_duration:.3f}"]
+        cmd += ["-vn", "-i", spec.background_audio]
+    cmd += ["-filter_complex", compile_filter_graph(spec, backend)]
+    cmd += ["-map", "[v]", "-map", "[a]"]
+    cmd += encoder["codec_args"]
+    # The narration can be shorter than the background cut if comments were left out
+    cmd += ["-shortest"]
+    cmd += ["-c:a", "aac", "-b:a", "192k", "-movflags", "+faststart", path]
+    return cmd
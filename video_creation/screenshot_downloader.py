@@ -1,23 +1,32 @@
-import json
+import asyncio
+import functools
+import os
 import re
 from pathlib import Path
-from typing import Dict, Final
+from typing import Final, List, Tuple
 
 import translators
-from playwright.sync_api import ViewportSize, sync_playwright
-from rich.progress import track
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import ViewportSize
 
 from utils import settings
 from utils.console import print_step, print_substep
-from utils.imagenarator import imagemaker
-from utils.playwright import clear_cookie_by_name
+from utils.render_pool import render_all
+from utils.browser_pool import LoginError, get_browser_pool
+from utils.comment_card import render_comment_card
+from utils.progress import track
 from utils.videos import save_data
+from utils.workdir import temp_path
 
 __all__ = ["get_screenshots_of_reddit_posts"]
 
+COMMENT_TIMEOUT = 30  # seconds before a comment that doesn't load is left out
+THREAD_EXPAND_ROUNDS = 10  # clicks or scrolls to load more of the thread in screenshot_mode "thread"
+MORE_COMMENTS_BUTTON = re.compile(r"(view|load) more comments|more repl", re.IGNORECASE)
+
 
 def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
-    """Downloads screenshots of reddit posts as seen on the web. Downloads to assets/temp/png
+    """Downloads screenshots of reddit posts as seen on the web. Downloads to assets/temp/<reddit_id>/png
 
     Args:
         reddit_object (Dict): Reddit object received from reddit/subreddit.py
@@ -32,235 +41,310 @@ def get_screenshots_of_reddit_posts(reddit_object: dict, screenshot_num: int):
     print_step("Downloading screenshots of reddit posts...")
     reddit_id = re.sub(r"[^\w\s-]", "", reddit_object["thread_id"])
     # ! Make sure the reddit screenshots folder exists
-    Path(f"assets/temp/{reddit_id}/png").mkdir(parents=True, exist_ok=True)
-
-    # set the theme and disable non-essential cookies
-    if settings.config["settings"]["theme"] == "dark":
-        cookie_file = open("./video_creation/data/cookie-dark-mode.json", encoding="utf-8")
-        bgcolor = (33, 33, 36, 255)
-        txtcolor = (240, 240, 240)
-        transparent = False
-    elif settings.config["settings"]["theme"] == "transparent":
-        if storymode:
-            # Transparent theme
-            bgcolor = (0, 0, 0, 0)
-            txtcolor = (255, 255, 255)
-            transparent = True
-            cookie_file = open("./video_creation/data/cookie-dark-mode.json", encoding="utf-8")
-        else:
-            # Switch to dark theme
-            cookie_file = open("./video_creation/data/cookie-dark-mode.json", encoding="utf-8")
-            bgcolor = (33, 33, 36, 255)
-            txtcolor = (240, 240, 240)
-            transparent = False
+    Path(f"{temp_path(reddit_id)}/png").mkdir(parents=True, exist_ok=True)
+
+    # set the theme and disable non-essential cookies, the transparent theme captures dark mode
+    if settings.config["settings"]["theme"] in ("dark", "transparent"):
+        cookie_file = "./video_creation/data/cookie-dark-mode.json"
     else:
-        cookie_file = open("./video_creation/data/cookie-light-mode.json", encoding="utf-8")
-        bgcolor = (255, 255, 255, 255)
-        txtcolor = (0, 0, 0)
-        transparent = False
+        cookie_file = "./video_creation/data/cookie-light-mode.json"
 
     if storymode and settings.config["settings"]["storymodemethod"] == 1:
-        # for idx,item in enumerate(reddit_object["thread_post"]):
-        print_substep("Generating images...")
-        return imagemaker(
-            theme=bgcolor,
-            reddit_obj=reddit_object,
-            txtclr=txtcolor,
-            transparent=transparent,
+        # The video only shows the title while the sentences are read out, and the title
+        # image is made by the final render, so there's nothing to capture or draw here
+        print_substep("Story mode 1 shows the title only, no images needed")
+        return
+
+    if not storymode and settings.config["settings"].get("comment_renderer", "browser") == "pillow":
+        print_substep("Rendering comment cards...")
+        return render_comment_cards(reddit_object, screenshot_num, f"{temp_path(reddit_id)}/png")
+
+    # Device scale factor (or dsf for short) allows us to increase the resolution of the screenshots
+    # When the dsf is 1, the width of the screenshot is 600 pixels
+    # so we need a dsf such that the width of the screenshot is greater than the final resolution of the video
+    dsf = (W // 600) + 1
+
+    pool = get_browser_pool()
+    try:
+        pool.run(
+            _capture(
+                pool,
+                reddit_object,
+                screenshot_num,
+                png_dir=f"{temp_path(reddit_id)}/png",
+                page_options=dict(
+                    locale=lang or "en-us",
+                    width=W,
+                    height=H,
+                    device_scale_factor=dsf,
+                    cookie_file=cookie_file,
+                ),
+            )
+        )
+    except LoginError:
+        print_substep(
+            "Your reddit credentials are incorrect! Please modify them accordingly in the config.toml file.",
+            style="red",
         )
+        exit()
+    except _TitleScreenshotError as e:
+        print_substep("Something went wrong!", style="red")
+        resp = input(
+            "Something went wrong with making the screenshots! Do you want to skip the post? (y/n) "
+        )
+
+        if resp.casefold().startswith("y"):
+            save_data("", "", "skipped", reddit_id, "")
+            print_substep(
+                "The post is successfully skipped! You can now restart the program and this post will skipped.",
+                "green",
+            )
+
+        resp = input("Do you want the error traceback for debugging purposes? (y/n)")
+        if not resp.casefold().startswith("y"):
+            exit()
+
+        raise e.__cause__
+
+    print_substep("Screenshots downloaded Successfully.", style="bold green")
+
+
+def render_comment_cards(reddit_object: dict, screenshot_num: int, png_dir: str) -> None:
+    """Draws the comments as cards with Pillow instead of taking screenshots of them.
 
-    screenshot_num: int
-    with sync_playwright() as p:
-        print_substep("Launching Headless Browser...")
-
-        browser = p.chromium.launch(
-            headless=True
-        )  # headless=False will show the browser for debugging purposes
-        # Device scale factor (or dsf for short) allows us to increase the resolution of the screenshots
-        # When the dsf is 1, the width of the screenshot is 600 pixels
-        # so we need a dsf such that the width of the screenshot is greater than the final resolution of the video
-        dsf = (W // 600) + 1
-
-        context = browser.new_context(
-            locale=lang or "en-us",
-            color_scheme="dark",
-            viewport=ViewportSize(width=W, height=H),
-            device_scale_factor=dsf,
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+    The title card is made by make_final_video, so no browser is needed at all.
+    """
+    lang: Final[str] = settings.config["reddit"]["thread"]["post_lang"]
+    theme = settings.config["settings"]["theme"]
+    compress_level = int(settings.config["settings"].get("png_compress_level", 1))
+    jobs = []
+    for idx, comment in enumerate(reddit_object["comments"][:screenshot_num]):
+        body = comment["comment_body"]
+        if lang:
+            body = translators.translate_text(body, translator="google", to_language=lang)
+        jobs.append(
+            (
+                f"{png_dir}/comment_{idx}.png",
+                comment["comment_author"],
+                comment["comment_score"],
+                body,
+                theme,
+                compress_level,
+            )
         )
-        cookies = json.load(cookie_file)
-        cookie_file.close()
-
-        context.add_cookies(cookies)  # load preference cookies
-
-        # Login to Reddit
-        print_substep("Logging in to Reddit...")
-        page = context.new_page()
-        page.goto("https://www.reddit.com/login", timeout=0)
-        page.set_viewport_size(ViewportSize(width=1920, height=1080))
-        page.wait_for_load_state()
-
-        page.locator(f'input[name="username"]').fill(settings.config["reddit"]["creds"]["username"])
-        page.locator(f'input[name="password"]').fill(settings.config["reddit"]["creds"]["password"])
-        page.get_by_role("button", name="Log In").click()
-        page.wait_for_timeout(5000)
-
-        login_error_div = page.locator(".AnimatedForm__errorMessage").first
-        if login_error_div.is_visible():
-            login_error_message = login_error_div.inner_text()
-            if login_error_message.strip() == "":
-                # The div element is empty, no error
-                pass
-            else:
-                # The div contains an error message
-                print_substep(
-                    "Your reddit credentials are incorrect! Please modify them accordingly in the config.toml file.",
-                    style="red",
-                )
-                exit()
-        else:
-            pass
+    render_all(render_comment_card, jobs)
+    print_substep("Comment cards rendered Successfully.", style="bold green")
+
+
+class _TitleScreenshotError(Exception):
+    """The post itself couldn't be captured, raised from the original error."""
+
+
+async def _capture(
+    pool, reddit_object: dict, screenshot_num: int, png_dir: str, page_options: dict
+):
+    """Captures the post and its comments with a page of the browser pool.
+
+    This runs on the event loop of the pool, which doesn't see the paths of the current job,
+    so everything is written to png_dir.
+    """
+    W = page_options["width"]
+    H = page_options["height"]
+    lang: Final[str] = settings.config["reddit"]["thread"]["post_lang"]
+    storymode: Final[bool] = settings.config["settings"]["storymode"]
 
-        page.wait_for_load_state()
-        # Handle the redesign
-        # Check if the redesign optout cookie is set
-        if page.locator("#redesign-beta-optin-btn").is_visible():
-            # Clear the redesign optout cookie
-            clear_cookie_by_name(context, "redesign_optout")
-            # Reload the page for the redesign to take effect
-            page.reload()
+    async with pool.page(**page_options) as page:
         # Get the thread screenshot
-        page.goto(reddit_object["thread_url"], timeout=0)
-        page.set_viewport_size(ViewportSize(width=W, height=H))
-        page.wait_for_load_state()
-        page.wait_for_timeout(5000)
+        await page.goto(reddit_object["thread_url"], timeout=0)
+        await page.set_viewport_size(ViewportSize(width=W, height=H))
+        await page.wait_for_load_state()
+        await page.wait_for_timeout(5000)
 
-        if page.locator(
+        if await page.locator(
             "#t3_12hmbug > div > div._3xX726aBn29LDbsDtzr_6E._1Ap4F5maDtT1E1YuCiaO0r.D3IL3FD0RFy_mkKLPwL4 > div > div > button"
         ).is_visible():
             # This means the post is NSFW and requires to click the proceed button.
 
             print_substep("Post is NSFW. You are spicy...")
-            page.locator(
+            await page.locator(
                 "#t3_12hmbug > div > div._3xX726aBn29LDbsDtzr_6E._1Ap4F5maDtT1E1YuCiaO0r.D3IL3FD0RFy_mkKLPwL4 > div > div > button"
             ).click()
-            page.wait_for_load_state()  # Wait for page to fully load
+            await page.wait_for_load_state()  # Wait for page to fully load
 
             # translate code
-        if page.locator(
+        if await page.locator(
             "#SHORTCUT_FOCUSABLE_DIV > div:nth-child(7) > div > div > div > header > div > div._1m0iFpls1wkPZJVo38-LSh > button > i"
         ).is_visible():
-            page.locator(
+            await page.locator(
                 "#SHORTCUT_FOCUSABLE_DIV > div:nth-child(7) > div > div > div > header > div > div._1m0iFpls1wkPZJVo38-LSh > button > i"
             ).click()  # Interest popup is showing, this code will close it
 
         if lang:
             print_substep("Translating post...")
-            texts_in_tl = translators.translate_text(
-                reddit_object["thread_title"],
-                to_language=lang,
-                translator="google",
-            )
+            texts_in_tl = await _translate(reddit_object["thread_title"], lang)
 
-            page.evaluate(
+            await page.evaluate(
                 "tl_content => document.querySelector('[data-adclicklocation=\"title\"] > div > div > h1').textContent = tl_content",
                 texts_in_tl,
             )
         else:
             print_substep("Skipping translation...")
 
-        postcontentpath = f"assets/temp/{reddit_id}/png/title.png"
+        postcontentpath = f"{png_dir}/title.png"
         try:
             if settings.config["settings"]["zoom"] != 1:
                 # store zoom settings
                 zoom = settings.config["settings"]["zoom"]
                 # zoom the body of the page
-                page.evaluate("document.body.style.zoom=" + str(zoom))
+                await page.evaluate("document.body.style.zoom=" + str(zoom))
                 # as zooming the body doesn't change the properties of the divs, we need to adjust for the zoom
-                location = page.locator('[data-test-id="post-content"]').bounding_box()
+                location = await page.locator('[data-test-id="post-content"]').bounding_box()
                 for i in location:
                     location[i] = float("{:.2f}".format(location[i] * zoom))
-                page.screenshot(clip=location, path=postcontentpath)
+                await page.screenshot(clip=location, path=postcontentpath)
             else:
-                page.locator('[data-test-id="post-content"]').screenshot(path=postcontentpath)
+                await page.locator('[data-test-id="post-content"]').screenshot(path=postcontentpath)
         except Exception as e:
-            print_substep("Something went wrong!", style="red")
-            resp = input(
-                "Something went wrong with making the screenshots! Do you want to skip the post? (y/n) "
-            )
+            raise _TitleScreenshotError() from e
 
-            if resp.casefold().startswith("y"):
-                save_data("", "", "skipped", reddit_id, "")
-                print_substep(
-                    "The post is successfully skipped! You can now restart the program and this post will skipped.",
-                    "green",
-                )
+        if storymode:
+            await page.locator('[data-click-id="text"]').first.screenshot(
+                path=f"{png_dir}/story_content.png"
+            )
+            return
+
+        targets = [
+            (comment, f"{png_dir}/comment_{idx}.png")
+            for idx, comment in enumerate(reddit_object["comments"][:screenshot_num])
+        ]
+        if settings.config["settings"].get("screenshot_mode", "thread") == "thread":
+            targets = await _capture_from_thread(page, targets)
+            if targets:
+                print_substep(f"{len(targets)} comments aren't on the thread page, opening them one by one")
+
+    # Every remaining comment gets its own page, up to screenshot_concurrency of them at once
+    pages = asyncio.Semaphore(int(settings.config["settings"].get("screenshot_concurrency", 4)))
+    captures = [
+        _capture_comment(pool, pages, page_options, comment, path) for comment, path in targets
+    ]
+    captured = []
+    for capture in track(
+        asyncio.as_completed(captures), "Downloading screenshots...", total=len(captures)
+    ):
+        captured.append(await capture)
+    if not all(captured):
+        print_substep(
+            f"Skipped {captured.count(False)} comments that couldn't be captured", style="bold yellow"
+        )
 
-            resp = input("Do you want the error traceback for debugging purposes? (y/n)")
-            if not resp.casefold().startswith("y"):
-                exit()
 
-            raise e
+async def _capture_comment(
+    pool, pages: asyncio.Semaphore, page_options: dict, comment: dict, path: str
+) -> bool:
+    """Screenshots a single comment to path.
 
-        if storymode:
-            page.locator('[data-click-id="text"]').first.screenshot(
-                path=f"assets/temp/{reddit_id}/png/story_content.png"
+    Returns:
+        bool: False if the comment timed out or couldn't be found, it's left out of the video then
+    """
+    async with pages:
+        try:
+            await asyncio.wait_for(
+                _screenshot_comment(pool, page_options, comment, path), COMMENT_TIMEOUT
             )
+            return True
+        except (asyncio.TimeoutError, PlaywrightError) as e:
+            print_substep(f"Skipping comment {comment['comment_id']}: {type(e).__name__}")
+            if os.path.exists(path):
+                os.remove(path)
+            return False
+
+
+async def _screenshot_comment(pool, page_options: dict, comment: dict, path: str) -> None:
+    async with pool.page(**page_options) as page:
+        await page.goto(f"https://new.reddit.com/{comment['comment_url']}")
+
+        if await page.locator('[data-testid="content-gate"]').is_visible():
+            await page.locator('[data-testid="content-gate"] button').click()
+
+        await _screenshot_comment_element(page, comment, path)
+
+
+async def _screenshot_comment_element(page, comment: dict, path: str) -> None:
+    """Screenshots the #t1_<id> element of the comment on the current page of page."""
+    lang: Final[str] = settings.config["reddit"]["thread"]["post_lang"]
+    # translate code
+
+    if lang:
+        comment_tl = await _translate(comment["comment_body"], lang)
+        await page.evaluate(
+            '([tl_content, tl_id]) => document.querySelector(`#t1_${tl_id} > div:nth-child(2) > div > div[data-testid="comment"] > div`).textContent = tl_content',
+            [comment_tl, comment["comment_id"]],
+        )
+    if settings.config["settings"]["zoom"] != 1:
+        # store zoom settings
+        zoom = settings.config["settings"]["zoom"]
+        # zoom the body of the page
+        await page.evaluate("document.body.style.zoom=" + str(zoom))
+        # scroll comment into view
+        await page.locator(f"#t1_{comment['comment_id']}").scroll_into_view_if_needed()
+        # as zooming the body doesn't change the properties of the divs, we need to adjust for the zoom
+        location = await page.locator(f"#t1_{comment['comment_id']}").bounding_box()
+        for i in location:
+            location[i] = float("{:.2f}".format(location[i] * zoom))
+        await page.screenshot(clip=location, path=path)
+    else:
+        await page.locator(f"#t1_{comment['comment_id']}").screenshot(path=path)
+
+
+async def _missing_comments(page, targets: List[Tuple[dict, str]]) -> List[Tuple[dict, str]]:
+    return [
+        (comment, path)
+        for comment, path in targets
+        if await page.locator(f"#t1_{comment['comment_id']}").count() == 0
+    ]
+
+
+async def _expand_thread(page, targets: List[Tuple[dict, str]]) -> None:
+    """Loads more of the thread until every target comment is in the DOM or nothing new shows up."""
+    for _ in range(THREAD_EXPAND_ROUNDS):
+        if not await _missing_comments(page, targets):
+            return
+        more = page.get_by_role("button", name=MORE_COMMENTS_BUTTON)
+        if await more.count():
+            await more.first.click()
         else:
-            for idx, comment in enumerate(
-                track(
-                    reddit_object["comments"][:screenshot_num],
-                    "Downloading screenshots...",
-                )
-            ):
-                # Stop if we have reached the screenshot_num
-                if idx >= screenshot_num:
-                    break
-
-                if page.locator('[data-testid="content-gate"]').is_visible():
-                    page.locator('[data-testid="content-gate"] button').click()
-
-                page.goto(f"https://new.reddit.com/{comment['comment_url']}")
-
-                # translate code
-
-                if settings.config["reddit"]["thread"]["post_lang"]:
-                    comment_tl = translators.translate_text(
-                        comment["comment_body"],
-                        translator="google",
-                        to_language=settings.config["reddit"]["thread"]["post_lang"],
-                    )
-                    page.evaluate(
-                        '([tl_content, tl_id]) => document.querySelector(`#t1_${tl_id} > div:nth-child(2) > div > div[data-testid="comment"] > div`).textContent = tl_content',
-                        [comment_tl, comment["comment_id"]],
-                    )
-                try:
-                    if settings.config["settings"]["zoom"] != 1:
-                        # store zoom settings
-                        zoom = settings.config["settings"]["zoom"]
-                        # zoom the body of the page
-                        page.evaluate("document.body.style.zoom=" + str(zoom))
-                        # scroll comment into view
-                        page.locator(f"#t1_{comment['comment_id']}").scroll_into_view_if_needed()
-                        # as zooming the body doesn't change the properties of the divs, we need to adjust for the zoom
-                        location = page.locator(f"#t1_{comment['comment_id']}").bounding_box()
-                        for i in location:
-                            location[i] = float("{:.2f}".format(location[i] * zoom))
-                        page.screenshot(
-                            clip=location,
-                            path=f"assets/temp/{reddit_id}/png/comment_{idx}.png",
-                        )
-                    else:
-                        page.locator(f"#t1_{comment['comment_id']}").screenshot(
-                            path=f"assets/temp/{reddit_id}/png/comment_{idx}.png"
-                        )
-                except TimeoutError:
-                    del reddit_object["comments"]
-                    screenshot_num += 1
-                    print("TimeoutError: Skipping screenshot...")
-                    continue
-
-        # close browser instance when we are done using it
-        browser.close()
+            # The rest of the top level comments are loaded while scrolling down
+            await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+        try:
+            await page.wait_for_load_state("networkidle", timeout=5000)
+        except PlaywrightError:
+            pass
 
-    print_substep("Screenshots downloaded Successfully.", style="bold green")
+
+async def _capture_from_thread(page, targets: List[Tuple[dict, str]]) -> List[Tuple[dict, str]]:
+    """Screenshots the target comments from the thread page that is already open.
+
+    Returns:
+        The comments that aren't on the page or couldn't be captured from it
+    """
+    await _expand_thread(page, targets)
+    missing = await _missing_comments(page, targets)
+    for comment, path in track(targets, "Downloading screenshots..."):
+        if (comment, path) in missing:
+            continue
+        try:
+            await page.locator(f"#t1_{comment['comment_id']}").scroll_into_view_if_needed()
+            await asyncio.wait_for(_screenshot_comment_element(page, comment, path), COMMENT_TIMEOUT)
+        except (asyncio.TimeoutError, PlaywrightError):
+            missing.append((comment, path))
+    return missing
+
+
+async def _translate(text: str, lang: str) -> str:
+    """Translates text without blocking the event loop the other pages are captured on."""
+    return await asyncio.get_running_loop().run_in_executor(
+        None,
+        functools.partial(
+            translators.translate_text, text, translator="google", to_language=lang
+        ),
+    )
@@ -1,3 +1,4 @@
+import threading
 from typing import Tuple
 
 from rich.console import Console
@@ -23,6 +24,28 @@ TTSProviders = {
     "ElevenLabs": elevenlabs,
 }
 
+# Provider instances are kept around so models and clients are only loaded once per process
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_tts_provider(name: str):
+    """Returns a shared, already initialized instance of the given TTS provider.
+
+    Args:
+        name (str): Case insensitive provider name, see TTSProviders
+
+    Returns:
+        The provider instance, or None if there is no provider with that name
+    """
+    provider = get_case_insensitive_key_value(TTSProviders, name)
+    if provider is None:
+        return None
+    with _providers_lock:
+        if provider not in _providers:
+            _providers[provider] = provider()
+        return _providers[provider]
+
 
 def save_text_to_mp3(reddit_obj) -> Tuple[int, int]:
     """Saves text to MP3 files.
@@ -36,7 +59,7 @@ def save_text_to_mp3(reddit_obj) -> Tuple[int, int]:
 
     voice = settings.config["settings"]["tts"]["voice_choice"]
     if str(voice).casefold() in map(lambda _: _.casefold(), TTSProviders):
-        text_to_mp3 = TTSEngine(get_case_insensitive_key_value(TTSProviders, voice), reddit_obj)
+        text_to_mp3 = TTSEngine(get_tts_provider(voice), reddit_obj)
     else:
         while True:
             print_step("Please choose one of the following TTS providers: ")